@@ -2,4 +2,18 @@ from .story import STORY
 from .logic import *
 from .simulation import Simulation, RepeatedSimulations, load_or_generate_objective_scores
 from .simulation import DATA_DIR
-from .current_method import OneVotePerFinalist
\ No newline at end of file
+from .condorcet_counting import Condorcet, CondorcetCounting
+from .current_method import OneVotePerFinalist
+from .single_transferable_vote import SingleTransferableVote
+from .fused_tally import FusedTally
+from .schulze import Schulze
+from .ranked_pairs import RankedPairs
+from .ballots import RankedBallots
+from .contest_batch import ContestBatch
+from .sweep import Sweep
+from .sweep_dataset import SweepDataset
+from .result_store import ResultStore
+from .pairwise_counts import PairwiseCounts
+from .ballot_archive import BallotArchive
+from .ballot_reader import BallotFileReader
+from .song_catalog import SongCatalog
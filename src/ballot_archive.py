@@ -0,0 +1,99 @@
+'''
+A contest's ballots on disk, cast once and tallied as many times as needed:
+
+    directory/
+        manifest.json       The settings the ballots were cast with, and the
+                            type and shape of each array
+        songs.parquet       The song catalog
+        song_ids.npy        The RankedBallots arrays, see RankedBallots
+        offsets.npy
+        scores.npy
+        listen_counts.npy
+
+The ballots are the honest ones, before any mafia got to them, so the same
+electorate can be replayed with or without corruption. Opening an archive
+memory-maps the arrays, so nothing is read until a tally reads it.
+'''
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .ballots import RankedBallots
+from .song_catalog import SongCatalog
+
+
+# What the ballots depend on. Everything else is up to whoever tallies them.
+CAST_SETTINGS = ["num_voters", "st_dev", "listen_limit", "ballot_limit",
+                 "alphabetical", "seed", "contest"]
+
+
+class BallotArchive:
+    def __init__(self, directory):
+        """Opens the archive in directory"""
+        self.directory = Path(directory)
+        if not (self.directory / "manifest.json").exists():
+            raise FileNotFoundError(f"There's no ballot archive in {self.directory}")
+        with open(self.directory / "manifest.json") as json_file:
+            self.manifest = json.load(json_file)
+
+
+    @classmethod
+    def write(cls, directory, ballots, listen_counts, song_df, settings):
+        """
+        Saves ballots (RankedBallots), the listen counts and the song catalog,
+        a song_df or SongCatalog, in directory, along with the settings they were cast with. The
+        manifest is written last, so a half written archive can't be opened.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            "song_ids":         ballots.song_ids,
+            "offsets":          ballots.offsets,
+            "listen_counts":    np.asarray(listen_counts, dtype=np.int64),
+        }
+        if ballots.scores is not None:
+            arrays["scores"] = ballots.scores
+        for name, array in arrays.items():
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(array))
+        SongCatalog.of(song_df).write(directory / "songs.parquet")
+
+        manifest = {
+            "settings":     {name: settings[name] for name in CAST_SETTINGS},
+            "num_songs":    ballots.num_songs,
+            "arrays":       {name: {"dtype": array.dtype.str, "shape": list(array.shape)}
+                             for name, array in arrays.items()},
+        }
+        with open(directory / ".manifest.json.tmp", "w") as json_file:
+            json.dump(manifest, json_file, indent=4, default=int)
+        os.replace(directory / ".manifest.json.tmp", directory / "manifest.json")
+        return cls(directory)
+
+
+    @property
+    def settings(self):
+        return self.manifest["settings"]
+
+
+    def array(self, name):
+        """One of the arrays, memory-mapped read only"""
+        return np.load(self.directory / f"{name}.npy", mmap_mode="r")
+
+
+    def song_df(self):
+        return SongCatalog.read(self.directory / "songs.parquet").song_df
+
+
+    def ballots(self, song_index=None):
+        """
+        The RankedBallots, straight on top of the memory-mapped arrays. They
+        can't be written to, corrupt a copy of them.
+        """
+        scores = self.array("scores") if "scores" in self.manifest["arrays"] else None
+        return RankedBallots(self.array("song_ids"), self.array("offsets"),
+                             self.manifest["num_songs"], song_index, scores)
+
+
+    def listen_counts(self):
+        return np.asarray(self.array("listen_counts"))
@@ -0,0 +1,213 @@
+'''
+Ballots exported from a real vote, one row per voter per song they ranked:
+
+    voter,song,rank,score
+    1001,"Alone" by The Harriets,1,9.5
+    1001,"Defenestration" by Kid Lincoln,2,7.0
+    1002,...
+
+Either rank (1 is best) or score (higher is better) is enough, and both can
+be there, then rank orders the ballot and scores are kept. The rows have to
+be sorted by voter, so only the last voter needs remembering to check that
+nobody's rows come back later, but songs can be in any order.
+'''
+import queue
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from stqdm import stqdm
+
+from .ballots import RankedBallots
+from .condorcet_counting import Condorcet
+from .current_method import OneVotePerFinalist
+from .fused_tally import FusedTally
+
+
+class BallotFileReader:
+    def __init__(self, filepath, song_index, chunk_size=1_000_000, prefetch=2,
+                 voter_column="voter", song_column="song",
+                 rank_column="rank", score_column="score"):
+        """
+        Reads a CSV or Parquet file of ballots chunk_size rows at a time, as
+        RankedBallots of whole voters, so memory is bounded by the chunk size
+        however big the file is. Up to prefetch chunks are read ahead on
+        another thread while the last one is counted.
+
+        song_index (pd.Index):
+            The songs the file's song column refers to, e.g. song_df.index.
+            The ballots refer to songs by their position in it.
+        """
+        self.filepath = Path(filepath)
+        self.song_index = pd.Index(song_index)
+        self.chunk_size = chunk_size
+        self.prefetch = prefetch
+        self.voter_column = voter_column
+        self.song_column = song_column
+        self.rank_column = rank_column
+        self.score_column = score_column
+        self.num_rows = None
+
+
+    def read_chunks(self):
+        """
+        Yields DataFrames of up to chunk_size rows, straight from the file.
+        Sets num_rows when the file says how many there are.
+        """
+        if self.filepath.suffix == ".parquet":
+            parquet_file = pq.ParquetFile(self.filepath)
+            self.num_rows = parquet_file.metadata.num_rows
+            names = parquet_file.schema_arrow.names
+            columns = [column for column in [self.voter_column, self.song_column,
+                                             self.rank_column, self.score_column]
+                       if column in names]
+            for batch in parquet_file.iter_batches(batch_size=self.chunk_size, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(self.filepath, chunksize=self.chunk_size)
+
+
+    def prefetched_chunks(self):
+        """read_chunks on another thread, so reading overlaps counting"""
+        chunks = queue.Queue(maxsize=self.prefetch)
+        finished = object()
+        stopped = threading.Event()
+
+        def put(item):
+            # Gives up if whoever was reading the chunks stopped
+            while not stopped.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read():
+            try:
+                for chunk in self.read_chunks():
+                    if not put(chunk):
+                        return
+            except Exception as error:
+                put(error)
+            put(finished)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is finished:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            stopped.set()
+            reader.join()
+
+
+    def __iter__(self):
+        """
+        Yields (number of rows, RankedBallots) for each chunk. The last
+        voter in a chunk may go on in the next one, so they're held back and
+        put in with the next chunk.
+        """
+        last_voter = None
+        held_back = None
+        for chunk in self.prefetched_chunks():
+            num_rows = chunk.shape[0]
+            if held_back is not None:
+                chunk = pd.concat([held_back, chunk], ignore_index=True)
+            voters, _ = pd.factorize(chunk[self.voter_column])
+            last = voters == voters[-1]
+            held_back = chunk[last]
+            if (~last).any():
+                yield num_rows, self.to_ballots(chunk[~last], last_voter)
+                last_voter = chunk[~last][self.voter_column].iloc[-1]
+            else:
+                yield num_rows, None
+        if held_back is not None and not held_back.empty:
+            yield 0, self.to_ballots(held_back, last_voter)
+
+
+    def to_ballots(self, rows, last_voter=None):
+        """
+        Checks a chunk of whole voters' rows and puts their ballots in
+        order. last_voter is the last voter of the chunks before. Raises
+        ValueError for unknown songs, a song on a ballot twice, two songs
+        with the same rank on a ballot, a ballot with neither ranks nor
+        scores, or voters out of order.
+        """
+        for column in [self.voter_column, self.song_column]:
+            if column not in rows.columns:
+                raise ValueError(f"{self.filepath} has no {column} column.")
+        has_ranks = self.rank_column in rows.columns
+        has_scores = self.score_column in rows.columns
+        if not (has_ranks or has_scores):
+            raise ValueError(f"{self.filepath} needs a {self.rank_column} or {self.score_column} column.")
+
+        voter_column = rows[self.voter_column].to_numpy()
+        if (voter_column[1:] < voter_column[:-1]).any() or \
+                (last_voter is not None and voter_column[0] <= last_voter):
+            raise ValueError(f"{self.filepath} isn't sorted by {self.voter_column}.")
+        voters, voter_ids = pd.factorize(voter_column)
+
+        songs = self.song_index.get_indexer(rows[self.song_column])
+        if (songs < 0).any():
+            unknown = rows[self.song_column][songs < 0].unique()[:5]
+            raise ValueError(f"{self.filepath} has songs that aren't in song_index: {list(unknown)}")
+        if pd.Series(voters * len(self.song_index) + songs).duplicated().any():
+            raise ValueError(f"{self.filepath} has a song on the same ballot twice.")
+        if has_ranks:
+            ranks = pd.DataFrame({"voter": voters, "rank": rows[self.rank_column].to_numpy()})
+            if ranks.duplicated().any():
+                raise ValueError(f"{self.filepath} has two songs with the same {self.rank_column} on a ballot.")
+
+        scores = rows[self.score_column].to_numpy(dtype=float) if has_scores else None
+        if has_ranks:
+            key = rows[self.rank_column].to_numpy(dtype=float)
+        else:
+            key = -scores
+        if np.isnan(key).any():
+            raise ValueError(f"{self.filepath} has rows without a {self.rank_column} or {self.score_column}.")
+
+        order = np.lexsort((key, voters))
+        lengths = np.bincount(voters, minlength=len(voter_ids))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        return RankedBallots(songs[order], offsets, len(self.song_index), self.song_index,
+                             None if scores is None else scores[order])
+
+
+    def tally(self, num_winners=10, on_chunk=None):
+        """
+        Counts every ballot in the file into a FusedTally, a chunk at a time,
+        with a progress bar. on_chunk(tally) is called after each chunk.
+        """
+        tally = FusedTally(len(self.song_index), num_winners, song_index=self.song_index)
+        progress = stqdm(desc="Reading Ballots", total=self.num_rows)
+        for num_rows, ballots in self:
+            if progress.total is None and self.num_rows is not None:
+                progress.total = self.num_rows
+            if ballots is not None:
+                block_size, count = Condorcet.plan_blocks(ballots)
+                for start in range(0, ballots.num_voters, block_size):
+                    tally.add_ballots(ballots[start:start+block_size], count)
+            progress.update(num_rows)
+            if on_chunk is not None:
+                on_chunk(tally)
+        progress.close()
+        return tally
+
+
+def tally_ballot_file(filepath, song_index, num_winners=10, **kwargs):
+    """
+    The Condorcet and OneVotePerFinalist results of a file of real ballots,
+    from a single pass over it. kwargs go to BallotFileReader.
+    """
+    tally = BallotFileReader(filepath, song_index, **kwargs).tally(num_winners)
+    condorcet = Condorcet(None, num_winners, pairwise_sums=tally.pairwise_sums.astype(float))
+    current_method = OneVotePerFinalist(None, num_winners, tally.results("current"))
+    return condorcet, current_method
@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+
+from . import kernels
+
+
+def song_id_dtype(num_songs):
+    """The smallest unsigned integer type that can hold every song position"""
+    return np.min_scalar_type(max(num_songs - 1, 0))
+
+
+def offset_dtype(num_entries):
+    return np.int32 if num_entries < 2**31 else np.int64
+
+
+class RankedBallots:
+    def __init__(self, song_ids, offsets, num_songs, song_index=None, scores=None):
+        """
+        A compact store of ranked ballots. Each voter's ballot is just the
+        positions of the songs they ranked, best first. The ballots are laid
+        end to end in song_ids, so voter ii's ballot is
+
+            song_ids[offsets[ii]:offsets[ii+1]]
+
+        which is the same layout as the rows of a CSR sparse matrix. Songs a
+        voter did not rank are simply absent, so the store is as big as the
+        ballot_limit (or listen_limit), not the number of songs.
+
+        song_ids (array):
+            Song positions (0 to num_songs-1), best first within each ballot.
+        offsets (array):
+            num_voters + 1 boundaries into song_ids.
+        num_songs (int):
+            How many songs were in the contest, ranked or not.
+        song_index (pd.Index):
+            The song_df index labels for each song position. Defaults to
+            0 through num_songs-1.
+        scores (array):
+            Optional. The score each voter gave each song they ranked, lined
+            up with song_ids.
+        """
+        self.num_songs = int(num_songs)
+        self.song_ids = np.asarray(song_ids).astype(song_id_dtype(self.num_songs), copy=False)
+        self.offsets = np.asarray(offsets).astype(offset_dtype(self.song_ids.shape[0]), copy=False)
+        if song_index is None:
+            song_index = pd.RangeIndex(self.num_songs)
+        self.song_index = song_index
+        self.scores = scores
+
+
+    @property
+    def num_voters(self):
+        return self.offsets.shape[0] - 1
+
+
+    @property
+    def lengths(self):
+        """How many songs each voter ranked"""
+        return np.diff(self.offsets)
+
+
+    @property
+    def voters(self):
+        """The voter of each entry in song_ids"""
+        return np.repeat(np.arange(self.num_voters), self.lengths)
+
+
+    def __len__(self):
+        return self.num_voters
+
+
+    def __getitem__(self, ii):
+        """One voter's ballot, or RankedBallots for a slice of voters"""
+        if isinstance(ii, slice):
+            start, stop, _ = ii.indices(self.num_voters)
+            offsets = self.offsets[start:stop+1]
+            song_ids = self.song_ids[offsets[0]:offsets[-1]]
+            scores = None if self.scores is None else self.scores[offsets[0]:offsets[-1]]
+            return RankedBallots(song_ids, offsets - offsets[0], self.num_songs,
+                                 self.song_index, scores)
+        return self.song_ids[self.offsets[ii]:self.offsets[ii+1]]
+
+
+    def __iter__(self):
+        for ii in range(self.num_voters):
+            yield self[ii]
+
+
+    def copy(self):
+        scores = None if self.scores is None else self.scores.copy()
+        return RankedBallots(self.song_ids.copy(), self.offsets.copy(),
+                             self.num_songs, self.song_index, scores)
+
+
+    @classmethod
+    def from_score_rows(cls, songs, scores, ranked, num_songs, song_index=None):
+        """
+        Builds ballots from a batch of voters' scores, one row per voter.
+
+        songs (array):
+            (num_voters, sample size) song positions each voter listened to.
+        scores (array):
+            The voter's score for each of those songs.
+        ranked (array):
+            Boolean mask of which of those songs made it onto the ballot.
+        """
+        if kernels.enabled():
+            song_ids, scores, lengths = kernels.order_score_rows(
+                np.ascontiguousarray(songs), np.ascontiguousarray(scores, dtype=float), ranked)
+            offsets = np.concatenate([[0], np.cumsum(lengths)])
+            return cls(song_ids, offsets, num_songs, song_index, scores)
+
+        order = np.argsort(np.where(ranked, -scores, np.inf), axis=1, kind="stable")
+        songs = np.take_along_axis(songs, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        lengths = ranked.sum(axis=1)
+        kept = np.arange(songs.shape[1]) < lengths[:, None]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        return cls(songs[kept], offsets, num_songs, song_index, scores[kept])
+
+
+    @classmethod
+    def from_dataframe(cls, ballot_df):
+        """
+        Converts the songs x voters DataFrame of scores, with NaN for songs a
+        voter didn't rank, into ranked ballots. Higher scores rank first.
+        """
+        columns = ["ID", "Mean"]
+        columns_to_drop = [col for col in columns if col in ballot_df.columns]
+        ballot_df = ballot_df.drop(columns=columns_to_drop).sort_index()
+
+        scores = ballot_df.values.T.astype(float)
+        songs = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        ranked = ~np.isnan(scores)
+        return cls.from_score_rows(songs, scores, ranked, scores.shape[1],
+                                   song_index=ballot_df.index)
+
+
+    @classmethod
+    def concatenate(cls, ballot_batches):
+        """Stacks batches of voters, in order, into one set of ballots"""
+        first = ballot_batches[0]
+        song_ids = np.concatenate([batch.song_ids for batch in ballot_batches])
+        lengths = np.concatenate([batch.lengths for batch in ballot_batches])
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        scores = None
+        if all(batch.scores is not None for batch in ballot_batches):
+            scores = np.concatenate([batch.scores for batch in ballot_batches])
+        return cls(song_ids, offsets, first.num_songs, first.song_index, scores)
+
+
+    def to_dataframe(self, points=False):
+        """
+        The songs x voters DataFrame the rest of the simulation used to pass
+        around, with the scores each voter gave and NaN for unranked songs.
+
+        Without scores, or with points, each ranked song gets points instead:
+        a voter's first choice gets as many points as songs they ranked and
+        their last choice gets 1. Points always follow the ballot order, so
+        use them when the order matters more than the scores, e.g. after a
+        mafia has promoted songs past higher scored ones.
+        """
+        values = np.full((self.num_songs, self.num_voters), np.nan)
+        if self.scores is None or points:
+            position = np.arange(self.song_ids.shape[0]) - np.repeat(self.offsets[:-1], self.lengths)
+            values[self.song_ids, self.voters] = np.repeat(self.lengths, self.lengths) - position
+        else:
+            values[self.song_ids, self.voters] = self.scores
+        return pd.DataFrame(values, index=self.song_index)
+
+
+    def rank_positions(self):
+        """
+        A (num_voters, num_songs) array of where each song sits on each 
+        ballot, 0 for first choice. Unranked songs get num_songs, so they sort
+        after everything that was ranked.
+        """
+        dtype = np.min_scalar_type(-self.num_songs)
+        positions = np.full((self.num_voters, self.num_songs), self.num_songs, dtype=dtype)
+        position = np.arange(self.song_ids.shape[0]) - np.repeat(self.offsets[:-1], self.lengths)
+        positions[self.voters, self.song_ids] = position
+        return positions
+
+
+    def top(self, k):
+        """Each voter's top k songs, or all of them if they ranked fewer"""
+        lengths = np.minimum(self.lengths, k)
+        position = np.arange(self.song_ids.shape[0]) - np.repeat(self.offsets[:-1], self.lengths)
+        kept = position < np.repeat(lengths, self.lengths)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        scores = None if self.scores is None else self.scores[kept]
+        return RankedBallots(self.song_ids[kept], offsets, self.num_songs, self.song_index, scores)
+
+
+    def restrict(self, songs):
+        """
+        Ballots that only rank the given song positions, keeping each voter's
+        order. The songs are renumbered 0 to len(songs)-1 in sorted order, the
+        same as slicing rows out of the ballot DataFrame.
+        """
+        songs = np.sort(np.asarray(songs))
+        renumber = np.full(self.num_songs, -1)
+        renumber[songs] = np.arange(songs.shape[0])
+        new_ids = renumber[self.song_ids]
+        kept = new_ids >= 0
+        lengths = np.bincount(self.voters[kept], minlength=self.num_voters)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        scores = None if self.scores is None else self.scores[kept]
+        return RankedBallots(new_ids[kept], offsets, songs.shape[0], self.song_index[songs], scores)
+
+
+    def promote(self, song, voters):
+        """
+        Moves the song to the top of each of the voters' ballots, if it was
+        already on them. Ballots are edited in place. Scores stay with their
+        songs.
+        """
+        for ii in voters:
+            ballot = self[ii]
+            position = np.flatnonzero(ballot == song)
+            if position.size:
+                ballot[1:position[0]+1] = ballot[:position[0]].copy()
+                ballot[0] = song
+                if self.scores is not None:
+                    scores = self.scores[self.offsets[ii]:self.offsets[ii+1]]
+                    scores[:position[0]+1] = np.roll(scores[:position[0]+1], 1)
@@ -5,24 +5,67 @@ guac voting system creators
 '''
 # from unittest import runner
 import sys
-from collections import defaultdict
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
 from stqdm import stqdm
 
+from . import kernels
+from .ballots import RankedBallots
+
+
+@lru_cache(maxsize=16)
+def ranked_above(ballot_length):
+    """
+    Pairwise comparisons for a ballot listed best first: the song in row ii 
+    beat the song in column jj whenever ii comes before jj.
+    """
+    return np.triu(np.ones((ballot_length, ballot_length)), k=1)
+
+
+@lru_cache(maxsize=16)
+def ranked_above_pairs(ballot_length):
+    """(row, col) positions of every pair in ranked_above(ballot_length)"""
+    return np.triu_indices(ballot_length, k=1)
+
 
 class Condorcet:
-    def __init__(self, ballot_df, n_winners=10, break_ties=True):
+    def __init__(self, ballots, n_winners=10, break_ties=True, engine="batched",
+                 boundary_ties="break", pairwise_sums=None):
         """
         To move quickly, for the MVP, this method computes rankings but cannot
         distinguish between ties. More work is needed for that, and we are 
         just banking that the numbers we're using are high enough that ties 
         should be rare.
+
+        ballots can be RankedBallots or the older songs x voters DataFrame of
+        scores, which is converted to RankedBallots.
+
+        engine picks how the pairwise sums are tallied:
+            "batched":  blocks of voters are tallied with whole-array steps
+            "listened": each ballot only adds the block of songs it ranked
+            "dense":    each ballot adds a full songs x songs comparison
+        All three give the same pairwise_sums.
+
+        boundary_ties picks what happens to a tie across the n_winners cutoff,
+        "break" or "include", see look_for_and_break_ties.
+
+        pairwise_sums can be passed in when they were already tallied, e.g.
+        by a FusedTally, and then the ballots aren't read again.
         """
-        self.ballot_df = self.clean_ballot_df(ballot_df)
+        if boundary_ties not in ["break", "include"]:
+            raise ValueError(f"boundary_ties should be 'break' or 'include', not {boundary_ties!r}")
+        if isinstance(ballots, pd.DataFrame):
+            ballots = RankedBallots.from_dataframe(self.clean_ballot_df(ballots))
+        self.ballots = ballots
         self.n_winners = n_winners
-        self.pairwise_sums = self.compute_sum_of_ballot_pairwise_comparisons()
+        self.engine = engine
+        self.boundary_ties = boundary_ties
+        self.tied_at_cutoff = np.array([], dtype=int)
+        if pairwise_sums is None:
+            pairwise_sums = self.compute_sum_of_ballot_pairwise_comparisons()
+        self.pairwise_sums = pairwise_sums
         self.preferences = CondorcetCounting.get_schwartz_relations_matrix(self.pairwise_sums)
         self.top_nominee_ids, self.top_vote_counts = self.top_nominees(self.preferences)
         self.break_ties = break_ties
@@ -43,30 +86,154 @@ class Condorcet:
 
     def compute_sum_of_ballot_pairwise_comparisons(self):
         """
-        TKTK
+        Sums every ballot's pairwise comparisons. Row-Col, how many voters 
+        ranked the nominee at row higher than the nominee at col?
         """
-        n_nominees = self.ballot_df.shape[0]
+        if self.engine == "batched":
+            return self.compute_pairwise_sums_in_blocks()
+
+        n_nominees = self.ballots.num_songs
         pairwise_sums = np.zeros((n_nominees, n_nominees))
-        for col in stqdm(self.ballot_df.columns, desc="Tallying Ranked Ballots"):
-            ballot = self.ballot_df[col]
-            pairwise_sums += self.pairwise_comparison(ballot)
+        for ballot in stqdm(self.ballots, desc="Tallying Ranked Ballots"):
+            if self.engine == "dense":
+                pairwise_sums += self.pairwise_comparison(ballot)
+            else:
+                self.add_listened_comparisons(pairwise_sums, ballot)
         return pairwise_sums
 
 
+    def add_listened_comparisons(self, pairwise_sums, ballot):
+        """
+        Adds one ballot's comparisons to pairwise_sums in place. Only the 
+        songs on the ballot are compared, so this costs (ballot length)^2 
+        instead of (number of songs)^2.
+        """
+        ballot = ballot.astype(np.intp)
+        if ballot.shape[0] == pairwise_sums.shape[0]:
+            # Everything was ranked, so the block is the whole matrix and 
+            # comparing positions avoids scattering into it.
+            positions = np.empty_like(ballot)
+            positions[ballot] = np.arange(ballot.shape[0])
+            pairwise_sums += positions[:, None] < positions
+        else:
+            pairwise_sums[np.ix_(ballot, ballot)] += ranked_above(ballot.shape[0])
+
+
+    def compute_pairwise_sums_in_blocks(self, block_budget=2**24):
+        """
+        Tallies the ballots a block of voters at a time. Short ballots are 
+        tallied by counting every (ranked above, ranked below) pair in the 
+        block at once. Ballots that rank most of the songs are tallied by 
+        comparing the block's rank positions all at once.
+
+        block_budget (int):
+            Roughly how many comparisons to hold in memory per block.
+        """
+        n_nominees = self.ballots.num_songs
+        block_size, count = self.plan_blocks(self.ballots, block_budget)
+        counts = np.zeros((n_nominees, n_nominees), dtype=np.int64)
+        block_starts = range(0, self.ballots.num_voters, block_size)
+        for start in stqdm(block_starts, desc="Tallying Ranked Ballots"):
+            counts += count(self.ballots[start:start+block_size])
+        return counts.astype(float)
+
+
+    @staticmethod
+    def plan_blocks(ballots, block_budget=2**24):
+        """
+        How many voters to tally per block, and which way to count them, so
+        each block holds about block_budget comparisons. With the compiled 
+        kernels every block is counted pair by pair.
+        """
+        n_nominees = ballots.num_songs
+        lengths = ballots.lengths.astype(np.int64)
+        num_pairs = (lengths * (lengths - 1) // 2).sum()
+        if kernels.enabled():
+            pairs_per_ballot = max(1, num_pairs // max(1, ballots.num_voters))
+            return max(1, block_budget // pairs_per_ballot), Condorcet.count_block_compiled
+
+        if num_pairs > ballots.num_voters * n_nominees**2 / 4:
+            return max(1, block_budget // n_nominees**2), Condorcet.compare_block_positions
+
+        pairs_per_ballot = max(1, num_pairs // max(1, ballots.num_voters))
+        return max(1, block_budget // pairs_per_ballot), Condorcet.count_block_pairs
+
+
+    @staticmethod
+    def count_block(block):
+        """Pairwise comparisons of a block of ballots, whichever way is cheaper"""
+        if kernels.enabled():
+            return Condorcet.count_block_compiled(block)
+        lengths = block.lengths.astype(np.int64)
+        num_pairs = (lengths * (lengths - 1) // 2).sum()
+        if num_pairs > block.num_voters * block.num_songs**2 / 4:
+            return Condorcet.compare_block_positions(block)
+        return Condorcet.count_block_pairs(block)
+
+
+    @staticmethod
+    def count_block_compiled(block):
+        """Pairwise comparisons of a block of ballots, one loop over the pairs"""
+        return kernels.count_pairs(block.song_ids, block.offsets, block.num_songs)
+
+
+    @staticmethod
+    def compare_block_positions(block):
+        """
+        Pairwise comparisons of a block of ballots from their rank positions.
+        Unranked songs sit after every ranked song, which wrongly counts a
+        ranked song as beating the unranked ones. That share is exactly
+        ranked^T (1 - ranked), one matrix product for the whole block.
+        """
+        positions = block.rank_positions()
+        counts = (positions[:, :, None] < positions[:, None, :]).sum(axis=0, dtype=np.int32)
+
+        ranked = (positions < block.num_songs).astype(np.float32)
+        counts -= (ranked.T @ (1 - ranked)).astype(np.int32)
+        return counts
+
+
+    @staticmethod
+    def count_block_pairs(block):
+        """
+        Pairwise comparisons of a block of ballots by listing every pair of 
+        songs where the first was ranked above the second, then counting 
+        them. Ballots of the same length are handled together.
+        """
+        n_nominees = block.num_songs
+        song_ids = block.song_ids.astype(np.int64)
+        lengths = block.lengths
+        pairs = []
+        for length in np.unique(lengths):
+            if length < 2:
+                continue
+            rows = block.offsets[:-1][lengths == length][:, None] + np.arange(length)
+            ballots = song_ids[rows]
+            above, below = ranked_above_pairs(length)
+            pairs.append((ballots[:, above] * n_nominees + ballots[:, below]).ravel())
+
+        if not pairs:
+            return np.zeros((n_nominees, n_nominees), dtype=np.int64)
+        counts = np.bincount(np.concatenate(pairs), minlength=n_nominees**2)
+        return counts.reshape(n_nominees, n_nominees)
+
+
     def pairwise_comparison(self, ballot):
         """
-        ballot (pd.Series): 
-            One column of the ballot_df. A single voters's ballot.
+        ballot (np.array): 
+            A single voters's ballot, the song positions they ranked, best 
+            first.
 
         Computes pairwise comparisons. Row-Col, was nominee at row ranked 
-        higher than nominee at col?
+        higher than nominee at col? Songs that weren't ranked aren't compared.
         """
-        # Need to sort by the index because the ballot is returned in the
-        # order of the random sample
-        ballot = ballot.sort_index()
+        # Give each ranked song points, so the comparison lines up with the 
+        # song positions
+        points = np.full(self.ballots.num_songs, np.nan)
+        points[ballot] = np.arange(ballot.shape[0], 0, -1)
 
         # This is numpy magic for doing a pairwise comparison
-        pairwise_comparison = (ballot.values[:, None] > ballot.values)
+        pairwise_comparison = (points[:, None] > points)
 
         # Transforms from bool to int
         pairwise_comparison = pairwise_comparison * 1 
@@ -80,33 +247,195 @@ class Condorcet:
         if self.n_winners > pairwise_sums.shape[0]:
             self.n_winners = pairwise_sums.shape[0]
 
-        row_sums = pairwise_sums.sum(axis=1)
-        ii = np.argpartition(row_sums, -self.n_winners)[-self.n_winners:]
-        ii = ii[np.argsort(row_sums[ii])]
-        ii = np.flip(ii)
-        return ii, row_sums[ii]
+        self.scores = pairwise_sums.sum(axis=1)
+        return highest_scores(self.scores, self.n_winners)
     
 
     def look_for_and_break_ties(self):
-        # Detect Ties
-        scores = defaultdict(list)
-        for candidate, score in zip(self.top_nominee_ids, self.top_vote_counts):
-            scores[score].append(candidate)
+        """
+        Reorders songs with the same score by how they did head to head
+        against each other. Those counts are already in pairwise_sums, so a
+        tied group is just the block of pairwise_sums for its songs. Within a
+        group, songs are ordered by how many of the others they beat, then by
+        their total margin over the others, then by song position.
+
+        Ties at the bottom of the list can cross the top n_winners cutoff,
+        with some of the songs on the cutoff score left out. How those are
+        handled depends on boundary_ties:
+            "break":    every song on the cutoff score is in the tie break and
+                        the best of them fill the remaining places
+            "include":  every song on the cutoff score is kept, so there can
+                        be more than n_winners top nominees
+        """
+        if not len(self.top_vote_counts):
+            return
+        self.top_nominee_ids, self.top_vote_counts, self.tied_at_cutoff = \
+            highest_scores_head_to_head(self.scores, self.pairwise_sums,
+                                        self.n_winners, self.boundary_ties)
+
+
+def highest_scores(scores, n):
+    """Positions and values of the n highest scores, highest first"""
+    ii = np.argpartition(scores, -n)[-n:]
+    ii = ii[np.argsort(scores[ii])]
+    ii = np.flip(ii)
+    return ii, scores[ii]
+
+
+def highest_scores_head_to_head(scores, pairwise_sums, n, boundary_ties="break"):
+    """
+    Positions and values of the n highest scores, highest first, with songs
+    on the same score ordered by their head to heads, see
+    Condorcet.look_for_and_break_ties. Also returns the positions of the
+    songs on the cutoff score.
+    """
+    cutoff = np.partition(scores, -n)[-n]
+    candidates = np.flatnonzero(scores >= cutoff)
+    scores = scores[candidates]
+    tied_at_cutoff = candidates[scores == cutoff]
+
+    # Head to heads between songs with the same score
+    same_score = scores[:, None] == scores
+    block = pairwise_sums[np.ix_(candidates, candidates)]
+    wins = ((block > block.T) & same_score).sum(axis=1)
+    margins = ((block - block.T) * same_score).sum(axis=1)
+
+    order = np.lexsort((candidates, -margins, -wins, -scores))
+    if boundary_ties == "break":
+        order = order[:n]
+    return candidates[order], scores[order], tied_at_cutoff
+
+
+class CondorcetAccumulator:
+    def __init__(self, num_songs, n_winners=10, song_index=None, boundary_ties="break"):
+        """
+        Tallies ranked ballots as they arrive, one at a time or in chunks of
+        RankedBallots, without keeping them around. The pairwise sums and
+        each song's Copeland score (how many head to heads it wins) are kept 
+        up to date, so the current top n_winners can be read at any moment.
+
+        It has the same pairwise_sums, preferences and top_nominee_ids as a 
+        Condorcet tally of the same ballots, ties broken the same way. Only
+        the songs on or above the cutoff score are looked at to break them.
+        """
+        if boundary_ties not in ["break", "include"]:
+            raise ValueError(f"boundary_ties should be 'break' or 'include', not {boundary_ties!r}")
+        self.num_songs = num_songs
+        self.n_winners = min(n_winners, num_songs)
+        self.song_index = song_index
+        self.boundary_ties = boundary_ties
+        self.pairwise_sums = np.zeros((num_songs, num_songs))
+        self.copeland_scores = np.zeros(num_songs, dtype=int)
+        self.num_ballots = 0
+
+
+    def add_ballot(self, ballot):
+        """
+        ballot (np.array):
+            The song positions one voter ranked, best first.
+
+        Only the comparisons between songs on this ballot can change, so only
+        that block of the Copeland scores is updated.
+        """
+        ballot = np.asarray(ballot).astype(np.intp)
+        block = np.ix_(ballot, ballot)
+        before = self.pairwise_sums[block] > self.pairwise_sums[block].T
+        self.pairwise_sums[block] += ranked_above(ballot.shape[0])
+        after = self.pairwise_sums[block] > self.pairwise_sums[block].T
+        self.copeland_scores[ballot] += after.sum(axis=1) - before.sum(axis=1)
+        self.num_ballots += 1
 
-        # Correct Ties
-        for score in scores.keys():
-            if len(scores[score]) > 1:
-                # We got a tie!
-                tying_score = score
-                tying_candidates = scores[tying_score]
-                tying_ballots = self.ballot_df[self.ballot_df.index.isin(tying_candidates)].copy()
 
-                # Fix by comparing just those candidates against each other.
-                tie_breaker = Condorcet(tying_ballots, n_winners=tying_ballots.shape[0], break_ties=False)
-                tie_breaking_order = tying_ballots.iloc[tie_breaker.top_nominee_ids].index.values
+    def add_ballots(self, ballots):
+        """
+        ballots (RankedBallots):
+            A chunk of voters' ballots, tallied together.
+        """
+        self.pairwise_sums += Condorcet.count_block(ballots)
+        self.copeland_scores = self.preferences.sum(axis=1)
+        self.num_ballots += ballots.num_voters
+
+
+    @property
+    def preferences(self):
+        return CondorcetCounting.get_schwartz_relations_matrix(self.pairwise_sums)
+
+
+    def top_nominees(self):
+        if not self.n_winners:
+            return highest_scores(self.copeland_scores, self.n_winners)
+        ids, counts, _ = highest_scores_head_to_head(self.copeland_scores, self.pairwise_sums,
+                                                     self.n_winners, self.boundary_ties)
+        return ids, counts
+
+
+    @property
+    def top_nominee_ids(self):
+        return self.top_nominees()[0]
+
+
+    @property
+    def top_vote_counts(self):
+        return self.top_nominees()[1]
+
+
+def strongly_connected_components(adjacency):
+    """
+    Labels the strongly connected components of a directed graph given as a
+    dense boolean adjacency matrix, using Tarjan's algorithm. Returns an
+    array with a component number for each node.
+
+    Each node's neighbors are found with one vectorized pass over its row, 
+    so the whole thing is O(N^2) array work and O(N) Python steps.
+    """
+    num_nodes = adjacency.shape[0]
+    index = np.full(num_nodes, -1)
+    lowlink = np.zeros(num_nodes, dtype=int)
+    on_stack = np.zeros(num_nodes, dtype=bool)
+    components = np.full(num_nodes, -1)
+    stack = []
+    next_index = 0
+    num_components = 0
+
+    for root in range(num_nodes):
+        if index[root] >= 0:
+            continue
+
+        call_stack = [root]
+        while call_stack:
+            node = call_stack[-1]
+            if index[node] < 0:
+                index[node] = lowlink[node] = next_index
+                next_index += 1
+                stack.append(node)
+                on_stack[node] = True
+
+            unvisited = np.flatnonzero(adjacency[node] & (index < 0))
+            if unvisited.size:
+                call_stack.append(unvisited[0])
+                continue
+
+            # Every neighbor has been visited. Neighbors still on the stack 
+            # are in this node's component or an ancestor's.
+            neighbors = adjacency[node] & on_stack
+            if neighbors.any():
+                lowlink[node] = min(lowlink[node], index[neighbors].min())
+
+            call_stack.pop()
+            if call_stack:
+                parent = call_stack[-1]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+            if lowlink[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    components[member] = num_components
+                    if member == node:
+                        break
+                num_components += 1
 
-                # Correct the order
-                self.top_nominee_ids[self.top_vote_counts == tying_score] = tie_breaking_order
+    return components
 
 
 class CondorcetCounting():
@@ -208,51 +537,43 @@ class CondorcetCounting():
         Returns:
             matrix of preferences
         """
-        #initialize a matrix with all zeros 
-        num_songs = sum_ballots_matrix.shape[0]
-        matrix_of_more_preferred = np.zeros([num_songs, num_songs], dtype=bool) # Init to False (loss)
-        #loop through all guacs and check the runner vs opponent preferences. 
-        #when the runner is more preferred than the opponent (by more votes), flip the matrix location to True
-        for runner in range(num_songs):
-            for opponent in range(num_songs):
-                if runner == opponent: continue
-                if (sum_ballots_matrix[runner][opponent] > sum_ballots_matrix[opponent][runner]):
-                    matrix_of_more_preferred[runner][opponent] = True # Victory (no tie)
-
+        # The runner (row) is more preferred than the opponent (col) when more
+        # voters ranked them higher. Ties and the diagonal stay False.
+        sum_ballots_matrix = np.asarray(sum_ballots_matrix)
+        matrix_of_more_preferred = sum_ballots_matrix > sum_ballots_matrix.T
         return matrix_of_more_preferred
 
 
     @staticmethod
-    def get_smith_or_schwartz_set_statuses(matrix_of_more_preferred, song_names):
-        """Uses Floyd-Warshall algorithm to find out which candidates are in the Smith or Schwartz Set.
+    def get_smith_or_schwartz_set_statuses(matrix_of_more_preferred, song_names=None):
+        """Finds out which candidates are in the Smith or Schwartz Set.
         The set returned is dependent on the calculation of the relations.
         Modeled after https://wiki.electorama.com/wiki/Maximal_elements_algorithms
 
+        A candidate is in the set when everyone who beats them, directly or
+        through a chain of wins, is also beaten by them in return. That is 
+        the same as being in a strongly connected component of the majority 
+        graph that no outside candidate has a win into, which takes O(N^2) 
+        rather than the O(N^3) of Floyd-Warshall.
+
         Args:
             matrix_of_more_preferred (numpy matrix): matrix containing True when a runner is preferred more than the opponent.
+            song_names (list): index for the returned dataframe. Defaults to 0 to N-1.
 
         """
-        #assume every guac belongs, then knock them off
+        matrix_of_more_preferred = np.asarray(matrix_of_more_preferred, dtype=bool)
         num_songs = matrix_of_more_preferred.shape[0]
-        is_in_smith_or_schwartz_set = np.ones(num_songs, dtype=bool) #Init to True
-
-        # Use transitive properties to determine winners. 
-        # E.g., if B > A and A > C then B > C
-        matrix_of_more_preferred_tp = matrix_of_more_preferred.copy()
-        for runner in range(num_songs):
-            for opponent in range(num_songs):
-                if runner != opponent:
-                    for middle_guac in range(num_songs):
-                        if ((runner != middle_guac) and (opponent != middle_guac)):
-                            if (matrix_of_more_preferred_tp[opponent][runner] and matrix_of_more_preferred_tp[runner][middle_guac]):
-                                matrix_of_more_preferred_tp[opponent][middle_guac] = True
-        
-        for runner in range(num_songs):
-            for opponent in range(num_songs):
-                if (runner != opponent):
-                    if (matrix_of_more_preferred_tp[opponent][runner] and not matrix_of_more_preferred_tp[runner][opponent]):
-                        is_in_smith_or_schwartz_set[runner] = False
-                        break
+        if song_names is None:
+            song_names = range(num_songs)
+
+        components = strongly_connected_components(matrix_of_more_preferred)
+
+        # Wins that cross from one component into another
+        crossing = matrix_of_more_preferred & (components[:, None] != components[None, :])
+        beaten_from_outside = np.zeros(num_songs, dtype=bool)
+        beaten_from_outside[components[crossing.any(axis=0)]] = True
+        is_in_smith_or_schwartz_set = ~beaten_from_outside[components]
+
         smith_schwartz_set_df = pd.DataFrame(index = song_names)
         smith_schwartz_set_df['in_set'] = is_in_smith_or_schwartz_set
         return smith_schwartz_set_df
@@ -276,7 +597,7 @@ class CondorcetCounting():
         matrix_of_more_preferred = self.get_schwartz_relations_matrix(ballot_matrices_sum)
 
         #find the sets of winners and loosers
-        self.smith_schwartz_set_df = self.get_smith_or_schwartz_set_statuses(matrix_of_more_preferred)
+        self.smith_schwartz_set_df = self.get_smith_or_schwartz_set_statuses(matrix_of_more_preferred, ballots.index)
         
         #add to the sets of winners and loosers the mean to find the absolute winner
         self.smith_schwartz_set_df = self.smith_schwartz_set_df.join(ballots[['Mean']]) 
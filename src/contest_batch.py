@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+from . import kernels
+from .counter_rng import CounterRNG
+from .condorcet_counting import Condorcet
+from .current_method import OneVotePerFinalist
+from .schulze import Schulze
+from .ranked_pairs import RankedPairs
+
+
+class ContestBatch:
+    def __init__(self, sim, contests, block_budget=2**24):
+        """
+        Runs many small contests together. Every contest's ballots are laid
+        out in (contests, voters, ballot length) arrays and counted in one
+        pass, so the per contest cost is a few NumPy calls instead of a whole
+        Simulation.
+
+        sim (Simulation):
+            Sets up each contest: the songs, voters, limits, mafias and the
+            seed. It's only used for its settings and draws, it isn't
+            simulated.
+        contests (list):
+            The contest numbers. Contest ii comes out with the same winners
+            as sim.simulate() with sim.contest = ii.
+
+        Only the methods that need just the counts can be batched:
+        condorcet, current, schulze and ranked_pairs.
+
+        For each contest, results has the winners and fair winner counts,
+        like Simulation.record_consistency, and condorcets has its Condorcet.
+        """
+        unbatched = set(sim.methods) - {"condorcet", "current", "schulze", "ranked_pairs"}
+        if unbatched:
+            raise ValueError(f"These methods can't be batched: {sorted(unbatched)}")
+        if sim.seed is None:
+            raise ValueError("The contests are drawn from sim.seed, so it has to be set.")
+        self.sim = sim
+        self.contests = contests
+        self.block_budget = block_budget
+        self.num_songs = sim.song_df.shape[0]
+
+        self.cast_ballots()
+        self.count_votes()
+        self.results, self.condorcets = self.declare_winners()
+
+
+    def cast_ballots(self):
+        """
+        Draws each contest's ballots, the same counter-based draws the
+        Simulation makes, then orders them all at once. A corrupt voter's
+        boss song is sorted to the top of their ballot, if it's on it.
+
+        Sets songs, (contests, voters, ballot length) in ranked order, and
+        lengths, how many songs each voter ranked.
+        """
+        sim = self.sim
+        contests = []
+        for contest in self.contests:
+            rng = CounterRNG(sim.seed, contest).for_voters(0, sim.num_voters)
+            contests.append(sim.draw_ballot_rows(sim.num_voters, rng))
+
+        # The alphabetical contest's rows vary in length, so they're padded
+        width = max(contest_songs.shape[1] for contest_songs, *_ in contests)
+        shape = (len(contests), sim.num_voters, width)
+        songs = np.zeros(shape, dtype=np.intp)
+        keys = np.full(shape, np.inf)
+        self.listen_counts = np.zeros((len(contests), self.num_songs), dtype=int)
+        for rr, (contest_songs, scores, ranked, listen_counts) in enumerate(contests):
+            columns = contest_songs.shape[1]
+            songs[rr, :, :columns] = contest_songs
+            keys[rr, :, :columns] = np.where(ranked, -scores, np.inf)
+            self.listen_counts[rr] = listen_counts
+
+        for ii_song, voter_start, voter_stop in sim.mafia_targets():
+            corrupt_keys = keys[:, voter_start:voter_stop]
+            boss_song = (songs[:, voter_start:voter_stop] == ii_song) & (corrupt_keys < np.inf)
+            corrupt_keys[boss_song] = -np.inf
+
+        order = np.argsort(keys, axis=2, kind="stable")
+        self.songs = np.take_along_axis(songs, order, axis=2)
+        self.lengths = (keys < np.inf).sum(axis=2)
+
+
+    def count_votes(self):
+        """
+        Counts every contest's pairwise_sums and one vote per finalist
+        finalist_votes at once.
+        """
+        num_contests = self.songs.shape[0]
+        position = np.arange(self.songs.shape[2])
+        finalists = (position < self.lengths[..., None]) & (position < self.sim.num_winners)
+        contest_songs = self.songs + self.num_songs * np.arange(num_contests)[:, None, None]
+        self.finalist_votes = np.bincount(contest_songs[finalists],
+            minlength=num_contests * self.num_songs).reshape(num_contests, self.num_songs)
+
+        if kernels.enabled():
+            self.pairwise_sums = kernels.count_contest_pairs(self.songs, self.lengths, self.num_songs)
+        else:
+            self.pairwise_sums = self.count_pairs_in_blocks()
+
+
+    def count_pairs_in_blocks(self):
+        """
+        Pairwise sums from each song's position on each ballot. A song that
+        isn't on the ballot gets the ballot length. Blocks of contests, or of
+        one contest's voters, are compared block_budget comparisons at a time.
+        """
+        num_contests, num_voters, width = self.songs.shape
+        positions = np.full((num_contests, num_voters, self.num_songs), width)
+        on_ballot = np.arange(width) < self.lengths[..., None]
+        contests, voters, columns = np.nonzero(on_ballot)
+        positions[contests, voters, self.songs[on_ballot]] = columns
+
+        voters_per_block = max(1, self.block_budget // self.num_songs**2)
+        contests_per_block = max(1, voters_per_block // num_voters)
+        voters_per_block = min(voters_per_block, num_voters)
+        pairwise_sums = np.zeros((num_contests, self.num_songs, self.num_songs), dtype=np.int64)
+        for first_contest in range(0, num_contests, contests_per_block):
+            contest_block = slice(first_contest, first_contest + contests_per_block)
+            for first_voter in range(0, num_voters, voters_per_block):
+                block = positions[contest_block, first_voter:first_voter+voters_per_block]
+                above = block[..., :, None] < block[..., None, :]
+                above &= block[..., None, :] < width
+                pairwise_sums[contest_block] += above.sum(axis=1)
+        return pairwise_sums
+
+
+    def declare_winners(self):
+        """
+        Each contest's winners, from its counts, through the same classes
+        Simulation uses.
+        """
+        sim = self.sim
+        song_index = sim.song_df.index
+        fair_winners = set(sim.catalog.fair_winners(sim.num_winners))
+
+        results, condorcets = [], []
+        for rr in range(self.songs.shape[0]):
+            winners = {"condorcet": [], "current_method": [], "schulze": [], "ranked_pairs": []}
+            condorcet = None
+            if "condorcet" in sim.methods:
+                condorcet = Condorcet(None, sim.num_winners, engine=sim.tally_engine,
+                                      pairwise_sums=self.pairwise_sums[rr].astype(float))
+                winners["condorcet"] = condorcet.top_nominee_ids
+            if "current" in sim.methods:
+                vote_totals = pd.Series(self.finalist_votes[rr], index=song_index)
+                winners["current_method"] = OneVotePerFinalist(None, sim.num_winners, vote_totals).winners
+            if "schulze" in sim.methods:
+                winners["schulze"] = Schulze(self.pairwise_sums[rr], sim.num_winners,
+                                             song_index=song_index).winners
+            if "ranked_pairs" in sim.methods:
+                winners["ranked_pairs"] = RankedPairs(self.pairwise_sums[rr], sim.num_winners,
+                                                      song_index=song_index).winners
+
+            contest_results = {}
+            for method, method_winners in winners.items():
+                contest_results[f"{method}_winners"] = method_winners
+                contest_results[f"num_{method}_fair_winners"] = \
+                    len(set(method_winners[:sim.num_winners]).intersection(fair_winners))
+            results.append(contest_results)
+            condorcets.append(condorcet)
+        return results, condorcets
@@ -0,0 +1,169 @@
+'''
+Random draws keyed by (seed, contest, voter). Every draw is Philox, a
+counter-based generator, of a counter made from the voter, which call it is
+for and which draw in the call, under a key made from the seed and contest.
+Nothing is carried from one draw to the next, so any voter's draws can be
+made again on their own, in any order, on any shard or process, and come
+out the same.
+'''
+import numpy as np
+
+from . import kernels
+
+
+PHILOX_M0 = np.uint64(0xD2E7470EE14C6C93)
+PHILOX_M1 = np.uint64(0xCA5A826395121157)
+PHILOX_W0 = np.uint64(0x9E3779B97F4A7C15)
+PHILOX_W1 = np.uint64(0xBB67AE8584CAA73B)
+LOW_BITS = np.uint64(0xFFFFFFFF)
+SHIFT = np.uint64(32)
+
+
+def mulhilo(a, b):
+    """The high and low 64 bits of the 128 bit products a * b"""
+    a_lo, a_hi = a & LOW_BITS, a >> SHIFT
+    b_lo, b_hi = b & LOW_BITS, b >> SHIFT
+    lo_lo, lo_hi = a_lo * b_lo, a_lo * b_hi
+    hi_lo, hi_hi = a_hi * b_lo, a_hi * b_hi
+    middle = (lo_lo >> SHIFT) + (lo_hi & LOW_BITS) + (hi_lo & LOW_BITS)
+    hi = hi_hi + (lo_hi >> SHIFT) + (hi_lo >> SHIFT) + (middle >> SHIFT)
+    return hi, a * b
+
+
+def philox(counters, key):
+    """
+    Philox4x64-10 of each row of counters, a (..., 4) uint64 array, under
+    key, two uint64s. Returns the same shape. These are the numbers NumPy's
+    own np.random.Philox(key=key, counter=counter - 1) starts with.
+    """
+    counters = np.asarray(counters, dtype=np.uint64)
+    key = np.asarray(key, dtype=np.uint64)
+    if kernels.enabled():
+        return kernels.philox(counters.reshape(-1, 4), key).reshape(counters.shape)
+
+    c0, c1, c2, c3 = (counters[..., ii] for ii in range(4))
+    k0, k1 = key
+    with np.errstate(over="ignore"):
+        for step in range(10):
+            if step:
+                k0, k1 = k0 + PHILOX_W0, k1 + PHILOX_W1
+            hi0, lo0 = mulhilo(PHILOX_M0, c0)
+            hi1, lo1 = mulhilo(PHILOX_M1, c2)
+            c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+    return np.stack([c0, c1, c2, c3], axis=-1)
+
+
+class CounterRNG:
+    def __init__(self, seed, contest=0):
+        """
+        seed (int or np.random.SeedSequence):
+            The root seed. The Philox key is spawned from it for the contest,
+            so each contest gets its own independent draws.
+        """
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        contest_seed = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (contest,))
+        self.key = contest_seed.generate_state(2, np.uint64)
+
+
+    def for_voters(self, first_voter, num_voters):
+        """The draws for a block of consecutive voters"""
+        return VoterDraws(self, np.arange(first_voter, first_voter + num_voters))
+
+
+    def bits(self, voters, stream, num_draws):
+        """
+        A (voters, num_draws) array of random uint64s. Draw jj of a voter's
+        stream is word jj % 4 of Philox on (voter, stream, jj // 4, 0).
+        """
+        num_blocks = -(-num_draws // 4)
+        counters = np.zeros((len(voters), num_blocks, 4), dtype=np.uint64)
+        counters[..., 0] = np.asarray(voters, dtype=np.uint64)[:, None]
+        counters[..., 1] = stream
+        counters[..., 2] = np.arange(num_blocks, dtype=np.uint64)
+        return philox(counters, self.key).reshape(len(voters), -1)[:, :num_draws]
+
+
+    def random(self, voters, stream, num_draws):
+        """Uniform floats in [0, 1), 53 random bits each, like NumPy's"""
+        return (self.bits(voters, stream, num_draws) >> np.uint64(11)) * 2.0**-53
+
+
+    def normal(self, voters, stream, num_draws):
+        """Standard normals by Box-Muller, each from its own pair of uniforms"""
+        uniforms = self.random(voters, stream, 2 * num_draws)
+        radius = np.sqrt(-2 * np.log1p(-uniforms[:, 0::2]))
+        return radius * np.cos(2 * np.pi * uniforms[:, 1::2])
+
+
+    def permute(self, voters, stream, positions, population):
+        """
+        Where each voter's own random shuffle of range(population) sends
+        positions, a (voters, k) array. Taking positions 0 to k-1 samples k
+        of the population without replacement, in O(k).
+
+        The shuffle is a four round Feistel network on the smallest even
+        number of bits that covers the population, keyed by Philox. Values
+        past the population are put through again until they land in it.
+        """
+        half_bits = max(1, (int(population - 1).bit_length() + 1) // 2)
+        mask = np.uint64(2**half_bits - 1)
+        half_bits = np.uint64(half_bits)
+        voters = np.broadcast_to(np.asarray(voters, dtype=np.uint64)[:, None], positions.shape)
+
+        values = positions.astype(np.uint64)
+        walking = np.ones(values.shape, dtype=bool)
+        while walking.any():
+            rows = np.nonzero(walking)
+            left, right = values[rows] >> half_bits, values[rows] & mask
+            for step in range(4):
+                counters = np.stack([voters[rows], np.full_like(right, stream), right,
+                                     np.full_like(right, step)], axis=-1)
+                left, right = right, left ^ (philox(counters, self.key)[:, 0] & mask)
+            values[rows] = (left << half_bits) | right
+            walking = values >= population
+        return values.astype(np.intp)
+
+
+class VoterDraws:
+    def __init__(self, rng, voters):
+        """
+        A block of voters' draws, with the same calls as np.random that
+        the Simulation makes. The first axis of every draw is the voters.
+        Each call takes the next stream, so the same calls in the same order
+        give each voter the same draws, whatever block they're in.
+        """
+        self.rng = rng
+        self.voters = voters
+        self.stream = 0
+
+
+    def next_stream(self):
+        self.stream += 1
+        return self.stream - 1
+
+
+    def draws_per_voter(self, shape):
+        if shape[0] != len(self.voters):
+            raise ValueError("The first axis of the draws has to be the voters.")
+        return int(np.prod(shape[1:], dtype=int))
+
+
+    def random(self, size):
+        size = tuple(np.atleast_1d(size))
+        draws = self.rng.random(self.voters, self.next_stream(), self.draws_per_voter(size))
+        return draws.reshape(size)
+
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        if size is None:
+            size = np.broadcast(np.asarray(loc), np.asarray(scale)).shape
+        size = tuple(np.atleast_1d(size))
+        draws = self.rng.normal(self.voters, self.next_stream(), self.draws_per_voter(size))
+        return loc + scale * draws.reshape(size)
+
+
+    def sample(self, population, size):
+        """(voters, size) distinct picks from range(population) for each voter"""
+        positions = np.broadcast_to(np.arange(size), (len(self.voters), size))
+        return self.rng.permute(self.voters, self.next_stream(), positions, population)
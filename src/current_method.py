@@ -1,27 +1,53 @@
+import numpy as np
 import pandas as pd
-from stqdm import stqdm
+
+from .ballots import RankedBallots
 
 
 class OneVotePerFinalist:
-    def __init__(self, ballots, num_winners):
+    def __init__(self, ballots, num_winners, vote_totals=None):
+        """
+        ballots can be RankedBallots or the older songs x voters DataFrame of
+        scores, which is converted to RankedBallots.
+
+        Each voter casts one vote for each of their top num_winners songs.
+        Only the vote totals are counted. The songs x voters tallies are built
+        the first time something asks for them.
+
+        vote_totals (pd.Series) can be passed in when they were already
+        counted, e.g. by a FusedTally.
+        """
+        if isinstance(ballots, pd.DataFrame):
+            ballots = RankedBallots.from_dataframe(ballots)
         self.ballots = ballots
         self.num_winners = num_winners
-        self.tallies = self.tally(ballots, num_winners)
-        self.winners = self.declare_winners(self.tallies)
+        self._tallies = None
+        if vote_totals is None:
+            vote_totals = self.tally(ballots, num_winners)
+        self.vote_totals = vote_totals
+        self.winners = self.declare_winners(self.vote_totals)
 
 
     def tally(self, ballots, num_winners):
-        tallies = pd.DataFrame(index=ballots.index)
+        """Every voter's top num_winners at once, counted per song"""
+        votes = ballots.top(num_winners)
+        vote_totals = np.bincount(votes.song_ids, minlength=ballots.num_songs)
+        return pd.Series(vote_totals, index=ballots.song_index)
+
 
-        for col in stqdm(ballots.columns, desc="Tallying Simple Ballots"):
-            tallies[col] = ballots[col].nlargest(num_winners) \
-                .notnull().astype(int).reindex(ballots.index)
-            
-        return tallies
+    @property
+    def tallies(self):
+        """One row per song, one column per voter, 1 where they voted for it"""
+        if self._tallies is None:
+            votes = self.ballots.top(self.num_winners)
+            tallies = np.zeros((votes.num_songs, votes.num_voters), dtype=int)
+            tallies[votes.song_ids, votes.voters] = 1
+            self._tallies = pd.DataFrame(tallies, index=votes.song_index)
+        return self._tallies
     
 
-    def declare_winners(self, tallies):
-        vote_totals = tallies.sum(axis=1).sort_values(ascending=False)
+    def declare_winners(self, vote_totals):
+        vote_totals = vote_totals.sort_values(ascending=False)
         self.winner_vote_totals = vote_totals.head(self.num_winners)
         winners = self.winner_vote_totals.index.to_list()
-        return winners
\ No newline at end of file
+        return winners
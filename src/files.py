@@ -0,0 +1,13 @@
+import os
+import socket
+from pathlib import Path
+
+
+def temporary_path(filepath):
+    """
+    Where to write filepath before moving it into place, so readers never
+    see half a file. It's named for this machine and process, so writers
+    elsewhere don't write over it, and keeps the same suffix.
+    """
+    filepath = Path(filepath)
+    return filepath.with_name(f".{socket.gethostname()}-{os.getpid()}.{filepath.name}")
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from stqdm import stqdm
+
+from . import kernels
+from .condorcet_counting import Condorcet
+
+
+class FusedTally:
+    def __init__(self, num_songs, num_winners=10, song_index=None):
+        """
+        Counts everything the voting methods need in one pass over the
+        ballots, so comparing methods on the same ballots costs one tally:
+
+            pairwise_sums:      Row-Col, how many voters ranked row above col
+            finalist_votes:     One vote for each of a voter's top num_winners
+            first_choices:      One vote for each voter's favorite
+            borda_points:       A voter's first choice gets as many points as
+                                songs they ranked, their last choice gets 1
+            score_sums:         Sum of the scores each song got on ballots
+            num_rankings:       How many ballots each song was on
+
+        Methods then just read off the counts they need.
+        """
+        self.num_songs = num_songs
+        self.num_winners = num_winners
+        if song_index is None:
+            song_index = pd.RangeIndex(num_songs)
+        self.song_index = song_index
+
+        self.pairwise_sums = np.zeros((num_songs, num_songs), dtype=np.int64)
+        self.finalist_votes = np.zeros(num_songs, dtype=np.int64)
+        self.first_choices = np.zeros(num_songs, dtype=np.int64)
+        self.borda_points = np.zeros(num_songs, dtype=np.int64)
+        self.score_sums = np.zeros(num_songs)
+        self.num_rankings = np.zeros(num_songs, dtype=np.int64)
+        self.num_ballots = 0
+
+
+    def tally(self, ballots, block_budget=2**24):
+        """
+        Adds all the ballots, a block of voters at a time. Blocks are sized
+        for the pairwise comparisons, the most expensive part.
+        """
+        block_size, count = Condorcet.plan_blocks(ballots, block_budget)
+        block_starts = range(0, ballots.num_voters, block_size)
+        for start in stqdm(block_starts, desc="Tallying Ballots"):
+            self.add_ballots(ballots[start:start+block_size], count)
+        return self
+
+
+    def add_ballots(self, ballots, count=None):
+        """
+        ballots (RankedBallots):
+            A block of voters' ballots. Scores are summed if the ballots have
+            them.
+        count (function):
+            Which of Condorcet's block counts to use for the pairwise sums.
+            Defaults to whichever is cheaper for this block.
+
+        With the compiled kernels, all of it is counted in one loop.
+        """
+        if kernels.enabled():
+            self.add_ballots_compiled(ballots)
+            return
+
+        if count is None:
+            count = Condorcet.count_block
+        song_ids = ballots.song_ids.astype(np.intp)
+        lengths = np.repeat(ballots.lengths, ballots.lengths)
+        position = np.arange(song_ids.shape[0]) - np.repeat(ballots.offsets[:-1], ballots.lengths)
+
+        self.pairwise_sums += count(ballots)
+        self.finalist_votes += np.bincount(song_ids[position < self.num_winners], minlength=self.num_songs)
+        self.first_choices += np.bincount(song_ids[position == 0], minlength=self.num_songs)
+        self.borda_points += np.bincount(song_ids, weights=lengths - position,
+                                         minlength=self.num_songs).astype(np.int64)
+        self.num_rankings += np.bincount(song_ids, minlength=self.num_songs)
+        if ballots.scores is not None:
+            self.score_sums += np.bincount(song_ids, weights=ballots.scores, minlength=self.num_songs)
+        self.num_ballots += ballots.num_voters
+
+
+    def add_ballots_compiled(self, ballots):
+        """
+        add_ballots in one compiled loop. The block's scores are summed on
+        their own and then added, like the NumPy version, so the float sums
+        come out identical.
+        """
+        score_sums = np.zeros(self.num_songs)
+        scores = ballots.scores if ballots.scores is not None else np.zeros(0)
+        kernels.fused_counts(ballots.song_ids, ballots.offsets, scores, self.num_winners,
+                             self.pairwise_sums, self.finalist_votes, self.first_choices,
+                             self.borda_points, self.num_rankings, score_sums)
+        self.score_sums += score_sums
+        self.num_ballots += ballots.num_voters
+
+
+    def merge(self, other):
+        """
+        Adds another FusedTally's counts to this one, e.g. one counted on a
+        different shard of voters. Merging in the same order always gives
+        the same float sums.
+        """
+        self.pairwise_sums += other.pairwise_sums
+        self.finalist_votes += other.finalist_votes
+        self.first_choices += other.first_choices
+        self.borda_points += other.borda_points
+        self.score_sums += other.score_sums
+        self.num_rankings += other.num_rankings
+        self.num_ballots += other.num_ballots
+        return self
+
+
+    @property
+    def score_means(self):
+        """Average score among the ballots each song was on, NaN if none"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.score_sums / self.num_rankings
+
+
+    def results(self, name):
+        """
+        The per song totals a method ranks by, as a Series:
+            "current":  finalist_votes
+            "fptp":     first_choices
+            "borda":    borda_points
+            "sum":      score_sums
+            "mean":     score_means
+        """
+        totals = {
+            "current": self.finalist_votes,
+            "fptp": self.first_choices,
+            "borda": self.borda_points,
+            "sum": self.score_sums,
+            "mean": self.score_means,
+        }[name]
+        return pd.Series(totals, index=self.song_index)
+
+
+    def winners(self, name, num_winners=None):
+        """The songs with the highest totals for the method"""
+        if num_winners is None:
+            num_winners = self.num_winners
+        totals = self.results(name).sort_values(ascending=False, kind="stable")
+        return totals.dropna().head(num_winners).index.tolist()
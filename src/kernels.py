@@ -0,0 +1,165 @@
+'''
+Compiled versions of the loops the tallies spend their time in. These need
+numba, which is optional. When it's installed these kernels are used
+automatically, otherwise everything runs on the NumPy versions next to the
+code that calls them. Both give identical results.
+
+The kernels release the GIL while they run, so threads tallying different
+shards of voters run at the same time.
+
+To compare the two, switch backends with use_backend("numpy") or
+use_backend("numba").
+'''
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+BACKEND = "numba" if njit is not None else "numpy"
+
+
+def use_backend(name):
+    """Pick "numba" or "numpy" for every kernel"""
+    global BACKEND
+    if name == "numba" and njit is None:
+        raise ImportError("The numba backend needs numba installed.")
+    if name not in ("numba", "numpy"):
+        raise ValueError(f"Unknown backend: {name}")
+    BACKEND = name
+
+
+def enabled():
+    """Whether the compiled kernels are in use"""
+    return BACKEND == "numba"
+
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def count_pairs(song_ids, offsets, num_songs):
+        """
+        Pairwise comparisons of a block of ranked ballots. Row-Col, how many
+        ballots ranked row above col.
+        """
+        counts = np.zeros((num_songs, num_songs), dtype=np.int64)
+        for ii in range(offsets.shape[0] - 1):
+            for above in range(offsets[ii], offsets[ii+1]):
+                row = song_ids[above]
+                for below in range(above + 1, offsets[ii+1]):
+                    counts[row, song_ids[below]] += 1
+        return counts
+
+
+    @njit(cache=True, nogil=True)
+    def count_contest_pairs(songs, lengths, num_songs):
+        """
+        Pairwise comparisons of many contests' ballots at once. songs is
+        (contests, voters, ballot length), each row in ranked order, and
+        lengths is how many songs each voter ranked. Returns the (contests,
+        num_songs, num_songs) pairwise sums.
+        """
+        num_contests, num_voters, _ = songs.shape
+        counts = np.zeros((num_contests, num_songs, num_songs), dtype=np.int64)
+        for rr in range(num_contests):
+            for ii in range(num_voters):
+                for above in range(lengths[rr, ii]):
+                    row = songs[rr, ii, above]
+                    for below in range(above + 1, lengths[rr, ii]):
+                        counts[rr, row, songs[rr, ii, below]] += 1
+        return counts
+
+
+    @njit(cache=True, nogil=True)
+    def fused_counts(song_ids, offsets, scores, num_winners, pairwise_sums,
+                     finalist_votes, first_choices, borda_points, num_rankings,
+                     score_sums):
+        """
+        Everything FusedTally counts, added in place, reading each ballot
+        once. scores may be empty when the ballots don't have them.
+        """
+        has_scores = scores.shape[0] > 0
+        for ii in range(offsets.shape[0] - 1):
+            start, end = offsets[ii], offsets[ii+1]
+            for above in range(start, end):
+                song = song_ids[above]
+                position = above - start
+                if position == 0:
+                    first_choices[song] += 1
+                if position < num_winners:
+                    finalist_votes[song] += 1
+                borda_points[song] += end - above
+                num_rankings[song] += 1
+                if has_scores:
+                    score_sums[song] += scores[above]
+                for below in range(above + 1, end):
+                    pairwise_sums[song, song_ids[below]] += 1
+
+
+    @njit(cache=True, nogil=True)
+    def advance_ballots(song_ids, pointers, ends, choices, moving, standing):
+        """Each moving ballot's pointer moves down to its next choice still standing"""
+        for ii in moving:
+            pointer = pointers[ii] + 1
+            while pointer < ends[ii] and not standing[song_ids[pointer]]:
+                pointer += 1
+            pointers[ii] = pointer
+            choices[ii] = song_ids[pointer] if pointer < ends[ii] else -1
+
+
+    @njit(cache=True, nogil=True)
+    def order_score_rows(songs, scores, ranked):
+        """
+        Each row's ranked songs and their scores, highest score first, ties
+        in column order. Returns the songs, scores and how many each row
+        ranked.
+        """
+        num_rows, num_cols = songs.shape
+        lengths = np.zeros(num_rows, dtype=np.int64)
+        for ii in range(num_rows):
+            for jj in range(num_cols):
+                if ranked[ii, jj]:
+                    lengths[ii] += 1
+
+        ordered_songs = np.empty(lengths.sum(), dtype=songs.dtype)
+        ordered_scores = np.empty(lengths.sum(), dtype=np.float64)
+        start = 0
+        for ii in range(num_rows):
+            columns = np.flatnonzero(ranked[ii])
+            order = np.argsort(-scores[ii][columns], kind="mergesort")
+            for kk in range(order.shape[0]):
+                ordered_songs[start + kk] = songs[ii, columns[order[kk]]]
+                ordered_scores[start + kk] = scores[ii, columns[order[kk]]]
+            start += order.shape[0]
+        return ordered_songs, ordered_scores, lengths
+
+
+    @njit(cache=True, nogil=True)
+    def mulhilo(a, b):
+        """The high and low 64 bits of the 128 bit product a * b"""
+        low_bits = np.uint64(0xFFFFFFFF)
+        shift = np.uint64(32)
+        a_lo, a_hi = a & low_bits, a >> shift
+        b_lo, b_hi = b & low_bits, b >> shift
+        lo_hi, hi_lo = a_lo * b_hi, a_hi * b_lo
+        middle = ((a_lo * b_lo) >> shift) + (lo_hi & low_bits) + (hi_lo & low_bits)
+        return a_hi * b_hi + (lo_hi >> shift) + (hi_lo >> shift) + (middle >> shift), a * b
+
+
+    @njit(cache=True, nogil=True)
+    def philox(counters, key):
+        """Philox4x64-10 of each row of counters, see counter_rng.philox"""
+        out = np.empty_like(counters)
+        for ii in range(counters.shape[0]):
+            c0, c1, c2, c3 = counters[ii, 0], counters[ii, 1], counters[ii, 2], counters[ii, 3]
+            k0, k1 = key[0], key[1]
+            for step in range(10):
+                if step:
+                    k0 += np.uint64(0x9E3779B97F4A7C15)
+                    k1 += np.uint64(0xBB67AE8584CAA73B)
+                hi0, lo0 = mulhilo(np.uint64(0xD2E7470EE14C6C93), c0)
+                hi1, lo1 = mulhilo(np.uint64(0xCA5A826395121157), c2)
+                c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+            out[ii, 0], out[ii, 1], out[ii, 2], out[ii, 3] = c0, c1, c2, c3
+        return out
@@ -12,6 +12,7 @@ import inflect
 
 from .config import COLORS
 from .simulation import Simulation, DATA_DIR
+from .song_catalog import SongCatalog
 import src.utils as utils
 import emoji
 
@@ -336,6 +337,15 @@ def simulation_section(song_df, section_title,
 
     methods = subtitles.keys()
 
+    # When only ranked ballots are tallied, they can be streamed into the
+    # tally and the chart updated as the votes come in.
+    stream = list(methods) == ["condorcet"]
+    # Otherwise the voters are cast and counted on every core at once. Only
+    # the runoffs and the current method's chart of every voter's votes need
+    # the ballots kept, any other ballot can be rebuilt from sim.seed.
+    num_threads = None if stream else os.cpu_count()
+    keep_ballots = bool(set(methods) & {"rcv", "stv", "current"})
+
     sim = Simulation(song_df, num_voters, 
         st_dev=st.session_state["st_dev"],
         listen_limit=listen_limit,
@@ -345,7 +355,9 @@ def simulation_section(song_df, section_title,
         num_mafiosos=num_mafiosos, 
         mafia_size=mafia_size,
         alphabetical=alphabetical,
-        methods=methods)
+        methods=methods,
+        keep_ballots=keep_ballots,
+        num_threads=num_threads)
 
     # if section_title != "Sandbox":
     write_instructions(section_title)
@@ -357,7 +369,14 @@ def simulation_section(song_df, section_title,
             disabled=disabled)
 
     if start_btn:
-        sim.simulate()
+        if stream:
+            live_chart = st.empty()
+            on_batch = lambda sim: live_results_chart(live_chart, sim, 
+                baseline_results, subtitles["condorcet"])
+            sim.simulate(on_batch=on_batch)
+            live_chart.empty()
+        else:
+            sim.simulate()
         for method in methods:
             chart_df = format_chart_df(sim, baseline_results, method=method)
             save_chart_df(chart_df, section_title, method)
@@ -390,6 +409,16 @@ def simulation_section(song_df, section_title,
     return sim, chart_df
 
 
+def live_results_chart(st_container, sim, baseline_results, subtitle):
+    """Redraws the ranked ballot results chart partway through a contest"""
+    chart_df = format_chart_df(sim, baseline_results, method="condorcet")
+    num_ballots = sim.condorcet.num_ballots
+    subtitle = f"{subtitle} {num_ballots} of {sim.num_voters} ballots counted so far."
+    chart_df, spec = format_spec(chart_df, num_voters=sim.num_voters,
+                                 subtitle=subtitle, method="condorcet")
+    st_container.vega_lite_chart(chart_df, spec, use_container_width=True)
+
+
 def initialize_empty_chart_df():
     """
     To display an empty bar chart before the simulation runs
@@ -421,11 +450,8 @@ def format_chart_df(sim, baseline=None, method="condorcet"):
 
     chart_df["Vote Tallies"] = chart_df.sum(axis=1)
     chart_df["Entrant"] = sim.song_df["ID"].astype(str)
-    objective_rankings = sim.song_df.sort_values("Objective Ratings", ascending=False).copy()
-    objective_rankings["Rank"] = np.arange(0, objective_rankings.shape[0])
-    objective_rankings["Rank"] += 1
-    chart_df["Rank"] = objective_rankings["Rank"].apply(lambda x: f"{GRAMMAR.ordinal(x)} Place")
-    chart_df["Score"] = objective_rankings["Objective Ratings"].apply(lambda x: round(x/10, 2))
+    chart_df["Rank"] = sim.catalog.ranks.apply(lambda x: f"{GRAMMAR.ordinal(x)} Place")
+    chart_df["Score"] = sim.song_df["Objective Ratings"].apply(lambda x: round(x/10, 2))
     chart_df["Ballot Position"] = chart_df["Ballot Position"].apply(lambda x: f"{x} out of {sim.song_df.shape[0]}")
 
     if baseline:
@@ -537,7 +563,7 @@ def format_spec(chart_df, num_voters=None, num_corrupt_voters=0, subtitle=None,
 def format_filepath(sim):
     n_songs = sim.song_df.shape[0]
     n_voters = sim.num_voters
-    filename = f"Repeated-Simulations_Sums_{n_songs}-Songs_{n_voters}-Voters.pkl"
+    filename = f"Repeated-Simulations_Sums_{n_songs}-Songs_{n_voters}-Voters"
     filepath = DATA_DIR / filename
     return filepath
 
@@ -570,8 +596,7 @@ def listen_count_histogram(sim):
 # def display_results_of_repeated_contests(sim):
 #     """This establishes the baseline for Simulation One"""
 #     filepath = format_filepath(sim)
-#     with open(filepath, "rb") as pkl_file:
-#         repeated_contests = pickle.load(pkl_file)
+#     repeated_contests = RepeatedSimulations.load(filepath)
 
 #     sums_per_song = repeated_contests.sum_of_rankings.sum(axis=1)
 #     chart_df = pd.DataFrame(sums_per_song)
@@ -616,7 +641,7 @@ def listen_count_histogram(sim):
 
 
 def top_songs_chart(song_df, start_loc, end_loc):
-    df = song_df.sort_values("Objective Ratings", ascending=False).copy()
+    df = SongCatalog.of(song_df).by_rating()
     df = df.iloc[start_loc:end_loc][["Objective Ratings", "ID"]]
     df.rename(columns={"ID": "Song & Artist"}, inplace=True)
     df["Objective Ratings"] = df["Objective Ratings"].apply(lambda x: round(x/10, 2))
@@ -639,7 +664,7 @@ def establish_baseline(song_df, num_winners=None, no_story=False):
     
     if num_winners is None:
         num_winners = st.session_state["num_winners"]
-    top_songs = song_df.sort_values("Objective Ratings", ascending=False).head(num_winners)
+    top_songs = SongCatalog.of(song_df).top(num_winners)
     baseline_titles = top_songs["ID"].tolist()
     baseline_indices = top_songs.index.tolist()
     return baseline_titles, baseline_indices
@@ -0,0 +1,203 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+UNSIGNED = [np.uint8, np.uint16, np.uint32, np.uint64]
+SIGNED = [np.int8, np.int16, np.int32, np.int64]
+
+# How many pairs are worked on at a time, so nothing pair sized is int64
+BLOCK_SIZE = 2**20
+
+
+def smallest_int(low, high, signed=True):
+    """The smallest integer type that holds everything from low to high"""
+    return next(dtype for dtype in (SIGNED if signed else UNSIGNED)
+                if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max)
+
+
+class PairwiseCounts:
+    def __init__(self, num_songs, directory=None):
+        """
+        Adds up pairwise counts, like Condorcet's pairwise_sums, in a fraction
+        of the memory of an N x N float matrix. For each pair of songs, row
+        above col, only two numbers are kept:
+
+            margin:     How many more times row was counted over col than the
+                        other way round
+            totals:     How many times the pair was counted, either way round
+
+        which is all of it, since count = (totals ± margin) / 2. Each is a
+        flat array of the pairs, the upper triangle row by row, and starts as
+        the smallest integer type, uint8 and int8, and is widened as the
+        counts grow.
+
+        With a directory, the two arrays are memory-mapped .npy files in it,
+        so only the pages being added to need to be in RAM. They start from
+        zero, use open to carry on from counts already there.
+        """
+        self.num_songs = num_songs
+        self.num_pairs = num_songs * (num_songs - 1) // 2
+        row_lengths = np.arange(num_songs - 1, -1, -1)
+        self.offsets = np.concatenate([[0], np.cumsum(row_lengths)])
+        self.directory = None if directory is None else Path(directory)
+
+        if self.directory is None:
+            self.margin = np.zeros(self.num_pairs, dtype=np.int8)
+            self.totals = np.zeros(self.num_pairs, dtype=np.uint8)
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.margin = self.create("margin", np.int8)
+            self.totals = self.create("totals", np.uint8)
+
+
+    @classmethod
+    def open(cls, directory):
+        """The counts already in directory, memory-mapped"""
+        directory = Path(directory)
+        margin = np.load(directory / "margin.npy", mmap_mode="r+")
+        totals = np.load(directory / "totals.npy", mmap_mode="r+")
+        counts = cls.from_arrays(margin, totals)
+        counts.directory = directory
+        return counts
+
+
+    @classmethod
+    def from_arrays(cls, margin, totals):
+        """Counts from the margin and totals of other counts, see arrays"""
+        num_songs = int(round((1 + np.sqrt(1 + 8 * totals.shape[0])) / 2))
+        counts = cls.__new__(cls)
+        counts.num_songs = num_songs
+        counts.num_pairs = totals.shape[0]
+        counts.offsets = np.concatenate([[0], np.cumsum(np.arange(num_songs - 1, -1, -1))])
+        counts.directory = None
+        counts.margin, counts.totals = margin, totals
+        return counts
+
+
+    def arrays(self):
+        """{"margin": margin, "totals": totals}, all there is to the counts"""
+        return {"margin": self.margin, "totals": self.totals}
+
+
+    def create(self, name, dtype, values=None):
+        """
+        A zeroed memory-mapped array in directory, or a copy of values. It's
+        written next to the old one and moved into place.
+        """
+        temporary = self.directory / f".{name}.npy"
+        array = np.lib.format.open_memmap(temporary, mode="w+", dtype=dtype, shape=(self.num_pairs,))
+        if values is not None:
+            array[...] = values
+        array.flush()
+        del array
+        os.replace(temporary, self.directory / f"{name}.npy")
+        return np.load(self.directory / f"{name}.npy", mmap_mode="r+")
+
+
+    def widen(self, name, low, high):
+        """Moves one of the arrays to the smallest type that holds low to high"""
+        array = getattr(self, name)
+        dtype = smallest_int(low, high, signed=name == "margin")
+        if dtype == array.dtype:
+            return
+        if self.directory is None:
+            setattr(self, name, array.astype(dtype))
+        else:
+            setattr(self, name, self.create(name, dtype, array))
+
+
+    def store(self, name, pairs, values):
+        """Writes int64 values into the pairs, widening first if they don't fit"""
+        array = getattr(self, name)
+        if values.size == 0:
+            return
+        info = np.iinfo(array.dtype)
+        low, high = values.min(), values.max()
+        if low < info.min or high > info.max:
+            self.widen(name, min(low, 0), high)
+            array = getattr(self, name)
+        array[pairs] = values
+
+
+    def add(self, pairwise):
+        """
+        pairwise (np.array):
+            An N x N array of whole counts, row over col, e.g. one contest's
+            pairwise_sums or its boolean preferences.
+
+        Goes a row at a time, so nothing N x N is made on the way.
+        """
+        for ii in range(self.num_songs - 1):
+            pairs = slice(self.offsets[ii], self.offsets[ii+1])
+            above = pairwise[ii, ii+1:].astype(np.int64)
+            below = pairwise[ii+1:, ii].astype(np.int64)
+            self.store("margin", pairs, self.margin[pairs].astype(np.int64) + above - below)
+            self.store("totals", pairs, self.totals[pairs].astype(np.int64) + above + below)
+        return self
+
+
+    def merge(self, other):
+        """Adds another PairwiseCounts of the same songs"""
+        for start in range(0, self.num_pairs, BLOCK_SIZE):
+            pairs = slice(start, start + BLOCK_SIZE)
+            self.store("margin", pairs, self.margin[pairs].astype(np.int64) + other.margin[pairs])
+            self.store("totals", pairs, self.totals[pairs].astype(np.int64) + other.totals[pairs])
+        return self
+
+
+    def zeros_like(self, name):
+        """
+        New zeroed counts of the same songs, e.g. to count some more contests
+        on their own. If these counts are memory-mapped, so are the new ones,
+        in a folder called name next to them.
+        """
+        directory = None if self.directory is None else self.directory.parent / name
+        return PairwiseCounts(self.num_songs, directory)
+
+
+    def dense(self, dtype=np.int64):
+        """The counts as an N x N array, row over col"""
+        counts = np.zeros((self.num_songs, self.num_songs), dtype=dtype)
+        for ii in range(self.num_songs - 1):
+            pairs = slice(self.offsets[ii], self.offsets[ii+1])
+            margin = self.margin[pairs].astype(np.int64)
+            totals = self.totals[pairs].astype(np.int64)
+            counts[ii, ii+1:] = (totals + margin) // 2
+            counts[ii+1:, ii] = (totals - margin) // 2
+        return counts
+
+
+    def majority(self):
+        """
+        Which songs were counted over which more often than the other way
+        round, an N x N boolean like Condorcet's preferences, bit-packed along
+        the rows by np.packbits. Unpack it with unpack_majority.
+        """
+        packed = np.zeros((self.num_songs, -(-self.num_songs // 8)), dtype=np.uint8)
+        for ii in range(self.num_songs):
+            row = np.zeros(self.num_songs, dtype=bool)
+            if ii < self.num_songs - 1:
+                row[ii+1:] = self.margin[self.offsets[ii]:self.offsets[ii+1]] > 0
+            # Column ii of the earlier rows, each one's pair with song ii
+            earlier = self.offsets[:ii] + (ii - np.arange(ii) - 1)
+            row[:ii] = self.margin[earlier] < 0
+            packed[ii] = np.packbits(row)
+        return packed
+
+
+    @staticmethod
+    def unpack_majority(packed, num_songs):
+        return np.unpackbits(packed, axis=1, count=num_songs).astype(bool)
+
+
+    @property
+    def nbytes(self):
+        return self.margin.nbytes + self.totals.nbytes
+
+
+    def flush(self):
+        if self.directory is not None:
+            self.margin.flush()
+            self.totals.flush()
@@ -5,6 +5,39 @@
 import numpy as np
 import pandas as pd
 
+from . import kernels
+from .ballots import RankedBallots
+
+
+def advance_ballots(song_ids, pointers, ends, choices, moving, standing):
+    """
+    Moves each of the moving ballots' pointers down to their next choice who
+    is still standing. choices is updated in place, with -1 for ballots that
+    run out of choices.
+    """
+    if kernels.enabled():
+        kernels.advance_ballots(song_ids, pointers, ends, choices, moving, standing)
+        return
+
+    while moving.size:
+        pointers[moving] += 1
+        out = pointers[moving] >= ends[moving]
+        choices[moving[out]] = -1
+        moving = moving[~out]
+        choices[moving] = song_ids[pointers[moving]]
+        moving = moving[~standing[choices[moving]]]
+
+
+def first_choices(ballots):
+    """Every ballot's pointer, end and first choice (-1 if it's empty)"""
+    song_ids = ballots.song_ids.astype(np.intp)
+    pointers = ballots.offsets[:-1].astype(np.intp)
+    ends = ballots.offsets[1:].astype(np.intp)
+    choices = np.full(ballots.num_voters, -1)
+    has_choice = pointers < ends
+    choices[has_choice] = song_ids[pointers[has_choice]]
+    return song_ids, pointers, ends, choices
+
 
 class RankChoiceVoting:
     def __init__(self, N=None):
@@ -34,89 +67,116 @@ class RankChoiceVoting:
                 ballots. It also assumes max_score is higher than min_score, as
                 in 'rank these options from 1 to 10, with 10 for the best'.
 
+            RankedBallots are also accepted and converted to points first.
+
         Returns:
             Dataframe of ranked choice ballots
         """
-        columns = ballot_df.columns.tolist()
-        reverse_scores = pd.DataFrame(index=ballot_df.index)
-        ranked_df = pd.DataFrame(index=ballot_df.index)
+        if isinstance(ballot_df, RankedBallots):
+            ballot_df = ballot_df.to_dataframe(points=True)
+            max_score = ballot_df.max().max()
 
         # We get ranks by sorting. But it sorts smallest to greatest.
         # So we need to flip the scores.
-        for col in columns:
-            reverse_scores[col] = ballot_df[col].apply(
-                lambda score: max_score-score
-            )
+        reverse_scores = max_score - ballot_df.values
 
-        # Turn scores into ranks by chaining argsort
+        # Turn scores into ranks by chaining argsort, one column per ballot
         # Add 1 so your first choice is not your 0th choice
-        for ii, col in enumerate(columns):
-            ranked_df[f"Ranks {ii}"] = reverse_scores[[col]].apply(
-                lambda scores: np.argsort(scores.values.argsort()) + 1
-            )
-
+        ranks = np.argsort(reverse_scores.argsort(axis=0), axis=0) + 1
+        columns = [f"Ranks {ii}" for ii in range(ranks.shape[1])]
+        ranked_df = pd.DataFrame(ranks, index=ballot_df.index, columns=columns)
         return ranked_df
 
 
     def tally_results(self, ranks):
         """
-        TODO:
-            - tally all ranks
-            - tally top N ranks
-            - docstring
+        ranks (pd.DataFrame):
+            Ranked choice ballots from convert_score_ballots_to_implicit_ranks,
+            entrants as the index and one column of ranks per ballot.
+
+        Returns the rankings, a list of (entrant, first choice votes).
         """
-        counts = ranks.apply(lambda s: s.value_counts(), axis=1)
-        
-        if self.original_vote_counts is None:
-            # This will only run the first time
-            self.original_vote_counts = counts
-            self.num_voters = ranks.shape[1]
-
-            if self.N is not None:
-                # Limit ranks to just top N ranks
-                counts = counts[list(range(1,self.N+1))].copy()
-
-        num_first_place_votes = counts[1].max()
- 
-        # Majority Win
-        if num_first_place_votes > self.num_voters/2:
-            self.win_type = "majority"
-            vote_counts = counts[1].copy().dropna()
-            self.rankings = self.counts_series_into_rankings(vote_counts)
-            return self.rankings
-
-        # Only two contestants left
-        elif counts.shape[0] == 2:
-            self.win_type = "plurality"
-            vote_counts = counts[1].copy().dropna()
-            self.rankings = self.counts_series_into_rankings(vote_counts)
-            return self.rankings
-
-        # No majority win. Remove the person with the least 1st place ranks
-        else:
+        order = np.argsort(ranks.values, axis=0, kind="stable").T
+        offsets = np.arange(order.shape[0] + 1) * order.shape[1]
+        ballots = RankedBallots(order.ravel(), offsets, ranks.shape[0], ranks.index)
+        return self.tally(ballots)
+
+
+    def tally(self, ballots):
+        """
+        Instant runoff. Each ballot keeps a pointer to its highest choice who
+        hasn't been eliminated. Each round the entrants with the fewest first
+        choice votes are dropped. Only the ballots pointing at them move their
+        pointers down, and the counts are updated from just those ballots.
+
+        ballots (RankedBallots or pd.DataFrame):
+            Ranked ballots, or score ballots with NaN for unranked entrants.
+
+        Returns the rankings, a list of (entrant, first choice votes) for the
+        entrants still standing, most votes first.
+        """
+        if isinstance(ballots, pd.DataFrame):
+            ballots = RankedBallots.from_dataframe(ballots)
+        if self.N is not None:
+            # Voters only rank their top N
+            ballots = ballots.top(self.N)
+
+        num_candidates = ballots.num_songs
+        self.num_voters = ballots.num_voters
+        song_ids, pointers, ends, choices = first_choices(ballots)
+
+        counts = np.bincount(choices[choices >= 0], minlength=num_candidates)
+        self.original_vote_counts = pd.Series(counts, index=ballots.song_index)
+        standing = np.ones(num_candidates, dtype=bool)
+
+        while True:
+            # Majority Win
+            if counts[standing].max() > self.num_voters/2:
+                self.win_type = "majority"
+                break
+
+            # Only two contestants left
+            elif standing.sum() <= 2:
+                self.win_type = "plurality"
+                break
+
+            # No majority win. Remove the entrants with the least 1st place votes
+            losers = standing & (counts == counts[standing].min())
+            if losers.sum() == standing.sum():
+                # Everyone left is tied
+                self.win_type = "plurality"
+                break
+
             self.eliminations += 1
-            # TODO: This ignores people with no (NaN) first place votes. 
-            # They should be dropped first.
-            loser_indices = np.where(counts[1] == counts[1].min())[0]
-            loser_names = counts.index[loser_indices]
-            self.dropped_candidates.append(loser_names)
+            self.dropped_candidates.append(ballots.song_index[losers])
+            standing[losers] = False
+
+            # Move the pointers of ballots whose choice was just dropped
+            moving = np.flatnonzero((choices >= 0) & losers[choices])
+            counts -= np.bincount(choices[moving], minlength=num_candidates)
+            advance_ballots(song_ids, pointers, ends, choices, moving, standing)
+            new_choices = choices[moving]
+            counts += np.bincount(new_choices[new_choices >= 0], minlength=num_candidates)
 
-            # Find ballots that had this guac as their #1
-            ballot_mask = (ranks.loc[loser_names] == 1).any(axis=0)
-            ballot_names = ranks.columns[ballot_mask.values]
+        # Entrants still standing without any votes stay in, last
+        vote_counts = pd.Series(counts, index=ballots.song_index)[standing]
+        self.rankings = self.counts_series_into_rankings(vote_counts)
+        return self.rankings
 
-            new_ranks = ranks.drop(index=loser_names)
-            for col in ballot_names:
-                new_ranks[col] = new_ranks[col].apply(lambda r: r-1)
 
-            return self.tally_results(new_ranks)
+    @property
+    def ordering(self):
+        """
+        Every entrant, from the winner down: those still standing by votes,
+        then those dropped, the last to be dropped first.
+        """
+        ordering = [name for name, _ in self.rankings]
+        for dropped in reversed(self.dropped_candidates):
+            ordering += dropped.tolist()
+        return ordering
 
 
     def counts_series_into_rankings(self, vote_counts):
         tallies = [(name, int(count)) for name, count in vote_counts.items()]
         rankings = sorted(tallies, key=lambda x: x[1], reverse=True)
         return rankings
-
-
-
-
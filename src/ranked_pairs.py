@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+
+class RankedPairs:
+    def __init__(self, pairwise_sums, n_winners=10, song_index=None, chunk_size=4096):
+        """
+        Ranked Pairs (Tideman) on a Condorcet pairwise_sums matrix. Head to
+        head wins are locked in from the biggest margin down, skipping any
+        that would make a cycle with the ones already locked. The ranking
+        follows the locked wins.
+
+        Pairs are taken chunk_size at a time, and wins that can't make a
+        cycle are locked together, see lock_pairs.
+
+        n_winners (int):
+            How many of the top songs to keep in top_nominee_ids. The whole
+            ranking is in ranking.
+        """
+        self.pairwise_sums = np.asarray(pairwise_sums)
+        self.n_winners = n_winners
+        self.chunk_size = chunk_size
+        if song_index is None:
+            song_index = pd.RangeIndex(self.pairwise_sums.shape[0])
+        self.song_index = song_index
+
+        self.majority = self.pairwise_sums > self.pairwise_sums.T
+        self.copeland_scores = self.majority.sum(axis=1)
+        self.locked = self.lock_pairs()
+        self.ranking = self.rank()
+        self.top_nominee_ids = self.ranking[:n_winners]
+        self.winners = self.song_index[self.top_nominee_ids].tolist()
+
+
+    def sorted_pairs(self):
+        """
+        Every head to head win, biggest margin first. Equal margins go to the
+        win with more votes, then by song positions.
+        """
+        winners, losers = np.nonzero(self.majority)
+        votes = self.pairwise_sums[winners, losers]
+        margins = votes - self.pairwise_sums[losers, winners]
+        order = np.lexsort((losers, winners, -votes, -margins))
+        return winners[order], losers[order]
+
+
+    def lock_pairs(self):
+        """
+        Returns locked, where locked[a, b] is True when a's win over b was
+        locked in.
+
+        The songs are kept in an order that every locked win agrees with,
+        starting from the Copeland order. A win that agrees with the order
+        can't make a cycle, so runs of those are locked all at once. A win
+        that goes against the order makes a cycle only if the loser already
+        reaches the winner, which only needs a search through the songs 
+        between them in the order. If it is locked, just those songs are
+        reordered (Pearce and Kelly's dynamic topological sort).
+        """
+        num_songs = self.pairwise_sums.shape[0]
+        locked = np.zeros((num_songs, num_songs), dtype=bool)
+        # The same wins by loser, so searching back from a song reads rows
+        locked_by = np.zeros((num_songs, num_songs), dtype=bool)
+        order = np.lexsort((np.arange(num_songs), -self.copeland_scores))
+        position = np.empty(num_songs, dtype=int)
+        position[order] = np.arange(num_songs)
+        winners, losers = self.sorted_pairs()
+
+        for start in range(0, winners.shape[0], self.chunk_size):
+            chunk_winners = winners[start:start+self.chunk_size]
+            chunk_losers = losers[start:start+self.chunk_size]
+
+            # Wins against the order whose loser already beats the winner
+            # through one other song can be dropped together. Songs only ever
+            # gain paths, so they'd be dropped when their turn came anyway.
+            against = np.flatnonzero(position[chunk_winners] > position[chunk_losers])
+            cycles = (locked[chunk_losers[against]] & locked_by[chunk_winners[against]]).any(axis=1)
+            kept = np.ones(chunk_winners.shape[0], dtype=bool)
+            kept[against[cycles]] = False
+            chunk_winners, chunk_losers = chunk_winners[kept], chunk_losers[kept]
+
+            while chunk_winners.shape[0]:
+                against = np.flatnonzero(position[chunk_winners] > position[chunk_losers])
+                agree = against[0] if against.size else chunk_winners.shape[0]
+                locked[chunk_winners[:agree], chunk_losers[:agree]] = True
+                locked_by[chunk_losers[:agree], chunk_winners[:agree]] = True
+                if not against.size:
+                    break
+                winner, loser = chunk_winners[agree], chunk_losers[agree]
+                if self.reorder(locked, locked_by, position, winner, loser):
+                    locked[winner, loser] = True
+                    locked_by[loser, winner] = True
+                chunk_winners = chunk_winners[agree+1:]
+                chunk_losers = chunk_losers[agree+1:]
+
+        return locked
+
+
+    @staticmethod
+    def reorder(locked, locked_by, position, winner, loser):
+        """
+        The winner is after the loser in the order. Moves the songs between
+        them so the winner comes first, and returns True, unless the loser 
+        already reaches the winner, in which case it returns False.
+
+        The songs the loser reaches (ahead) and the songs that reach the
+        winner (behind) are searched from both ends at once, a step on the
+        smaller side at a time, and the search stops as soon as they meet.
+        """
+        between = (position >= position[loser]) & (position <= position[winner])
+        ahead = np.zeros_like(between)
+        ahead[loser] = True
+        behind = np.zeros_like(between)
+        behind[winner] = True
+        ahead_frontier = np.array([loser])
+        behind_frontier = np.array([winner])
+
+        while ahead_frontier.size or behind_frontier.size:
+            if ahead_frontier.size and (ahead_frontier.size <= behind_frontier.size 
+                                        or not behind_frontier.size):
+                reached = locked[ahead_frontier].any(axis=0) & between & ~ahead
+                if (reached & behind).any():
+                    return False
+                ahead |= reached
+                ahead_frontier = np.flatnonzero(reached)
+            else:
+                reached = locked_by[behind_frontier].any(axis=0) & between & ~behind
+                if (reached & ahead).any():
+                    return False
+                behind |= reached
+                behind_frontier = np.flatnonzero(reached)
+
+        # Those songs take the same positions, with the winner's side first
+        behind_first = np.concatenate([
+            np.flatnonzero(behind)[np.argsort(position[behind])],
+            np.flatnonzero(ahead)[np.argsort(position[ahead])],
+        ])
+        position[behind_first] = np.sort(position[behind_first])
+        return True
+
+
+    def rank(self):
+        """
+        Songs in tiers: every remaining song that no remaining song beats
+        through locked wins, ordered by Copeland score, then song position.
+        """
+        num_songs = self.pairwise_sums.shape[0]
+        waiting_on = self.locked.sum(axis=0)
+        remaining = np.ones(num_songs, dtype=bool)
+        ranking = []
+        while remaining.any():
+            tier = np.flatnonzero(remaining & (waiting_on == 0))
+            tier = tier[np.lexsort((tier, -self.copeland_scores[tier]))]
+            ranking.extend(tier.tolist())
+            remaining[tier] = False
+            waiting_on -= self.locked[tier].sum(axis=0)
+        return np.array(ranking, dtype=int)
@@ -0,0 +1,191 @@
+'''
+RepeatedSimulations results on disk, without pickling any live objects:
+
+    directory/
+        settings.json                   The contest settings
+        songs.parquet                   The song catalog
+        contests=0-50.parquet           One row per contest: its winners,
+        contests=0-50.npz               fair winner counts and settings, and
+        contests=50-100.parquet         what its contests added to each
+        contests=50-100.npz             accumulator, as the margin and
+        ...                             totals of PairwiseCounts, compressed.
+
+Every call to append adds a new pair of chunks and never touches the old
+ones, so appending costs as much as what's new. Reading only opens the
+chunks, columns and accumulators asked for.
+'''
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .files import temporary_path
+from .pairwise_counts import PairwiseCounts
+from .song_catalog import SongCatalog
+
+
+METHODS = ["condorcet", "current_method", "schulze", "ranked_pairs"]
+ACCUMULATORS = ["sum_of_sums", "sum_of_rankings"]
+
+
+class ResultStore:
+    def __init__(self, directory):
+        """
+        The store in directory, which is made if it doesn't exist yet.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+
+    @property
+    def exists(self):
+        return (self.directory / "settings.json").exists()
+
+
+    @property
+    def settings(self):
+        with open(self.directory / "settings.json") as json_file:
+            return json.load(json_file)
+
+
+    def write_settings(self, settings, song_df):
+        """
+        Saves the settings, a dict of JSON values, and the song catalog, a
+        song_df or SongCatalog. A
+        store keeps one set of settings, so they have to match if it already
+        has some.
+        """
+        settings = json.loads(json.dumps(settings, default=int))
+        if self.exists:
+            if self.settings != settings:
+                raise ValueError(f"{self.directory} holds results for other settings: {self.settings}")
+            return
+        SongCatalog.of(song_df).write(self.directory / "songs.parquet")
+        temporary = temporary_path(self.directory / "settings.json")
+        with open(temporary, "w") as json_file:
+            json.dump(settings, json_file, indent=4)
+        os.replace(temporary, self.directory / "settings.json")
+
+
+    def song_df(self):
+        return SongCatalog.read(self.directory / "songs.parquet").song_df
+
+
+    @property
+    def chunks(self):
+        """
+        The name of every chunk, in contest order. A chunk's parquet file is
+        written last, so a chunk only counts once it's there.
+        """
+        chunks = [path.stem for path in self.directory.glob("contests=*.parquet")]
+        return sorted(chunks, key=lambda chunk: int(chunk.split("=")[1].split("-")[0]))
+
+
+    def append(self, records, accumulators):
+        """
+        records (pd.DataFrame):
+            One row per new contest, with a contest column, see
+            contest_records.
+        accumulators (dict):
+            {name: what the new contests added to it}, as PairwiseCounts or
+            N x N arrays of whole numbers. Either way they're saved as
+            PairwiseCounts, in their smallest integer types.
+
+        Contests the store already has can't be appended again.
+        """
+        if records.empty:
+            return
+        contests = records["contest"].to_numpy()
+        known = self.contests(columns=["contest"])["contest"]
+        if np.isin(contests, known).any():
+            raise ValueError(f"{self.directory} already has contests {sorted(set(known) & set(contests))}")
+
+        chunk = f"contests={contests.min()}-{contests.max() + 1}"
+        arrays = {}
+        for name, counts in accumulators.items():
+            if not isinstance(counts, PairwiseCounts):
+                counts = PairwiseCounts(len(counts)).add(np.asarray(counts))
+            for part, array in counts.arrays().items():
+                arrays[f"{name}_{part}"] = array
+        temporary = temporary_path(self.directory / f"{chunk}.npz")
+        np.savez_compressed(temporary, **arrays)
+        os.replace(temporary, self.directory / f"{chunk}.npz")
+
+        table = pa.Table.from_pandas(records, preserve_index=False)
+        temporary = temporary_path(self.directory / f"{chunk}.parquet")
+        pq.write_table(table, temporary)
+        os.replace(temporary, self.directory / f"{chunk}.parquet")
+
+
+    def contests(self, columns=None, contests=None):
+        """
+        The contest records as a DataFrame, in contest order. Only reads the
+        columns asked for, and with contests, only those contests' rows.
+        """
+        paths = [self.directory / f"{chunk}.parquet" for chunk in self.chunks]
+        if not paths:
+            return pd.DataFrame(columns=columns or ["contest"])
+        if columns is not None and "contest" not in columns:
+            columns = ["contest"] + list(columns)
+        filters = None if contests is None else [("contest", "in", [int(ii) for ii in contests])]
+        tables = [pq.read_table(path, columns=columns, filters=filters) for path in paths]
+        records = concat_tables(tables).to_pandas()
+        return records.sort_values("contest", kind="stable").reset_index(drop=True)
+
+
+    def counts(self, name):
+        """
+        One accumulator over every chunk, as PairwiseCounts, without loading
+        the others. None if there aren't any chunks.
+        """
+        total = None
+        for chunk in self.chunks:
+            with np.load(self.directory / f"{chunk}.npz") as arrays:
+                if name in arrays:
+                    # Chunks saved as N x N arrays
+                    counts = PairwiseCounts(len(arrays[name])).add(arrays[name])
+                else:
+                    counts = PairwiseCounts.from_arrays(arrays[f"{name}_margin"], arrays[f"{name}_totals"])
+            total = counts if total is None else total.merge(counts)
+        return total
+
+
+    def accumulator(self, name):
+        """One accumulator over every chunk as an N x N int64 array, see counts"""
+        counts = self.counts(name)
+        return None if counts is None else counts.dense()
+
+
+def concat_tables(tables):
+    """
+    pa.concat_tables, filling in columns some chunks don't have with nulls.
+    pyarrow 14 replaced promote=True with promote_options.
+    """
+    if int(pa.__version__.split(".")[0]) >= 14:
+        return pa.concat_tables(tables, promote_options="default")
+    return pa.concat_tables(tables, promote=True)
+
+
+def contest_records(repeated, contests, num_fair_winners):
+    """
+    The records of some of repeated's contests, a DataFrame with a row per
+    contest: its number, the settings, and each method's winners and fair
+    winner count.
+
+    num_fair_winners is {method: [count for each contest]}, since
+    RepeatedSimulations keeps those as lists.
+    """
+    records = {"contest": pd.Series(contests, dtype=np.int64)}
+    for setting in ["num_voters", "listen_limit", "ballot_limit", "num_winners"]:
+        records[setting] = pd.Series([getattr(repeated, setting)] * len(contests), dtype="Int64")
+    for method in METHODS:
+        winners = getattr(repeated, f"{method}_winners")
+        if not winners:
+            continue
+        records[f"{method}_winners"] = [np.asarray(winners[ii], dtype=np.int64) for ii in contests]
+        records[f"num_{method}_fair_winners"] = pd.Series(num_fair_winners[method], dtype=np.int64)
+    return pd.DataFrame(records)
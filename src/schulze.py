@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+from .condorcet_counting import strongly_connected_components
+
+
+def condense(matrix, components):
+    """
+    Which components have an edge into which other components, as a
+    (num_components, num_components) boolean matrix.
+    """
+    order = np.argsort(components, kind="stable")
+    starts = np.flatnonzero(np.diff(components[order], prepend=-1))
+    condensed = np.logical_or.reduceat(matrix[order][:, order], starts, axis=0)
+    condensed = np.logical_or.reduceat(condensed, starts, axis=1)
+    np.fill_diagonal(condensed, False)
+    return condensed
+
+
+def widest_paths_from(strengths, source=0):
+    """
+    The strength of the strongest path from the source to every node, where
+    a path is as strong as its weakest edge. This is Dijkstra's algorithm
+    with min in place of + and max in place of min, one vectorized update 
+    per node.
+    """
+    num_nodes = strengths.shape[0]
+    widths = np.zeros(num_nodes, dtype=strengths.dtype)
+    widths[source] = np.iinfo(strengths.dtype).max
+    done = np.zeros(num_nodes, dtype=bool)
+    for _ in range(num_nodes):
+        node = np.argmax(np.where(done, -1, widths))
+        if done[node] or widths[node] == 0:
+            break
+        done[node] = True
+        np.maximum(widths, np.minimum(widths[node], strengths[node]), out=widths)
+    return widths
+
+
+class Schulze:
+    def __init__(self, pairwise_sums, n_winners=10, song_index=None):
+        """
+        The Schulze method on a Condorcet pairwise_sums matrix. The strength
+        of a path of head to head wins is its weakest win, and song A beats
+        song B when A's strongest path to B is stronger than B's strongest
+        path back to A.
+
+        Rather than finding every widest path with the O(N^3) Floyd-Warshall
+        pass, this uses the strongly connected components of the majority
+        graph. Songs in different components are decided by whether one
+        component has a path to the other. Songs in the same component are
+        decided the same way one level down, by the components that appear
+        when the weakest wins inside it are dropped, and so on. Components
+        are only split when they are needed for the top n_winners, so most
+        of the graph is never looked at.
+
+        n_winners (int):
+            How many of the top songs to rank. None ranks all of them.
+        """
+        self.pairwise_sums = np.asarray(pairwise_sums)
+        self.n_winners = n_winners
+        if song_index is None:
+            song_index = pd.RangeIndex(self.pairwise_sums.shape[0])
+        self.song_index = song_index
+
+        self.majority = self.pairwise_sums > self.pairwise_sums.T
+        self.strengths = np.where(self.majority, self.pairwise_sums, 0).astype(np.int64)
+        self.copeland_scores = self.majority.sum(axis=1)
+        self.ranking = self.rank(n_winners)
+        self.top_nominee_ids = self.ranking[:n_winners]
+        self.winners = self.song_index[self.top_nominee_ids].tolist()
+
+
+    def split(self, group):
+        """
+        The components a strongly connected group of songs falls into when
+        its weakest link is dropped, along with the wins between them. The
+        weakest link is the weakest of the strongest paths from the first
+        song to everyone else and back.
+        """
+        strengths = self.strengths[np.ix_(group, group)]
+        weakest_link = min(widest_paths_from(strengths).min(),
+                           widest_paths_from(strengths.T).min())
+        adjacency = strengths > weakest_link
+        return strongly_connected_components(adjacency), adjacency
+
+
+    def tiers(self, group, components, adjacency):
+        """
+        Yields the group's songs a tier at a time. A tier is every remaining
+        song that no other remaining song beats. Each component contributes
+        its own next tier once every component with a path into it is used 
+        up.
+        """
+        condensed = condense(adjacency, components)
+        waiting_on = condensed.sum(axis=0)
+        members = np.split(group[np.argsort(components, kind="stable")],
+                           np.cumsum(np.bincount(components))[:-1])
+        num_left = np.array([len(songs) for songs in members])
+        subtiers = {}
+
+        while num_left.any():
+            tier = []
+            for component in np.flatnonzero((waiting_on == 0) & (num_left > 0)):
+                songs = members[component]
+                if songs.shape[0] == 1:
+                    tier.append(songs)
+                else:
+                    if component not in subtiers:
+                        subtiers[component] = self.tiers(songs, *self.split(songs))
+                    tier.append(next(subtiers[component]))
+                num_left[component] -= tier[-1].shape[0]
+                if num_left[component] == 0:
+                    waiting_on -= condensed[component]
+            yield np.concatenate(tier)
+
+
+    def rank(self, n=None):
+        """The top n songs, tier by tier, by Copeland score then position within a tier"""
+        num_songs = self.pairwise_sums.shape[0]
+        if n is None:
+            n = num_songs
+
+        ranking = []
+        songs = np.arange(num_songs)
+        components = strongly_connected_components(self.majority)
+        for tier in self.tiers(songs, components, self.majority):
+            tier = tier[np.lexsort((tier, -self.copeland_scores[tier]))]
+            ranking.extend(tier.tolist())
+            if len(ranking) >= n:
+                break
+        return np.array(ranking[:n], dtype=int)
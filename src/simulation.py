@@ -1,89 +1,45 @@
-import os
+import shutil
 from pathlib import Path
 # from random import shuffle
-import pickle
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
 
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from stqdm import stqdm
 
-from .condorcet_counting import Condorcet
+from .ballots import RankedBallots
+from .condorcet_counting import Condorcet, CondorcetAccumulator
 from .current_method import OneVotePerFinalist
+from .ranked_choice_voting import RankChoiceVoting
+from .single_transferable_vote import SingleTransferableVote
+from .fused_tally import FusedTally
+from .schulze import Schulze
+from .ranked_pairs import RankedPairs
+from .contest_batch import ContestBatch
+from .counter_rng import CounterRNG, VoterDraws
+from .result_store import ResultStore, contest_records, METHODS, ACCUMULATORS
+from .pairwise_counts import PairwiseCounts, smallest_int
+from .ballot_archive import BallotArchive, CAST_SETTINGS
+from .song_catalog import SongCatalog, REPO_ROOT_DIR, DATA_DIR
+from .song_catalog import generate_objective_scores, apply_song_names, change_values
 
 
 # Move this!
 # np.random.seed(42)
 
+# Every way a Simulation can pick winners, as in self.<method>_winners
+WINNER_METHODS = ["condorcet", "current_method", "rcv", "stv", "sum", "mean",
+                  "borda", "fptp", "schulze", "ranked_pairs"]
 
-REPO_ROOT_DIR = Path(__file__).parent.parent
-DATA_DIR = REPO_ROOT_DIR / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-
-def load_or_generate_objective_scores(num_songs):
+def load_or_generate_objective_scores(num_songs, mean=50, std=15, seed=None):
     """
-    In order for each simulation to see the same set of songs, we need to 
-    generate them once and save them.
+    The song_df of the SongCatalog with these parameters, generated the
+    first time and saved, see SongCatalog.load_or_generate.
     """
-    filename = f"objective_scores_for_{num_songs}_songs.pkl"
-    filepath = DATA_DIR / filename
-
-    if os.path.exists(filepath):
-        song_df = pd.read_pickle(filepath)
-
-    else:
-        song_df = generate_objective_scores(num_songs)
-        song_df.to_pickle(filepath)
-
-    return song_df
-
-
-def generate_objective_scores(num_songs):
-    # These parameters could become variables later, but likely not
-    _mean = 50
-    _std = 15
-
-    objective_scores = np.random.normal(loc=_mean, scale=_std, size=num_songs)
-    song_df = pd.DataFrame(objective_scores, columns=["Objective Ratings"])
-
-    
-    song_df = apply_song_names(song_df)
-    
-    return song_df
-
-
-def apply_song_names(df):
-    df["ID"] = df.index
-    df["index"] = df.index
-
-    filepath = DATA_DIR / "song_names/Top Scoring Songs.csv"
-    top_scoring_names = pd.read_csv(filepath)
-    df = df.sort_values(by="Objective Ratings", ascending=False)
-    df = change_values(df, top_scoring_names)
-
-    df = df.sort_values(by="index", ascending=True)
-    df.drop(columns=["index"], inplace=True)
-
-    filepath = DATA_DIR / "song_names/All Song Names.csv"
-    first_names = pd.read_csv(filepath)
-    df = change_values(df, first_names)
-    return df
-
-
-def change_values(df, fictional_names):
-    fictional_names = fictional_names["Song Name by Artist"].values
-    ii = 0
-    for song_name in fictional_names:
-        if song_name not in df["ID"].values:
-            try:
-                df["ID"].iloc[ii] = song_name
-                ii += 1
-            except IndexError:
-                # Fictional Names is longer than song_df. This occurs when testing
-                # with small numbers
-                pass
-    return df
+    return SongCatalog.load_or_generate(num_songs, mean, std, seed).song_df
 
 
 class Simulation:
@@ -92,15 +48,18 @@ class Simulation:
             listen_limit=None, ballot_limit=None, num_winners=10, 
             num_mafiosos=0, mafia_size=0,
             name=None, alphabetical=False, methods=["condorcet"],
+            batched=True, tally_engine="batched", keep_ballots=True,
+            num_threads=None, shard_size=None, seed=None, contest=0,
         ):
-        self.song_df = song_df
+        self.catalog = SongCatalog.of(song_df)
+        self.song_df = self.catalog.song_df
         self.num_voters = num_voters
         self.st_dev = st_dev
         
         if listen_limit:
             self.listen_limit = listen_limit
         else:
-            self.listen_limit = song_df.shape[0]
+            self.listen_limit = self.song_df.shape[0]
         
         self.ballot_limit = ballot_limit
         self.num_winners = num_winners
@@ -109,13 +68,36 @@ class Simulation:
         self.name = name
         self.alphabetical = alphabetical
         self.methods = methods
+        self.batched = batched
+        self.tally_engine = tally_engine
+        self.keep_ballots = keep_ballots
+        self.num_threads = num_threads
+        self.shard_size = shard_size
+        self.seed = seed
+        self.contest = contest
 
         # Initalizing
         self.success = False
         self.rankings = None
         self.complete = False
-        self.condorcet_winners = []
-        self.current_method_winners = []
+        for method in WINNER_METHODS:
+            setattr(self, f"{method}_winners", [])
+        self.fused_tally = None
+        self.archive = None
+
+
+    @classmethod
+    def from_archive(cls, directory, **settings):
+        """
+        A Simulation that tallies the ballots in a BallotArchive instead of
+        casting new ones. The archive sets the songs, voters and everything
+        else the ballots depend on. settings are the rest, e.g. num_winners,
+        methods or num_mafiosos, and can be changed freely between replays.
+        """
+        archive = BallotArchive(directory)
+        sim = cls(archive.song_df(), **archive.settings, **settings)
+        sim.archive = archive
+        return sim
 
 
     @property
@@ -129,8 +111,37 @@ class Simulation:
         return param_dict
 
 
-    def simulate(self):
-        """TODO: For unittests, we can update this to have inputs and outputs"""
+    def simulate(self, on_batch=None):
+        """
+        TODO: For unittests, we can update this to have inputs and outputs
+
+        With keep_ballots=False the ballots are streamed straight into the
+        tally instead, and on_batch(self) is called after each batch.
+
+        With num_threads or a seed set, the voters are split into shards that
+        are cast and counted on that many threads, see vote_in_shards.
+
+        A Simulation made by from_archive doesn't cast anything, it tallies
+        the archived ballots, see replay.
+        """
+        if self.archive is not None:
+            self.replay()
+            return
+
+        if (self.num_threads or self.seed is not None) and on_batch is None:
+            self.reset_ballots()
+            fused_tally = self.vote_in_shards()
+            self.tally_votes(fused_tally)
+            self.record_consistency()
+            self.complete = True
+            return
+
+        if not self.keep_ballots:
+            self.stream_votes(on_batch)
+            self.record_consistency()
+            self.complete = True
+            return
+
         self.reset_ballots()
         self.cast_ballots()
         if self.num_mafiosos:
@@ -141,6 +152,40 @@ class Simulation:
         self.complete = True
 
 
+    def write_ballots(self, directory):
+        """
+        Saves this contest's honest ballots, before any mafia, to a
+        BallotArchive in directory, so they can be tallied again without
+        casting them again. The contest has to have been simulated with
+        keep_ballots.
+        """
+        name = "non_corrupt_ballots" if self.num_mafiosos else "ballots"
+        ballots = getattr(self, name, None)
+        if not isinstance(ballots, RankedBallots):
+            raise ValueError("There are no ballots to write. Simulate with keep_ballots=True first.")
+        settings = {name: getattr(self, name) for name in CAST_SETTINGS}
+        return BallotArchive.write(directory, ballots, self.listen_counts["Listen Count"].values,
+                                   self.catalog, settings)
+
+
+    def replay(self):
+        """
+        Tallies the archived ballots. They're read straight from the
+        memory-mapped archive, unless there's a mafia, when a copy of them is
+        corrupted.
+        """
+        self.reset_ballots()
+        self.ballots = self.archive.ballots(song_index=self.song_df.index)
+        self.listen_counts["Listen Count"] = self.archive.listen_counts()
+        if self.num_mafiosos:
+            self.non_corrupt_ballots = self.ballots
+            self.ballots = self.ballots.copy()
+            self.corrupt_ballots()
+        self.tally_votes()
+        self.record_consistency()
+        self.complete = True
+
+
     def reset_ballots(self):
         song_indices = list(self.song_df.index)
         self.ballots = pd.DataFrame(song_indices, columns=["ID"])
@@ -161,8 +206,21 @@ class Simulation:
         each cast a vote. Once the simulation was simplified that process
         proved unnecessary.
 
-        The objective scores are already sorted, so when enforcing a ballot
-        limit, only the beginning rows of the dataframe will have results.
+        By default the ballots are cast in batches of voters with whole-array
+        operations. Set batched=False to cast them one voter at a time.
+        Either way, self.ballots ends up as RankedBallots.
+        """
+        if self.batched:
+            self.cast_ballots_in_batches()
+        else:
+            self.cast_ballots_one_at_a_time()
+
+
+    def cast_ballots_one_at_a_time(self):
+        """
+        The original voting loop. The objective scores are already sorted, so 
+        when enforcing a ballot limit, only the beginning rows of the 
+        dataframe will have results.
         """
         listen_and_vote = lambda score: np.random.normal(score, self.st_dev)
 
@@ -186,65 +244,406 @@ class Simulation:
                 bllt = bllt.sort_values(ascending=False).head(self.ballot_limit)
             self.ballots[ii] = bllt
 
+        self.ballots = RankedBallots.from_dataframe(self.ballots)
+
+
+    def cast_ballots_in_batches(self, batch_size=None):
+        """
+        Draws the listening samples, the noisy scores and the ballot limit for
+        a whole batch of voters at once. Listen counts are a bincount of the
+        sampled songs. The ballots come out the same shape as the one voter at 
+        a time loop, but stored as RankedBallots.
+        """
+        ballot_batches = []
+        listen_counts = np.zeros(self.song_df.shape[0], dtype=int)
+        for _, ballots, batch_listen_counts in self.generate_ballot_batches(batch_size):
+            ballot_batches.append(ballots)
+            listen_counts += batch_listen_counts
+
+        self.ballots = RankedBallots.concatenate(ballot_batches)
+        self.listen_counts["Listen Count"] = listen_counts
+
 
-    def corrupt_ballots(self):
-        """TKTK"""      
-        high_score = self.ballots.max().max()
+    def generate_ballot_batches(self, batch_size=None):
+        """
+        Yields (first voter, RankedBallots, listen counts) for each batch of
+        voters in turn.
+        """
+        num_songs = self.song_df.shape[0]
+        if batch_size is None:
+            # Keeps the (voters, songs) random draws to a few million floats
+            batch_size = max(1, 2**21 // num_songs)
+
+        batch_starts = range(0, self.num_voters, batch_size)
+        for start in stqdm(batch_starts, desc="Voting"):
+            num_voters = min(batch_size, self.num_voters - start)
+            ballots, listen_counts = self.cast_batch(num_voters)
+            yield start, ballots, listen_counts
+
+
+    def cast_batch(self, num_voters, rng=np.random):
+        """
+        Returns RankedBallots and listen counts for num_voters voters. The
+        random draws come from rng, the global np.random by default, a
+        np.random.Generator, or a block of voters' counter-based draws from 
+        CounterRNG.for_voters.
+        """
+        songs, bllts, ranked, listen_counts = self.draw_ballot_rows(num_voters, rng)
+        ballots = RankedBallots.from_score_rows(
+            songs, bllts, ranked, self.song_df.shape[0], song_index=self.song_df.index)
+        return ballots, listen_counts
 
+
+    def draw_ballot_rows(self, num_voters, rng=np.random):
+        """
+        The draws behind cast_batch, one row per voter: the songs each voter
+        sampled, their scores for them, which of them made the ballot, and
+        the listen counts.
+        """
+        num_songs = self.song_df.shape[0]
+        objective_scores = self.song_df["Objective Ratings"].values
+        songs, listened = self.draw_listening_samples(num_voters, rng)
+
+        # Individual Ballots, one row per voter
+        bllts = rng.normal(objective_scores[songs], self.st_dev)
+        listen_counts = np.bincount(songs[listened], minlength=num_songs)
+
+        ranked = listened
+        if self.ballot_limit is not None and self.ballot_limit < songs.shape[1]:
+            unheard = np.where(listened, -bllts, np.inf)
+            top = np.argpartition(unheard, self.ballot_limit - 1, axis=1)
+            top = top[:, :self.ballot_limit]
+            ranked = np.zeros_like(listened)
+            np.put_along_axis(ranked, top, True, axis=1)
+            ranked &= listened
+
+        return songs, bllts, ranked, listen_counts
+
+
+    def plan_shards(self):
+        """Returns [(first voter, number of voters), ...], one per shard"""
+        shard_size = self.shard_size
+        if shard_size is None:
+            shard_size = max(1, 2**21 // self.song_df.shape[0])
+        return [(start, min(shard_size, self.num_voters - start))
+                for start in range(0, self.num_voters, shard_size)]
+
+
+    def counter_rng(self):
+        """
+        The counter-based draws for this contest, keyed by self.seed and
+        self.contest. Without a seed, one is taken from np.random and kept.
+        """
+        if self.seed is None:
+            self.seed = int(np.random.randint(2**62))
+        return CounterRNG(self.seed, self.contest)
+
+
+    def rebuild_ballot(self, voter):
+        """
+        Draws one voter's ballot again, in O(listen_limit), from the seed of
+        a run that used the counter-based draws. Returns their scores in 
+        ballot order, highest first, indexed by song, after any mafia got to
+        them.
+        """
+        if self.seed is None:
+            raise ValueError("Only ballots drawn from a seed can be rebuilt.")
+        ballots, _ = self.cast_batch(1, self.counter_rng().for_voters(voter, 1))
+        self.corrupt_ballots(ballots, first_voter=voter)
+        return pd.Series(ballots.scores, index=self.song_df.index[ballots.song_ids])
+
+
+    def vote_in_shards(self):
+        """
+        Casts and counts the ballots a shard of voters at a time, with
+        num_threads shards in flight at once. Returns the FusedTally of all
+        of them.
+
+        Each shard draws its voters' counter-based draws, see counter_rng,
+        and counts its own partial FusedTally. A voter's draws only depend on
+        the seed, the contest and who they are. The compiled kernels and
+        most of NumPy let go of the GIL while they run, so the shards really
+        do run side by side. The partial tallies are added up in shard order
+        at the end. Shards are shard_size voters no matter how many threads
+        there are, so the results don't depend on num_threads.
+
+        The ballots are only kept, in self.ballots, with keep_ballots.
+        """
+        if not self.keep_ballots and set(self.methods) & {"rcv", "stv"}:
+            raise ValueError("Instant runoff and STV need the ballots. Use keep_ballots=True.")
+
+        num_songs = self.song_df.shape[0]
+        shards = self.plan_shards()
+        rng = self.counter_rng()
+
+        def vote(shard):
+            start, num_voters = shard
+            ballots, listen_counts = self.cast_batch(num_voters, rng.for_voters(start, num_voters))
+            non_corrupt_ballots = None
+            if self.num_mafiosos:
+                if self.keep_ballots:
+                    non_corrupt_ballots = ballots.copy()
+                self.corrupt_ballots(ballots, first_voter=start)
+            tally = FusedTally(num_songs, self.num_winners, song_index=self.song_df.index)
+            block_size, count = Condorcet.plan_blocks(ballots)
+            for block_start in range(0, ballots.num_voters, block_size):
+                tally.add_ballots(ballots[block_start:block_start+block_size], count)
+            if not self.keep_ballots:
+                ballots = None
+            return ballots, non_corrupt_ballots, listen_counts, tally
+
+        with ThreadPoolExecutor(self.num_threads or 1) as pool:
+            shards = list(stqdm(pool.map(vote, shards), total=len(shards), desc="Voting"))
+
+        fused_tally = FusedTally(num_songs, self.num_winners, song_index=self.song_df.index)
+        listen_counts = np.zeros(num_songs, dtype=int)
+        for _, _, shard_listen_counts, tally in shards:
+            fused_tally.merge(tally)
+            listen_counts += shard_listen_counts
+        self.listen_counts["Listen Count"] = listen_counts
+
+        self.ballots = None
+        if self.keep_ballots:
+            self.ballots = RankedBallots.concatenate([shard[0] for shard in shards])
+            if self.num_mafiosos:
+                self.non_corrupt_ballots = RankedBallots.concatenate(
+                    [shard[1] for shard in shards])
+        return fused_tally
+
+
+    def stream_votes(self, on_batch=None, num_updates=10):
+        """
+        Casts the ballots batch by batch and feeds each batch straight into a
+        CondorcetAccumulator, so memory doesn't grow with the number of 
+        voters. Only the condorcet method can be tallied this way.
+
+        Batches are kept small enough that on_batch gets called about
+        num_updates times.
+        """
+        if set(self.methods) - {"condorcet"}:
+            raise ValueError("Only the condorcet method can be streamed. Use keep_ballots=True.")
+
+        self.reset_ballots()
+        self.ballots = None
+        self.condorcet = CondorcetAccumulator(self.song_df.shape[0],
+            self.num_winners, song_index=self.song_df.index)
+        listen_counts = np.zeros(self.song_df.shape[0], dtype=int)
+
+        batch_size = min(max(1, 2**21 // self.song_df.shape[0]),
+                         -(-self.num_voters // num_updates))
+        for start, ballots, batch_listen_counts in self.generate_ballot_batches(batch_size):
+            if self.num_mafiosos:
+                self.corrupt_ballots(ballots, first_voter=start)
+            self.condorcet.add_ballots(ballots)
+            listen_counts += batch_listen_counts
+            self.condorcet_winners = self.condorcet.top_nominee_ids
+            if on_batch is not None:
+                on_batch(self)
+
+        self.listen_counts["Listen Count"] = listen_counts
+
+
+    def draw_listening_samples(self, num_voters, rng=np.random):
+        """
+        Returns a (num_voters, sample size) array of song positions and a 
+        boolean mask of which of them were actually listened to. The mask only
+        matters for the alphabetical contest, where each voter listens to a
+        different number of songs from the top of the list.
+
+        The draws come from rng, see cast_batch.
+        """
+        num_songs = self.song_df.shape[0]
+
+        if self.alphabetical:
+            listen_limits = rng.normal(loc=100, scale=15, size=num_voters)
+            listen_limits = np.clip(listen_limits.astype(int), 0, num_songs)
+            sample_size = max(listen_limits.max(), 1)
+            songs = np.broadcast_to(np.arange(sample_size), (num_voters, sample_size))
+            listened = songs < listen_limits[:, None]
+
+        elif self.listen_limit >= num_songs:
+            songs = np.broadcast_to(np.arange(num_songs), (num_voters, num_songs))
+            listened = np.ones(songs.shape, dtype=bool)
+
+        elif isinstance(rng, VoterDraws):
+            # Counter-based draws shuffle just the listen_limit songs needed
+            songs = rng.sample(num_songs, self.listen_limit)
+            listened = np.ones(songs.shape, dtype=bool)
+
+        else:
+            # Sampling without replacement: the smallest listen_limit of a row
+            # of uniform draws is a uniformly random subset of the songs.
+            draws = rng.random((num_voters, num_songs))
+            songs = np.argpartition(draws, self.listen_limit - 1, axis=1)
+            songs = songs[:, :self.listen_limit]
+            listened = np.ones(songs.shape, dtype=bool)
+
+        return songs, listened
+
+
+    def corrupt_ballots(self, ballots=None, first_voter=0):
+        """
+        Each mafia boss gets their members to move the boss's song to the top
+        of their ballots. Members who never heard the song can't vote for it.
+
+        By default this corrupts self.ballots. A batch of ballots can be 
+        passed instead, along with the voter number it starts at.
+        """
+        if ballots is None:
+            ballots = self.ballots
+
+        for ii_song, voter_start, voter_stop in self.mafia_targets():
+            voter_start = max(voter_start - first_voter, 0)
+            voter_stop = min(voter_stop - first_voter, ballots.num_voters)
+            corrupt_voter_ids = range(voter_start, voter_stop)
+
+            # Change votes
+            ballots.promote(ii_song, corrupt_voter_ids)
+
+
+    def mafia_targets(self):
+        """
+        Returns [(song position, first voter, stop voter), ...], the song 
+        each mafia boss pushes and the range of voters in their mafia.
+        """
         # percentile = 66
         percentile = 88
         step_down = 1
-        percentile_ranks = self.song_df["Objective Ratings"].rank(pct=True)
+        targets = []
         for ii_boss in range(self.num_mafiosos):
             # Which song
-            ii_song = self.song_df[percentile_ranks == percentile/100].index[0]
+            ii_song = self.catalog.position_at_percentile(percentile)
 
             # Which voters
             voter_start = int(ii_boss*self.mafia_size)
             voter_stop = int((ii_boss+1)*self.mafia_size)
-            corrupt_voter_ids = range(voter_start, voter_stop)
-            voter_columns = [col for col in self.ballots.columns if col in corrupt_voter_ids]
-
-            # Change votes
-            # By converting it to a boolean first, I only increate score values
-            # if they were already non-null, i.e. votes were already cast
-            vote_cast = self.ballots.loc[ii_song, voter_columns].apply(
-                lambda x: int(~np.isnan(x))
-            )
-            voter_columns = tuple(voter_columns)
-            self.ballots.at[ii_song, voter_columns] = vote_cast * high_score
+            targets.append((ii_song, voter_start, voter_stop))
 
             # Set Next Song
             percentile -= step_down
+        return targets
+
 
+    def tally_votes(self, fused_tally=None):
+        """
+        With the batched tally_engine, the ballots are read once by a
+        FusedTally and each method only picks out the counts it needs. 
+        Instant runoff and STV work through the ballots round by round, so
+        they still read them on their own.
+
+        fused_tally can be passed in when the ballots were already counted,
+        e.g. by vote_in_shards.
+        """
+        self.fused_tally = fused_tally
+        if self.fused_tally is None and self.tally_engine == "batched":
+            self.fused_tally = FusedTally(self.song_df.shape[0], self.num_winners,
+                                    song_index=self.song_df.index)
+            self.fused_tally.tally(self.ballots)
 
-    def tally_votes(self):
         if "condorcet" in self.methods:
             self.condorcet_winners = self.tally_by_condorcet_method()
 
         if "current" in self.methods:
             self.current_method_winners = self.tally_by_current_method()
 
+        if "rcv" in self.methods:
+            self.rcv_winners = self.tally_by_rcv()
+
+        if "stv" in self.methods:
+            self.stv_winners = self.tally_by_stv()
+
+        for method in ["sum", "mean", "borda", "fptp"]:
+            if method in self.methods:
+                setattr(self, f"{method}_winners", self.tally_by_totals(method))
+
+        if "schulze" in self.methods:
+            self.schulze_winners = self.tally_by_schulze()
+
+        if "ranked_pairs" in self.methods:
+            self.ranked_pairs_winners = self.tally_by_ranked_pairs()
+
 
     def tally_by_condorcet_method(self):
         """
         Simplified Condorcet method that simply returns the top 10 nominees.
+        The tally_engine is passed along to pick how Condorcet tallies.
         """
-        self.condorcet = Condorcet(self.ballots, self.num_winners)
+        pairwise_sums = None
+        if self.fused_tally is not None:
+            pairwise_sums = self.fused_tally.pairwise_sums.astype(float)
+        self.condorcet = Condorcet(self.ballots, self.num_winners, 
+            engine=self.tally_engine, pairwise_sums=pairwise_sums)
         winners = self.condorcet.top_nominee_ids
         return winners
     
 
     def tally_by_current_method(self):
-        self.current_method = OneVotePerFinalist(self.ballots, self.num_winners)
+        vote_totals = None
+        if self.fused_tally is not None:
+            vote_totals = self.fused_tally.results("current")
+        self.current_method = OneVotePerFinalist(self.ballots, self.num_winners, vote_totals)
         winners = self.current_method.winners
         return winners
 
 
+    def tally_by_rcv(self):
+        """
+        Instant runoff on the ranked ballots. The finalists are the winner
+        followed by the last songs to be eliminated.
+        """
+        self.rcv = RankChoiceVoting()
+        self.rcv.tally(self.ballots)
+        winners = self.rcv.ordering[:self.num_winners]
+        return winners
+
+
+    def tally_by_stv(self):
+        """Single transferable vote, electing num_winners finalists at once"""
+        self.stv = SingleTransferableVote(self.num_winners)
+        winners = self.stv.tally(self.ballots)
+        return winners
+
+
+    def get_pairwise_sums(self):
+        """Pairwise sums from whichever tally already has them"""
+        if self.fused_tally is not None:
+            return self.fused_tally.pairwise_sums
+        if "condorcet" in self.methods:
+            return self.condorcet.pairwise_sums
+        return Condorcet(self.ballots, self.num_winners, break_ties=False,
+                         engine=self.tally_engine).pairwise_sums
+
+
+    def tally_by_schulze(self):
+        self.schulze = Schulze(self.get_pairwise_sums(), self.num_winners,
+                               song_index=self.song_df.index)
+        return self.schulze.winners
+
+
+    def tally_by_ranked_pairs(self):
+        self.ranked_pairs = RankedPairs(self.get_pairwise_sums(), self.num_winners,
+                                        song_index=self.song_df.index)
+        return self.ranked_pairs.winners
+
+
+    def tally_by_totals(self, method):
+        """
+        Methods that just rank songs by a per song total: "sum" and "mean" 
+        of the scores, "borda" points or "fptp" first choice votes.
+        """
+        if self.fused_tally is None:
+            self.fused_tally = FusedTally(self.song_df.shape[0], self.num_winners,
+                                    song_index=self.song_df.index)
+            self.fused_tally.tally(self.ballots)
+        return self.fused_tally.winners(method)
+
+
     def record_consistency(self):
-        fair_winners = self.song_df.sort_values("Objective Ratings", ascending=False).head(self.num_winners).index.tolist()
-        self.num_condorcet_fair_winners = len(set(self.condorcet_winners[:self.num_winners]).intersection(set(fair_winners)))
-        self.num_current_method_fair_winners = len(set(self.current_method_winners[:self.num_winners]).intersection(set(fair_winners)))
+        """How many of each method's winners are among the best rated songs"""
+        fair_winners = set(self.catalog.fair_winners(self.num_winners))
+        for method in WINNER_METHODS:
+            winners = getattr(self, f"{method}_winners")[:self.num_winners]
+            setattr(self, f"num_{method}_fair_winners", len(fair_winners.intersection(winners)))
 
 
 #############################################################################
@@ -252,43 +651,419 @@ class Simulation:
 class RepeatedSimulations:
     def __init__(self, song_df, num_voters, 
                  listen_limit=None, ballot_limit=None, num_winners=10,
-                 filepath=None):
-        
-        self.song_df = song_df
+                 filepath=None, methods=["condorcet", "current"],
+                 num_workers=None, seed=None, contest_batch=None,
+                 counts_directory=None):
+        """
+        Runs the same contest over and over, adding up the Condorcet pairwise
+        sums and recording each contest's winners.
+
+        The sums are kept in two PairwiseCounts, which only need a fraction
+        of the memory of N x N floats: pairwise_counts adds up each contest's
+        pairwise_sums, and majority_counts how many contests each song beat
+        each other song in. sum_of_sums and sum_of_rankings give them as
+        N x N arrays. With counts_directory, they're memory-mapped files in
+        it, for catalogs too big to keep in RAM.
+
+        With num_workers set, the contests are spread over that many 
+        processes, see simulate_in_parallel. The same goes for a seed, with
+        just the one process by default. Contest number ii's draws are then
+        keyed by the seed and ii, so the results only depend on the seed and
+        not on num_workers, and only the seed and the summaries need keeping.
+        Any ballot can be drawn again with simulation(ii).rebuild_ballot. If
+        no seed is given with num_workers, one is picked and kept in 
+        self.seed.
+
+        With contest_batch set, each worker runs that many contests at a
+        time together in a ContestBatch. The winners are the same, it just
+        saves the per contest overhead of small contests.
+
+        With a filepath, each call to simulate appends its contests to the
+        ResultStore in that directory. If it already has contests for these
+        settings, they're loaded and the new ones carry on from them.
+        """
+        self.catalog = SongCatalog.of(song_df)
+        self.song_df = self.catalog.song_df
         self.num_voters = num_voters
         self.listen_limit = listen_limit
         self.ballot_limit = ballot_limit
         self.num_winners = num_winners
         self.filepath = filepath
+        self.methods = methods
+        self.num_workers = num_workers
+        self.contest_batch = contest_batch
+        self.counts_directory = counts_directory
+        store = ResultStore(filepath) if filepath is not None else None
+        if seed is None and store is not None and store.exists:
+            seed = store.settings["seed"]
+        if seed is None and (num_workers is not None or contest_batch):
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
 
-        self.sim = Simulation(song_df, num_voters,
-            listen_limit = listen_limit,
-            ballot_limit = ballot_limit,
-            num_winners = num_winners,
-            methods=["condorcet", "current"])
+        self.sim = self.simulation()
         
-        num_songs = song_df.shape[0]
-        self.sum_of_sums = np.zeros((num_songs, num_songs))
-        self.sum_of_rankings = np.zeros((num_songs, num_songs))
+        num_songs = self.song_df.shape[0]
+        if counts_directory is None:
+            self.pairwise_counts = PairwiseCounts(num_songs)
+            self.majority_counts = PairwiseCounts(num_songs)
+        else:
+            self.pairwise_counts = PairwiseCounts(num_songs, Path(counts_directory) / "sum_of_sums")
+            self.majority_counts = PairwiseCounts(num_songs, Path(counts_directory) / "sum_of_rankings")
         self.condorcet_winners = {}
         self.current_method_winners = {}
         self.num_condorcet_fair_winners = []
         self.num_current_method_fair_winners = []
+        self.schulze_winners = {}
+        self.ranked_pairs_winners = {}
+        self.num_schulze_fair_winners = []
+        self.num_ranked_pairs_fair_winners = []
         self.num_contests = 0
-        
-        
-    def simulate(self, num_repetitions=10):
-        for _ in tqdm(range(num_repetitions)):
-            self.sim.simulate()
-            self.sum_of_sums += self.sim.condorcet.pairwise_sums
-            self.sum_of_rankings += self.sim.condorcet.preferences
-            self.condorcet_winners[self.num_contests] = self.sim.condorcet.top_nominee_ids
-            self.current_method_winners[self.num_contests] = self.sim.current_method.winners
-            self.num_condorcet_fair_winners.append(self.sim.num_condorcet_fair_winners)
-            self.num_current_method_fair_winners.append(self.sim.num_current_method_fair_winners)
-            self.num_contests += 1
+
+        if store is not None:
+            store.write_settings(self.settings, self.catalog)
+            self.restore(store)
+
+
+    @classmethod
+    def load(cls, filepath):
+        """The RepeatedSimulations saved in the ResultStore at filepath"""
+        store = ResultStore(filepath)
+        settings = store.settings
+        return cls(store.song_df(), settings["num_voters"],
+                   listen_limit=settings["listen_limit"],
+                   ballot_limit=settings["ballot_limit"],
+                   num_winners=settings["num_winners"],
+                   methods=settings["methods"],
+                   seed=settings["seed"],
+                   filepath=filepath)
+
+
+    @property
+    def sum_of_sums(self):
+        """Row-Col, how many voters ranked row above col, over every contest"""
+        return self.pairwise_counts.dense()
+
+
+    @property
+    def sum_of_rankings(self):
+        """Row-Col, in how many contests more voters ranked row above col"""
+        return self.majority_counts.dense()
+
+
+    @property
+    def counts(self):
+        """The PairwiseCounts behind each of the ACCUMULATORS"""
+        return {"sum_of_sums": self.pairwise_counts, "sum_of_rankings": self.majority_counts}
 
 
+    @property
+    def settings(self):
+        """What the contests depend on, as saved with the results"""
+        return {
+            "num_songs":    self.song_df.shape[0],
+            "num_voters":   self.num_voters,
+            "listen_limit": self.listen_limit,
+            "ballot_limit": self.ballot_limit,
+            "num_winners":  self.num_winners,
+            "methods":      list(self.methods),
+            "seed":         None if self.seed is None else int(self.seed),
+        }
+
+
+    def restore(self, store):
+        """Loads the contests and sums a ResultStore already has"""
+        records = store.contests()
+        if records.empty:
+            return
+        for name, counts in self.counts.items():
+            counts.merge(store.counts(name))
+        for record in records.to_dict("records"):
+            results = {}
+            for method in METHODS:
+                if f"{method}_winners" in record:
+                    results[f"{method}_winners"] = list(record[f"{method}_winners"])
+                    results[f"num_{method}_fair_winners"] = record[f"num_{method}_fair_winners"]
+            self.record_contest(record["contest"], results)
+        self.num_contests = len(records)
+
+
+    def simulation(self, contest=0):
+        """
+        A Simulation with these settings. With a seed, it's the Simulation of
+        that contest, so rebuild_ballot can draw any of its ballots again.
+        """
+        return Simulation(self.catalog, self.num_voters,
+            listen_limit = self.listen_limit,
+            ballot_limit = self.ballot_limit,
+            num_winners = self.num_winners,
+            methods=self.methods,
+            seed=self.seed,
+            contest=contest)
+
+
+    def __getstate__(self):
+        """
+        The ballots can be drawn again from the seed, so only the summaries
+        are pickled, not the Simulation holding the last contest's ballots.
+        """
+        state = self.__dict__.copy()
+        state["sim"] = None
+        return state
+
+
+    def simulate(self, num_repetitions=10, first_contest=None):
+        """
+        Runs num_repetitions more contests. With a seed, first_contest picks
+        which contest numbers they are, by default the ones after the last.
+        """
+        if first_contest is None or self.seed is None:
+            first_contest = self.num_contests
+        counts = self.counts
         if self.filepath is not None:
-            with open(self.filepath, "wb") as pkl_file:
-                pickle.dump(self, pkl_file)
\ No newline at end of file
+            # The new contests are counted on their own, to save what they
+            # added, and then merged in
+            self.pairwise_counts = counts["sum_of_sums"].zeros_like("added_sum_of_sums")
+            self.majority_counts = counts["sum_of_rankings"].zeros_like("added_sum_of_rankings")
+        try:
+            if self.seed is not None:
+                self.simulate_in_parallel(num_repetitions, first_contest)
+            else:
+                if self.sim is None:
+                    self.sim = self.simulation()
+                for _ in tqdm(range(num_repetitions)):
+                    self.sim.simulate()
+                    self.record_contest(self.num_contests, contest_results(self.sim))
+                    pairwise_sums = self.sim.get_pairwise_sums()
+                    self.pairwise_counts.add(pairwise_sums)
+                    self.majority_counts.add(pairwise_sums > pairwise_sums.T)
+                    self.num_contests += 1
+            if self.filepath is not None:
+                contests = range(first_contest, first_contest + num_repetitions)
+                self.save(contests, self.counts)
+        finally:
+            if self.filepath is not None:
+                added = self.counts
+                self.pairwise_counts = counts["sum_of_sums"].merge(added["sum_of_sums"])
+                self.majority_counts = counts["sum_of_rankings"].merge(added["sum_of_rankings"])
+                for name in ACCUMULATORS:
+                    if added[name].directory is not None:
+                        shutil.rmtree(added[name].directory)
+
+
+    def save(self, contests, added=None, store=None):
+        """
+        Appends the last len(contests) contests to a ResultStore, the one at
+        filepath by default: their records, and added, what they added to
+        the counts, or all of the counts.
+        """
+        if store is None:
+            store = ResultStore(self.filepath)
+        store.write_settings(self.settings, self.catalog)
+        num_fair_winners = {method: getattr(self, f"num_{method}_fair_winners")[-len(contests):]
+                            for method in METHODS}
+        if added is None:
+            added = self.counts
+        store.append(contest_records(self, contests, num_fair_winners), added)
+
+
+    def record_contest(self, contest, results):
+        """Keeps one contest's winners and fair winner counts"""
+        self.condorcet_winners[contest] = results["condorcet_winners"]
+        self.current_method_winners[contest] = results["current_method_winners"]
+        self.num_condorcet_fair_winners.append(results["num_condorcet_fair_winners"])
+        self.num_current_method_fair_winners.append(results["num_current_method_fair_winners"])
+        for method in ["schulze", "ranked_pairs"]:
+            if method in self.methods:
+                getattr(self, f"{method}_winners")[contest] = results[f"{method}_winners"]
+                getattr(self, f"num_{method}_fair_winners").append(results[f"num_{method}_fair_winners"])
+
+
+    def merge(self, other):
+        """
+        Adds another run of the same settings, e.g. other contest numbers
+        run somewhere else. Merging in contest order keeps the fair winner
+        lists in contest order.
+        """
+        self.pairwise_counts.merge(other.pairwise_counts)
+        self.majority_counts.merge(other.majority_counts)
+        for method in ["condorcet", "current_method", "schulze", "ranked_pairs"]:
+            getattr(self, f"{method}_winners").update(getattr(other, f"{method}_winners"))
+            getattr(self, f"num_{method}_fair_winners").extend(getattr(other, f"num_{method}_fair_winners"))
+        self.num_contests += other.num_contests
+        return self
+
+
+    def simulate_in_parallel(self, num_repetitions=10, first_contest=None):
+        """
+        Splits the next num_repetitions contests over num_workers processes,
+        or the ones from first_contest on.
+
+        The song catalog is put in shared memory once, and so are the 
+        sum_of_sums and sum_of_rankings accumulators, one slot per worker,
+        so nothing big is pickled to or from the workers. Each worker adds
+        its contests into its own slot and only sends back the winners. The
+        slots are added up in order at the end. The sums are whole numbers,
+        so they come out exactly the same however the contests were split.
+        Like PairwiseCounts, a slot only keeps each pair's margin and total,
+        as the smallest integers that can't overflow.
+        """
+        if first_contest is None:
+            first_contest = self.num_contests
+        contests = np.arange(first_contest, first_contest + num_repetitions)
+        num_slots = max(1, min(self.num_workers or 1, num_repetitions))
+        num_songs = self.song_df.shape[0]
+        params = {
+            "num_voters":   self.num_voters,
+            "listen_limit": self.listen_limit,
+            "ballot_limit": self.ballot_limit,
+            "num_winners":  self.num_winners,
+            "methods":      self.methods,
+        }
+        args = (self.seed, params, self.contest_batch)
+
+        shared = {}
+        try:
+            shared["song_ids"] = SharedArray.create(self.song_df.index.values.astype(np.int64))
+            shared["ratings"] = SharedArray.create(self.song_df["Objective Ratings"].values)
+            contests_per_slot = -(-num_repetitions // num_slots)
+            bounds = {"sum_of_sums": contests_per_slot * self.num_voters,
+                      "sum_of_rankings": contests_per_slot}
+            num_pairs = num_songs * (num_songs - 1) // 2
+            for name, bound in bounds.items():
+                margin = np.zeros((num_slots, num_pairs), dtype=smallest_int(-bound, bound))
+                totals = np.zeros((num_slots, num_pairs), dtype=smallest_int(0, bound, signed=False))
+                shared[f"{name}_margin"] = SharedArray.create(margin)
+                shared[f"{name}_totals"] = SharedArray.create(totals)
+            handles = {name: array.handle for name, array in shared.items()}
+
+            batches = list(enumerate(np.array_split(contests, num_slots)))
+            if num_slots == 1:
+                attach_worker(handles)
+                results = [simulate_contests(*batches[0], *args)]
+            else:
+                with ProcessPoolExecutor(num_slots, initializer=attach_worker,
+                                         initargs=(handles,)) as pool:
+                    futures = [pool.submit(simulate_contests, slot, batch, *args)
+                               for slot, batch in batches]
+                    results = [future.result() for future in tqdm(futures)]
+
+            for batch_results in results:
+                for contest, contest_result in batch_results:
+                    self.record_contest(contest, contest_result)
+            for slot in range(num_slots):
+                for name, counts in self.counts.items():
+                    counts.merge(PairwiseCounts.from_arrays(shared[f"{name}_margin"].array[slot],
+                                                            shared[f"{name}_totals"].array[slot]))
+        finally:
+            detach_worker()
+            for array in shared.values():
+                array.release()
+
+        self.num_contests += num_repetitions
+
+
+class SharedArray:
+    def __init__(self, shm, shape, dtype, owner=False):
+        """
+        A NumPy array backed by multiprocessing shared memory. The process
+        that creates it owns it and unlinks it in release. Other processes
+        attach to it by its handle.
+        """
+        self.shm = shm
+        self.owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+    @classmethod
+    def create(cls, values):
+        values = np.asarray(values)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        shared = cls(shm, values.shape, values.dtype, owner=True)
+        shared.array[...] = values
+        return shared
+
+
+    @classmethod
+    def attach(cls, handle):
+        name, shape, dtype = handle
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype)
+
+
+    @property
+    def handle(self):
+        """What another process needs to attach: (name, shape, dtype)"""
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+
+    def release(self):
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# The shared arrays a worker process is attached to
+_worker_arrays = {}
+
+
+def attach_worker(handles):
+    """Process pool initializer, attaches the worker to the shared arrays"""
+    detach_worker()
+    for name, handle in handles.items():
+        _worker_arrays[name] = SharedArray.attach(handle)
+
+
+def detach_worker():
+    for array in _worker_arrays.values():
+        if not array.owner:
+            array.release()
+    _worker_arrays.clear()
+
+
+def contest_results(sim):
+    """The winners and fair winner counts RepeatedSimulations keeps from a contest"""
+    results = {}
+    for method in ["condorcet", "current_method", "schulze", "ranked_pairs"]:
+        results[f"{method}_winners"] = getattr(sim, f"{method}_winners")
+        results[f"num_{method}_fair_winners"] = getattr(sim, f"num_{method}_fair_winners")
+    return results
+
+
+def simulate_contests(slot, contests, seed, params, contest_batch=None):
+    """
+    Runs in a worker process. Simulates each contest with its own draws,
+    keyed by the root seed and the contest number, adds its sums into the
+    worker's slot of the shared accumulators and returns
+    [(contest, contest_results), ...].
+
+    With contest_batch, that many contests are run together at a time.
+    """
+    catalog = SongCatalog(pd.DataFrame({"Objective Ratings": _worker_arrays["ratings"].array},
+                                       index=pd.Index(_worker_arrays["song_ids"].array)))
+    # The slots are sized so the counts are never widened out of shared memory
+    sum_of_sums, sum_of_rankings = [
+        PairwiseCounts.from_arrays(_worker_arrays[f"{name}_margin"].array[slot],
+                                   _worker_arrays[f"{name}_totals"].array[slot])
+        for name in ["sum_of_sums", "sum_of_rankings"]]
+
+    def accumulate(pairwise_sums):
+        sum_of_sums.add(pairwise_sums)
+        sum_of_rankings.add(pairwise_sums > pairwise_sums.T)
+
+    results = []
+    if contest_batch:
+        sim = Simulation(catalog, seed=seed, **params)
+        for start in range(0, len(contests), contest_batch):
+            batch_contests = contests[start:start+contest_batch]
+            batch = ContestBatch(sim, batch_contests)
+            for contest, pairwise_sums, batch_results in zip(batch_contests, batch.pairwise_sums, batch.results):
+                accumulate(pairwise_sums)
+                results.append((int(contest), batch_results))
+        return results
+
+    for contest in contests:
+        sim = Simulation(catalog, seed=seed, contest=int(contest), **params)
+        sim.simulate()
+        accumulate(sim.get_pairwise_sums())
+        results.append((int(contest), contest_results(sim)))
+    return results
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from .ballots import RankedBallots
+from .ranked_choice_voting import advance_ballots, first_choices
+
+
+class SingleTransferableVote:
+    def __init__(self, num_winners=5):
+        """
+        Multi-winner ranked choice. Songs are elected once their votes reach
+        the Droop quota. Their surplus votes move on to each voter's next
+        choice at a fraction of their weight, so every ballot that helped
+        elect a song passes on the same share of what wasn't needed. When no
+        one reaches the quota, the song with the fewest votes is dropped and
+        its ballots move on at whatever weight they had.
+
+        num_winners (int):
+            How many songs to elect, e.g. the number of finalists.
+        """
+        self.num_winners = num_winners
+
+        # Initialize
+        self.winners = []
+        self.dropped_candidates = []
+        self.quota = None
+        self.rounds = 0
+        self.original_vote_counts = None
+        self.winner_vote_totals = None
+
+
+    def tally(self, ballots):
+        """
+        Like RankChoiceVoting.tally, each ballot keeps a pointer to its
+        highest choice who is still in the running, and only the ballots
+        pointing at a song that was just elected or dropped are moved, so each
+        round costs as much as the ballots it touches.
+
+        ballots (RankedBallots or pd.DataFrame):
+            Ranked ballots, or score ballots with NaN for unranked entrants.
+
+        Returns the winners, in the order they were elected.
+        """
+        if isinstance(ballots, pd.DataFrame):
+            ballots = RankedBallots.from_dataframe(ballots)
+
+        num_candidates = ballots.num_songs
+        song_ids, pointers, ends, choices = first_choices(ballots)
+        weights = np.ones(ballots.num_voters)
+        self.quota = ballots.num_voters // (self.num_winners + 1) + 1
+
+        counts = np.bincount(choices[choices >= 0], minlength=num_candidates).astype(float)
+        self.original_vote_counts = pd.Series(counts, index=ballots.song_index)
+        hopeful = np.ones(num_candidates, dtype=bool)
+        elected = []
+        elected_votes = []
+
+        while len(elected) < self.num_winners and hopeful.any():
+            self.rounds += 1
+            seats_left = self.num_winners - len(elected)
+
+            # Everyone left gets a seat
+            if hopeful.sum() <= seats_left:
+                remaining = np.flatnonzero(hopeful)
+                remaining = remaining[np.argsort(-counts[remaining], kind="stable")]
+                elected += remaining.tolist()
+                elected_votes += counts[remaining].tolist()
+                break
+
+            reached = np.flatnonzero(hopeful & (counts >= self.quota))
+            if reached.size:
+                reached = reached[np.argsort(-counts[reached], kind="stable")][:seats_left]
+                elected += reached.tolist()
+                elected_votes += counts[reached].tolist()
+                hopeful[reached] = False
+
+                # Ballots for the new winners carry on with the surplus share
+                transfer = np.zeros(num_candidates)
+                transfer[reached] = (counts[reached] - self.quota) / counts[reached]
+                moving = np.flatnonzero((choices >= 0) & np.isin(choices, reached))
+                weights[moving] *= transfer[choices[moving]]
+                counts[reached] = self.quota
+            else:
+                # Songs nobody is voting for can all go at once
+                losers = hopeful & (counts <= 0)
+                if not losers.any() or hopeful.sum() - losers.sum() < seats_left:
+                    candidates = np.flatnonzero(hopeful)
+                    losers = np.zeros(num_candidates, dtype=bool)
+                    losers[candidates[np.argmin(counts[candidates])]] = True
+                self.dropped_candidates.append(ballots.song_index[losers])
+                hopeful[losers] = False
+                moving = np.flatnonzero((choices >= 0) & losers[np.maximum(choices, 0)])
+                counts[losers] = 0
+
+            moving = moving[weights[moving] > 0]
+            advance_ballots(song_ids, pointers, ends, choices, moving, hopeful)
+            moved = moving[choices[moving] >= 0]
+            counts += np.bincount(choices[moved], weights[moved], minlength=num_candidates)
+
+        self.winners = ballots.song_index[elected].tolist()
+        self.winner_vote_totals = pd.Series(elected_votes, index=self.winners)
+        return self.winners
@@ -0,0 +1,224 @@
+'''
+The songs in a contest and their objective ratings. Whatever depends only on
+the ratings is worked out once, when the catalog is made:
+
+    order               Song positions, best rated first
+    ranks               Each song's place, 1 is the best
+    percentile_ranks    Each song's rating as a percentile rank
+
+Catalogs are saved as Parquet, named for everything they were generated
+with, so catalogs with different sizes, spreads or seeds never share a file.
+'''
+import os
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .files import temporary_path
+
+
+REPO_ROOT_DIR = Path(__file__).parent.parent
+DATA_DIR = REPO_ROOT_DIR / "data"
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+# {id(song_df): (song_df, its catalog)} for the last few song_dfs asked for,
+# see SongCatalog.of
+CACHE_SIZE = 16
+_catalogs = OrderedDict()
+_catalogs_lock = threading.Lock()
+
+
+class SongCatalog:
+    def __init__(self, song_df):
+        """
+        song_df (pd.DataFrame):
+            One row per song, with its "Objective Ratings" and usually its
+            "ID".
+
+        The catalog keeps a copy of song_df, in self.song_df, so changing
+        song_df afterwards doesn't change the catalog. The copy is frozen:
+        everything worked out from it is kept, so don't change it in place.
+        """
+        self.song_df = song_df = song_df.copy()
+        ratings = song_df["Objective Ratings"]
+        self.order = np.argsort(-ratings.to_numpy(), kind="stable")
+        ranks = np.empty(len(ratings), dtype=np.int64)
+        ranks[self.order] = np.arange(1, len(ratings) + 1)
+        self.ranks = pd.Series(ranks, index=song_df.index, name="Rank")
+        self.percentile_ranks = ratings.rank(pct=True)
+
+
+    @classmethod
+    def of(cls, song_df):
+        """
+        The catalog of song_df. It's reused while song_df is one of the last
+        CACHE_SIZE asked for, as long as song_df still holds the same songs
+        and ratings as the catalog's copy of it. If song_df was changed in
+        place, a new catalog is worked out. A catalog's own song_df gives
+        back the catalog, and a catalog is passed straight through.
+        """
+        if isinstance(song_df, cls):
+            return song_df
+        with _catalogs_lock:
+            frame, catalog = _catalogs.get(id(song_df), (None, None))
+            if frame is song_df and catalog.song_df.equals(song_df):
+                _catalogs.move_to_end(id(song_df))
+                return catalog
+        catalog = cls(song_df)
+        remember(song_df, catalog)
+        remember(catalog.song_df, catalog)
+        return catalog
+
+
+    @classmethod
+    def load_or_generate(cls, num_songs, mean=50, std=15, seed=None, directory=DATA_DIR):
+        """
+        In order for each simulation to see the same set of songs, we need to
+        generate them once and save them. The first catalog saved for these
+        parameters is the one everyone gets, even if two sessions generate
+        one at the same time.
+
+        Catalogs saved as pickles, by num_songs alone, are what the default
+        parameters gave, so they're carried over rather than generated again.
+        """
+        directory = Path(directory)
+        filepath = directory / catalog_filename(num_songs, mean, std, seed)
+        if not filepath.exists():
+            legacy_filepath = directory / f"objective_scores_for_{num_songs}_songs.pkl"
+            if (mean, std, seed) == (50, 15, None) and legacy_filepath.exists():
+                song_df = pd.read_pickle(legacy_filepath)
+            else:
+                song_df = generate_objective_scores(num_songs, mean, std, seed,
+                                                    directory / "song_names")
+            temporary = temporary_path(filepath)
+            cls(song_df).to_parquet(temporary)
+            try:
+                # Unlike a rename, a link won't replace a catalog someone else saved first
+                os.link(temporary, filepath)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temporary)
+        return cls.read(filepath)
+
+
+    @classmethod
+    def read(cls, filepath):
+        catalog = cls(pd.read_parquet(filepath))
+        remember(catalog.song_df, catalog)
+        return catalog
+
+
+    def to_parquet(self, filepath):
+        """
+        Saves song_df. The IDs are saved as text, since songs that ran out of
+        names keep their number and Parquet columns can't mix the two.
+        """
+        song_df = self.song_df
+        if "ID" in song_df.columns:
+            song_df = song_df.assign(ID=song_df["ID"].astype(str))
+        song_df.to_parquet(filepath)
+
+
+    def write(self, filepath):
+        """to_parquet, written next to filepath and moved into place"""
+        temporary = temporary_path(filepath)
+        self.to_parquet(temporary)
+        os.replace(temporary, filepath)
+
+
+    @property
+    def num_songs(self):
+        return self.song_df.shape[0]
+
+
+    def by_rating(self):
+        """song_df, best rated first"""
+        return self.song_df.iloc[self.order]
+
+
+    def top(self, n):
+        """The n best rated songs' rows"""
+        return self.song_df.iloc[self.order[:n]]
+
+
+    def fair_winners(self, n):
+        """The n best rated songs, what a fair contest would pick"""
+        return self.song_df.index[self.order[:n]].tolist()
+
+
+    def position_at_percentile(self, percentile):
+        """The position of the first song whose percentile rank is percentile, out of 100"""
+        return np.flatnonzero(self.percentile_ranks.to_numpy() == percentile/100)[0]
+
+
+def remember(song_df, catalog):
+    """Keeps the catalog for SongCatalog.of, dropping the oldest past CACHE_SIZE"""
+    with _catalogs_lock:
+        _catalogs[id(song_df)] = (song_df, catalog)
+        _catalogs.move_to_end(id(song_df))
+        while len(_catalogs) > CACHE_SIZE:
+            _catalogs.popitem(last=False)
+
+
+def catalog_filename(num_songs, mean=50, std=15, seed=None):
+    return f"song_catalog_{num_songs}_songs_mean-{mean}_std-{std}_seed-{seed}.parquet"
+
+
+def generate_objective_scores(num_songs, mean=50, std=15, seed=None,
+                              names_dir=DATA_DIR / "song_names"):
+    """
+    Draws each song's objective rating from a normal distribution and names
+    them. Without a seed the draws come from np.random.
+    """
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    objective_scores = rng.normal(loc=mean, scale=std, size=num_songs)
+    song_df = pd.DataFrame(objective_scores, columns=["Objective Ratings"])
+    song_df = apply_song_names(song_df, names_dir)
+    return song_df
+
+
+def apply_song_names(df, names_dir=DATA_DIR / "song_names"):
+    """
+    The best rated songs get the top scoring names, best first, and then
+    songs get the other names in catalog order. Any song left once the
+    names run out keeps its number.
+    """
+    ids = df.index.to_numpy(dtype=object)
+    order = np.argsort(-df["Objective Ratings"].to_numpy(), kind="stable")
+
+    top_scoring_names = pd.read_csv(names_dir / "Top Scoring Songs.csv")
+    ids[order] = change_values(ids[order], top_scoring_names)
+
+    first_names = pd.read_csv(names_dir / "All Song Names.csv")
+    df["ID"] = change_values(ids, first_names)
+    return df
+
+
+def change_values(ids, fictional_names):
+    """
+    ids are the songs' current names, in the order to rename them. Each song
+    gets the next of the fictional names, skipping names a song already has,
+    until one or the other runs out. Returns the new names.
+    """
+    ids = np.array(ids, dtype=object)
+    # A song has a name if it was given it, or if it had it to start with
+    # and hasn't been renamed yet
+    given = set()
+    not_renamed = Counter(ids.tolist())
+    new_names = []
+    for song_name in fictional_names["Song Name by Artist"].values:
+        if len(new_names) == len(ids):
+            # Fictional Names is longer than song_df. This occurs when testing
+            # with small numbers
+            break
+        if song_name in given or not_renamed[song_name] > 0:
+            continue
+        not_renamed[ids[len(new_names)]] -= 1
+        given.add(song_name)
+        new_names.append(song_name)
+    ids[:len(new_names)] = new_names
+    return ids
@@ -0,0 +1,394 @@
+'''
+Sweeps of RepeatedSimulations over a grid of parameters, spread over as many
+worker processes, on as many machines, as share the sweep's directory:
+
+    sweep = Sweep.create(song_df, grid, "/shared/sweep", num_voters=1000)
+
+then on every machine, as many times as it has cores:
+
+    python -m src.sweep work /shared/sweep
+
+and once they're done:
+
+    python -m src.sweep merge /shared/sweep
+
+There's no broker. Each cell's contests are split into tasks of a few
+contests each, and a worker takes a task by creating its lease file, which
+only one worker can do. Workers keep touching their leases while they work,
+and a lease nobody has touched for lease_timeout seconds belongs to a worker
+that died, so another worker takes it over. Each task appends its contests
+to its cell's ResultStore in the SweepDataset, and merge indexes the cells
+that have all of them.
+'''
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+
+from tqdm import tqdm
+
+from .files import temporary_path
+from .result_store import ResultStore
+from .simulation import RepeatedSimulations
+from .sweep_dataset import SweepDataset, INDEX_KEYS
+from .song_catalog import SongCatalog
+
+
+class Sweep:
+    def __init__(self, song_df, grid, directory, num_contests=20, seed=0,
+                 num_workers=None, checkpoint_every=10, lease_timeout=600,
+                 **settings):
+        """
+        Runs RepeatedSimulations over every combination of a parameter grid,
+        e.g.
+
+            grid = {
+                "ballot_limit": [50, 100, 150],
+                "num_voters":   [500, 1000],
+                "listen_limit": [100, 200, 300],
+            }
+
+        Every cell gets num_contests contests. settings are passed to every
+        cell's RepeatedSimulations as they are, e.g. num_winners=25.
+
+        A task is checkpoint_every contests of one cell, and each finished
+        task is saved as its own chunk of the cell's results in the
+        SweepDataset in directory/dataset, so a sweep can be stopped at any
+        point and picks up where it left off. run uses num_workers processes
+        on this machine. Make a new sweep with create, which saves its
+        settings in directory too, so workers elsewhere can open it.
+
+        All the cells draw from the same seed, so contest ii of every cell
+        has the same voters, as far as they overlap. That keeps the noise
+        from drowning out the differences between cells, and it means a
+        ballot_limit at or past the listen_limit gives exactly the same
+        contests as no ballot limit. Those cells are only run once, see
+        canonical.
+        """
+        self.song_df = song_df
+        self.grid = grid
+        self.directory = Path(directory)
+        self.num_contests = num_contests
+        self.seed = seed
+        self.num_workers = num_workers
+        self.checkpoint_every = checkpoint_every
+        self.lease_timeout = lease_timeout
+        self.settings = settings
+
+        self.dataset = SweepDataset(self.directory / "dataset")
+        (self.directory / "leases").mkdir(parents=True, exist_ok=True)
+
+
+    @classmethod
+    def create(cls, song_df, grid, directory, **kwargs):
+        """
+        A new sweep, or new settings for the sweep in directory. It's saved
+        once here, so the workers that open it only ever read it.
+        """
+        sweep = cls(song_df, grid, directory, **kwargs)
+        sweep.save()
+        return sweep
+
+
+    def save(self):
+        """Writes the sweep's settings to sweep.json and its songs to songs.parquet"""
+        sweep = {
+            "grid":             self.grid,
+            "num_contests":     self.num_contests,
+            "seed":             self.seed,
+            "num_workers":      self.num_workers,
+            "checkpoint_every": self.checkpoint_every,
+            "lease_timeout":    self.lease_timeout,
+            "settings":         self.settings,
+        }
+        SongCatalog.of(self.song_df).write(self.directory / "songs.parquet")
+        temporary = temporary_path(self.directory / "sweep.json")
+        with open(temporary, "w") as json_file:
+            json.dump(sweep, json_file, indent=4, default=int)
+        os.replace(temporary, self.directory / "sweep.json")
+
+
+    @classmethod
+    def open(cls, directory):
+        """The sweep saved in directory"""
+        with open(Path(directory) / "sweep.json") as json_file:
+            sweep = json.load(json_file)
+        song_df = SongCatalog.read(Path(directory) / "songs.parquet").song_df
+        settings = sweep.pop("settings")
+        return cls(song_df, directory=directory, **sweep, **settings)
+
+
+    @property
+    def cells(self):
+        """Every combination of the grid, as dicts, in grid order"""
+        names = list(self.grid)
+        return [dict(zip(names, values)) for values in product(*self.grid.values())]
+
+
+    def canonical(self, cell):
+        """
+        The cell that gives the same contests. A voter can't rank more songs
+        than they listened to, so a ballot_limit at or past the listen_limit
+        is the same as listen_limit.
+        """
+        cell = dict(cell)
+        listen_limit = cell.get("listen_limit", self.settings.get("listen_limit"))
+        ballot_limit = cell.get("ballot_limit", self.settings.get("ballot_limit"))
+        if listen_limit is None:
+            listen_limit = self.song_df.shape[0]
+        if ballot_limit is not None and ballot_limit >= listen_limit:
+            cell["ballot_limit"] = listen_limit
+        return cell
+
+
+    def chunks(self, cell):
+        """(first contest, stop contest) of each of a cell's tasks"""
+        return [(start, min(start + self.checkpoint_every, self.num_contests))
+                for start in range(0, self.num_contests, self.checkpoint_every)]
+
+
+    @property
+    def pending(self):
+        """The canonical cells that are still missing contests, each once"""
+        pending = []
+        for cell in self.cells:
+            cell = self.canonical(cell)
+            if cell in pending:
+                continue
+            if not all(self.shard_path(cell, *chunk).exists() for chunk in self.chunks(cell)):
+                pending.append(cell)
+        return pending
+
+
+    @property
+    def tasks(self):
+        """(cell, first contest, stop contest) for every chunk not saved yet"""
+        tasks = []
+        for cell in self.pending:
+            for start, stop in self.chunks(cell):
+                if not self.shard_path(cell, start, stop).exists():
+                    tasks.append((cell, start, stop))
+        return tasks
+
+
+    def name(self, cell):
+        return "_".join(f"{key}={value}" for key, value in sorted(cell.items()))
+
+
+    def index_keys(self, cell):
+        """The cell's INDEX_KEYS and any other grid settings, with the defaults filled in"""
+        defaults = {"ballot_limit": None, "listen_limit": None, "num_winners": 10}
+        settings = {**defaults, **self.settings, **cell}
+        return {key: settings[key] for key in INDEX_KEYS + sorted(set(cell) - set(INDEX_KEYS))}
+
+
+    def filepath(self, cell):
+        """The cell's partition of the dataset, a ResultStore"""
+        return self.dataset.partition(self.index_keys(self.canonical(cell)))
+
+
+    def shard_path(self, cell, start, stop):
+        """The chunk of the cell's ResultStore that one task saves"""
+        return self.filepath(cell) / f"contests={start}-{stop}.parquet"
+
+
+    def lease_path(self, cell, start, stop):
+        return self.directory / "leases" / f"{self.name(cell)}_contests={start}-{stop}.lease"
+
+
+    def load(self, cell):
+        """The cell's RepeatedSimulations, or None if it isn't finished yet"""
+        if self.canonical(cell) in self.pending:
+            return None
+        return RepeatedSimulations.load(self.filepath(cell))
+
+
+    def run(self):
+        """Runs every task with num_workers processes here, then merges"""
+        if self.num_workers is None or self.num_workers <= 1:
+            self.work()
+        else:
+            with ProcessPoolExecutor(self.num_workers) as pool:
+                futures = [pool.submit(self.work) for _ in range(self.num_workers)]
+                for future in futures:
+                    future.result()
+        self.merge()
+
+
+    def work(self, worker=None, poll_interval=None):
+        """
+        Takes tasks until every chunk is saved. When every task left is
+        leased by someone else, waits for them to finish, or for their lease
+        to go stale and take it over. Returns how many tasks it ran.
+        """
+        if worker is None:
+            worker = f"{socket.gethostname()}-{os.getpid()}"
+        if poll_interval is None:
+            poll_interval = min(1, self.lease_timeout / 4)
+
+        num_tasks = 0
+        progress = tqdm(desc=f"Tasks ({worker})")
+        while True:
+            tasks = self.tasks
+            if not tasks:
+                break
+            claimed = next((task for task in tasks if self.claim(task, worker)), None)
+            if claimed is None:
+                time.sleep(poll_interval)
+                continue
+            self.run_task(*claimed, worker=worker)
+            num_tasks += 1
+            progress.update()
+        progress.close()
+        return num_tasks
+
+
+    def claim(self, task, worker):
+        """
+        Tries to take the task's lease. Creating the lease file fails if it
+        exists, so only one worker gets it. A stale lease is first taken out
+        of the way, see take_over.
+        """
+        lease = self.lease_path(*task)
+        seen = self.lease_state(lease)
+        if seen is not None and time.time() - seen[1] > self.lease_timeout:
+            if not self.take_over(lease, seen, worker):
+                return False
+        try:
+            descriptor = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(descriptor, "w") as lease_file:
+            lease_file.write(f"{worker} {time.time()}\n")
+        # The chunk may have been saved while this worker was looking
+        if self.shard_path(*task).exists():
+            os.remove(lease)
+            return False
+        return True
+
+
+    def take_over(self, lease, seen, worker):
+        """
+        Removes the stale lease, whose owner and last heartbeat were seen.
+        Only one worker can rename it away, but by then it may be a new
+        lease another worker took over the same stale one with. So the
+        renamed file is checked, and if it isn't the stale lease it's put
+        back and this worker backs off. Returns whether the lease was
+        removed.
+        """
+        taken_over = lease.with_suffix(f".stale.{worker}")
+        try:
+            os.rename(lease, taken_over)
+        except FileNotFoundError:
+            return True
+        if self.lease_state(taken_over) == seen:
+            os.remove(taken_over)
+            return True
+        try:
+            # A link won't replace a lease someone made in the meantime
+            os.link(taken_over, lease)
+        except FileExistsError:
+            pass
+        os.remove(taken_over)
+        return False
+
+
+    @staticmethod
+    def lease_state(lease):
+        """(contents, last heartbeat) of a lease, or None if there isn't one"""
+        try:
+            with open(lease) as lease_file:
+                contents = lease_file.read()
+            return contents, os.path.getmtime(lease)
+        except FileNotFoundError:
+            return None
+
+
+    def run_task(self, cell, start, stop, worker=None):
+        """
+        Runs contests start to stop of the cell and saves them as a chunk.
+        The worker's lease is touched every so often while it runs and
+        removed once the chunk is saved.
+
+        If a worker was only slow, not dead, and its task was taken over,
+        both run the same contests. They only depend on the seed, so
+        whichever saves them first keeps them, and the other's are dropped.
+        """
+        lease = self.lease_path(cell, start, stop)
+        finished = threading.Event()
+
+        def heartbeat():
+            while not finished.wait(self.lease_timeout / 4):
+                try:
+                    os.utime(lease)
+                except FileNotFoundError:
+                    return
+
+        beating = threading.Thread(target=heartbeat, daemon=True)
+        beating.start()
+        try:
+            repeated = RepeatedSimulations(self.song_df, seed=self.seed,
+                                           **{**self.settings, **cell})
+            repeated.simulate(num_repetitions=stop - start, first_contest=start)
+            try:
+                repeated.save(range(start, stop), store=ResultStore(self.filepath(cell)))
+            except ValueError:
+                # Another worker saved the same contests first
+                if not self.shard_path(cell, start, stop).exists():
+                    raise
+        finally:
+            finished.set()
+            beating.join()
+            self.release(lease, worker)
+        return repeated
+
+
+    def release(self, lease, worker):
+        """Removes the lease, unless another worker has taken it over"""
+        try:
+            with open(lease) as lease_file:
+                owner = lease_file.read().split()[0]
+            if owner == worker:
+                os.remove(lease)
+        except (FileNotFoundError, IndexError):
+            pass
+
+
+    def merge(self):
+        """
+        Indexes every cell of the grid that has all its contests, so the
+        dataset can be queried, see SweepDataset. Cells that are the same
+        contests share a partition. Returns the cells still missing contests.
+        """
+        pending = self.pending
+        finished = [(self.index_keys(cell), self.filepath(cell)) for cell in self.cells
+                    if self.canonical(cell) not in pending]
+        self.dataset.write_index(finished)
+        return pending
+
+
+    def results(self):
+        """{cell values in grid order: RepeatedSimulations} for every finished cell"""
+        results = {}
+        pending = self.pending
+        for cell in self.cells:
+            if self.canonical(cell) not in pending:
+                results[tuple(cell.values())] = RepeatedSimulations.load(self.filepath(cell))
+        return results
+
+
+if __name__ == "__main__":
+    command, directory = sys.argv[1:3]
+    sweep = Sweep.open(directory)
+    if command == "work":
+        print(f"Ran {sweep.work()} tasks.")
+    elif command == "merge":
+        unfinished = sweep.merge()
+        print(f"{len(unfinished)} cells are still missing contests.")
+    else:
+        raise ValueError(f"Unknown command: {command}, use work or merge.")
@@ -0,0 +1,143 @@
+'''
+A sweep's results as a partitioned columnar dataset, one ResultStore per
+cell of the grid:
+
+    directory/
+        index.parquet
+        ballot_limit=50/num_voters=500/listen_limit=100/num_winners=25/
+            settings.json
+            contests=0-10.parquet
+            contests=0-10.npz
+            ...
+        ballot_limit=50/num_voters=500/listen_limit=150/num_winners=25/
+        ...
+
+The index has a row per cell: its settings, which partition holds it, how
+many contests it has and its average fair winner counts. Queries look up
+the cells in the index and only open their partitions, and only read the
+columns asked for.
+'''
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .files import temporary_path
+from .result_store import ResultStore
+from .simulation import RepeatedSimulations
+
+
+INDEX_KEYS = ["ballot_limit", "num_voters", "listen_limit", "num_winners"]
+
+
+class SweepDataset:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._index = None
+
+
+    def partition(self, keys):
+        """
+        The directory of the cell with these settings, a dict of the
+        INDEX_KEYS and any other settings the grid has, in that order.
+        """
+        names = INDEX_KEYS + sorted(set(keys) - set(INDEX_KEYS))
+        return self.directory.joinpath(*[f"{name}={keys.get(name)}" for name in names])
+
+
+    def write_index(self, cells):
+        """
+        cells is [(cell settings, partition), ...], one for each cell of the
+        grid that's finished. Several cells can share a partition.
+        """
+        rows = []
+        summaries = {}
+        for keys, partition in cells:
+            if partition not in summaries:
+                summaries[partition] = self.summarize(partition)
+            rows.append({**keys, "partition": str(partition.relative_to(self.directory)),
+                         **summaries[partition]})
+        index = pd.DataFrame(rows)
+        for key in INDEX_KEYS:
+            if key in index.columns:
+                index[key] = index[key].astype("Int64")
+        temporary = temporary_path(self.directory / "index.parquet")
+        index.to_parquet(temporary, index=False)
+        os.replace(temporary, self.directory / "index.parquet")
+        self._index = None
+
+
+    def summarize(self, partition):
+        """How many contests a partition has and its average fair winner counts"""
+        records = ResultStore(partition).contests()
+        summary = {"num_contests": records.shape[0]}
+        for column in records.columns:
+            if column.startswith("num_") and column.endswith("_fair_winners"):
+                summary[f"mean_{column}"] = records[column].mean()
+        return summary
+
+
+    @property
+    def index(self):
+        if self._index is None:
+            filepath = self.directory / "index.parquet"
+            self._index = pd.read_parquet(filepath) if filepath.exists() else pd.DataFrame()
+        return self._index
+
+
+    def cells(self, **conditions):
+        """
+        The index rows of the cells that match every condition, e.g.
+
+            dataset.cells(num_voters=1000, listen_limit=[100, 200])
+
+        A condition is one value, or a list of values any of which match.
+        None matches a setting that wasn't set.
+        """
+        index = self.index
+        matches = np.ones(index.shape[0], dtype=bool)
+        for key, values in conditions.items():
+            if not isinstance(values, (list, tuple, set, range)):
+                values = [values]
+            values = list(values)
+            column = index[key]
+            matching = column.isin([value for value in values if value is not None])
+            if None in values:
+                matching |= column.isna()
+            matches &= matching.fillna(False).to_numpy(dtype=bool)
+        return index[matches].reset_index(drop=True)
+
+
+    def query(self, columns=None, **conditions):
+        """
+        Every contest of the matching cells, see cells, one row each with
+        the cell's settings. Only the matching partitions are opened, and
+        with columns, e.g. ["num_condorcet_fair_winners"], only those
+        columns are read.
+        """
+        cells = self.cells(**conditions)
+        keys = [column for column in self.index.columns
+                if column not in ["partition", "num_contests"] and not column.startswith("mean_")]
+        if columns is not None:
+            columns = [column for column in columns if column not in keys]
+
+        frames = []
+        for _, cell in cells.iterrows():
+            contests = ResultStore(self.directory / cell["partition"]).contests(columns=columns)
+            contests = contests.drop(columns=[key for key in keys if key in contests.columns])
+            for key in reversed(keys):
+                contests.insert(0, key, cell[key])
+            frames.append(contests)
+        if not frames:
+            return pd.DataFrame(columns=keys + (columns or []))
+        return pd.concat(frames, ignore_index=True)
+
+
+    def load(self, **keys):
+        """The RepeatedSimulations of the one cell with these settings"""
+        cells = self.cells(**keys)
+        if cells.shape[0] != 1:
+            raise ValueError(f"{cells.shape[0]} cells match {keys}, not one.")
+        return RepeatedSimulations.load(self.directory / cells["partition"][0])
@@ -0,0 +1,48 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from src import Simulation, BallotArchive, load_or_generate_objective_scores
+
+
+class TestBallotArchive(unittest.TestCase):
+    def setUp(self):
+        self.song_df = load_or_generate_objective_scores(500).head(100)
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = dict(listen_limit=40, ballot_limit=15, seed=3)
+
+
+    def simulate(self, **settings):
+        sim = Simulation(self.song_df, 300, **self.settings, **settings)
+        sim.simulate()
+        return sim
+
+
+    def test_replays_match_casting_again(self):
+        self.simulate().write_ballots(self.directory.name)
+        for settings in [dict(num_winners=5, methods=["condorcet", "current", "rcv", "stv"]),
+                         dict(num_winners=10, methods=["condorcet", "schulze"],
+                              num_mafiosos=1, mafia_size=50)]:
+            expected = self.simulate(**settings)
+            replayed = Simulation.from_archive(self.directory.name, **settings)
+            replayed.simulate()
+            for method in ["condorcet", "current_method", "rcv", "stv", "schulze"]:
+                assert list(getattr(replayed, f"{method}_winners")) == \
+                       list(getattr(expected, f"{method}_winners"))
+            assert np.array_equal(replayed.listen_counts["Listen Count"],
+                                  expected.listen_counts["Listen Count"])
+
+
+    def test_archive_is_memory_mapped(self):
+        sim = self.simulate(num_mafiosos=1, mafia_size=50)
+        archive = sim.write_ballots(self.directory.name)
+        assert archive.settings["ballot_limit"] == 15
+        ballots = archive.ballots()
+        assert isinstance(ballots.song_ids.base, np.memmap)
+        # The honest ballots are archived, not the corrupted ones
+        assert np.array_equal(ballots.song_ids, sim.non_corrupt_ballots.song_ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import Simulation, BallotFileReader, load_or_generate_objective_scores
+from src.ballot_reader import tally_ballot_file
+
+
+class TestBallotFileReader(unittest.TestCase):
+    def setUp(self):
+        self.song_df = load_or_generate_objective_scores(500).head(60)
+        self.sim = Simulation(self.song_df, 200, listen_limit=20, ballot_limit=8,
+                              num_winners=5, methods=["condorcet", "current"], seed=4)
+        self.sim.simulate()
+        self.directory = tempfile.TemporaryDirectory()
+
+        # One row per voter per song, each voter's rows in a random order
+        ballots = self.sim.ballots
+        rank = np.arange(ballots.song_ids.shape[0]) - np.repeat(ballots.offsets[:-1], ballots.lengths)
+        rows = pd.DataFrame({
+            "voter": 1000 + ballots.voters,
+            "song": self.song_df.index[ballots.song_ids],
+            "rank": rank + 1,
+            "score": ballots.scores,
+        })
+        self.rows = rows.sample(frac=1, random_state=0).sort_values("voter", kind="stable")
+
+
+    def write(self, rows, filename):
+        filepath = os.path.join(self.directory.name, filename)
+        if filename.endswith(".csv"):
+            rows.to_csv(filepath, index=False)
+        else:
+            rows.to_parquet(filepath, index=False)
+        return filepath
+
+
+    def test_chunked_tallies_match_the_simulation(self):
+        expected = self.sim.fused_tally
+        for filename, columns in [("ballots.csv", ["voter", "song", "rank"]),
+                                  ("ballots.parquet", ["voter", "song", "score"])]:
+            filepath = self.write(self.rows[columns], filename)
+            tally = BallotFileReader(filepath, self.song_df.index, chunk_size=37).tally(5)
+            assert tally.num_ballots == 200
+            assert np.array_equal(tally.pairwise_sums, expected.pairwise_sums)
+            assert np.array_equal(tally.finalist_votes, expected.finalist_votes)
+
+        condorcet, current_method = tally_ballot_file(filepath, self.song_df.index, 5, chunk_size=37)
+        assert list(condorcet.top_nominee_ids) == list(self.sim.condorcet_winners)
+        assert current_method.winners == self.sim.current_method_winners
+
+
+    def test_rejects_bad_ballots(self):
+        scattered = self.rows.sample(frac=1, random_state=1)
+        unknown = self.rows.replace({"song": {self.song_df.index[0]: -1}})
+        twice = pd.concat([self.rows.head(1), self.rows])
+        # Voter 1000 ranks another song first, either in the same chunk or
+        # a later one
+        same_rank = pd.concat([self.rows.head(1).assign(song=self.song_df.index[59], rank=1), self.rows])
+        returning = pd.concat([self.rows, self.rows.head(1)])
+        for rows in [scattered, unknown, twice, same_rank, returning]:
+            filepath = self.write(rows, "bad.csv")
+            with self.assertRaises(ValueError):
+                BallotFileReader(filepath, self.song_df.index, chunk_size=50).tally(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import RankedBallots
+
+
+def construct_score_ballot_df():
+    # Four songs, three voters. NaN means the song wasn't ranked.
+    data = {
+        0: [1.0, 3.0, np.nan, 2.0],
+        1: [np.nan, np.nan, 5.0, 9.0],
+        2: [7.0, 6.0, 8.0, 5.0],
+    }
+    return pd.DataFrame(data)
+
+
+class TestRankedBallots(unittest.TestCase):
+    def setUp(self):
+        self.ballot_df = construct_score_ballot_df()
+        self.ballots = RankedBallots.from_dataframe(self.ballot_df)
+
+
+    def test_ballots_are_ordered_best_first(self):
+        assert self.ballots.num_voters == 3
+        assert self.ballots.num_songs == 4
+        assert self.ballots[0].tolist() == [1, 3, 0]
+        assert self.ballots[1].tolist() == [3, 2]
+        assert self.ballots[2].tolist() == [2, 0, 1, 3]
+        assert self.ballots.song_ids.dtype == np.uint8
+
+
+    def test_round_trip_through_dataframe(self):
+        ballot_df = self.ballots.to_dataframe()
+        assert ballot_df.isnull().equals(self.ballot_df.isnull())
+        round_trip = RankedBallots.from_dataframe(ballot_df)
+        assert (round_trip.song_ids == self.ballots.song_ids).all()
+        assert (round_trip.offsets == self.ballots.offsets).all()
+
+
+    def test_scores_round_trip(self):
+        ballot_df = self.ballots.to_dataframe()
+        assert ballot_df.equals(self.ballot_df.astype(float))
+        points = self.ballots.to_dataframe(points=True)
+        assert points[2].tolist() == [3.0, 2.0, 4.0, 1.0]
+
+
+    def test_top_and_restrict(self):
+        top = self.ballots.top(2)
+        assert top.lengths.tolist() == [2, 2, 2]
+        assert top[2].tolist() == [2, 0]
+
+        restricted = self.ballots.restrict([3, 1])
+        assert restricted.num_songs == 2
+        assert restricted[0].tolist() == [0, 1]
+        assert restricted[1].tolist() == [1]
+
+
+    def test_promote(self):
+        ballots = self.ballots.copy()
+        ballots.promote(0, [0, 1])
+        assert ballots[0].tolist() == [0, 1, 3]
+        # Voter 1 never ranked song 0
+        assert ballots[1].tolist() == [3, 2]
+        assert self.ballots[0].tolist() == [1, 3, 0]
+
+
+    def test_scores_follow_their_songs(self):
+        assert self.ballots.scores.tolist() == [3.0, 2.0, 1.0, 9.0, 5.0, 8.0, 7.0, 6.0, 5.0]
+        ballots = self.ballots.copy()
+        ballots.promote(0, [0])
+        assert ballots.scores[:3].tolist() == [1.0, 3.0, 2.0]
+        assert ballots[1:].scores.tolist() == [9.0, 5.0, 8.0, 7.0, 6.0, 5.0]
+
+
+if __name__ == '__main__':
+    unittest.main()
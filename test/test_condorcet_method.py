@@ -1,8 +1,11 @@
 import unittest
 
+import numpy as np
 import pandas as pd
 
-from src import CondorcetCounting
+from src import CondorcetCounting, Condorcet, Simulation, load_or_generate_objective_scores
+from src import RankedBallots
+from src.condorcet_counting import CondorcetAccumulator
 
 
 def construct_jenna_example_df():
@@ -23,8 +26,13 @@ def construct_jenna_example_df():
     jennas_data[5] = [(1,5), (3,4), (4,8)]
     jennas_data[6] = [(0,6),(1,8),(3,10),(4,7)]
 
+    # Each voter rated a different number of entrants, so there's a row
+    # per voter per entrant they rated
     cols = ["ID", 'Subjective Ratings']
-    df = pd.DataFrame(data=jennas_data)
+    rows = [(voter, entrant, rating)
+            for voter, ratings in jennas_data.items()
+            for entrant, rating in ratings]
+    df = pd.DataFrame(rows, columns=["Voter"] + cols)
     return df
 
 
@@ -34,17 +42,197 @@ class TestCondorcetMethod(unittest.TestCase):
         self.assigned_guacs = 6
         # self.guac_df = pd.DataFrame([0,1,2,3,4,5], columns = ['Entrant'])
         # self.guac_df['Objective Ratings'] = 0
-        df = construct_jenna_example_df()
-        pass
+        self.df = construct_jenna_example_df()
 
 
     def test_jennas_example(self):
-        pass
+        assert self.df["Voter"].nunique() == self.num_townspeople
+        assert self.df["ID"].nunique() == self.assigned_guacs
+
+        # One column per voter, with the entrants they didn't taste left out
+        ballots = self.df.pivot(index="ID", columns="Voter", values="Subjective Ratings")
+        condorcet = Condorcet(ballots, n_winners=2)
+
+        # Entrants are only compared by voters who tasted both, e.g. three
+        # tasted 2 and 4, and two of them liked 4 better
+        assert condorcet.pairwise_sums[4, 2] == 2
+        assert condorcet.pairwise_sums[2, 4] == 1
+        # Three of the four who tasted 1 and 3 liked 1 better
+        assert condorcet.pairwise_sums[1, 3] == 3
+        assert condorcet.pairwise_sums[3, 1] == 1
+
+        # 2, 4 and 5 go round in a cycle, 2 and 5 beat everything else, and
+        # 2 beats 5
+        assert list(condorcet.top_nominee_ids) == [2, 5]
+        assert list(condorcet.top_vote_counts) == [4, 4]
 
 
     def tearDown(self):
         pass
 
+
+
+class TestPairwiseEngines(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(42)
+        song_df = load_or_generate_objective_scores(500)
+        self.sim = Simulation(song_df, 100, listen_limit=60, ballot_limit=20)
+        self.sim.reset_ballots()
+        self.sim.cast_ballots()
+
+
+    def test_listened_engine_matches_dense(self):
+        dense = Condorcet(self.sim.ballots, engine="dense")
+        listened = Condorcet(self.sim.ballots, engine="listened")
+        assert (dense.pairwise_sums == listened.pairwise_sums).all()
+        assert (dense.top_nominee_ids == listened.top_nominee_ids).all()
+
+
+    def test_batched_engine_matches_dense(self):
+        dense = Condorcet(self.sim.ballots, engine="dense")
+        batched = Condorcet(self.sim.ballots, engine="batched")
+        assert (dense.pairwise_sums == batched.pairwise_sums).all()
+
+
+    def test_batched_engine_with_full_ballots(self):
+        song_df = load_or_generate_objective_scores(500)
+        sim = Simulation(song_df, 20, num_winners=5)
+        sim.reset_ballots()
+        sim.cast_ballots()
+        # Truncate some ballots so ranked and unranked songs are mixed
+        ballots = sim.ballots.top(450)
+        dense = Condorcet(ballots, engine="dense")
+        batched = Condorcet(ballots, engine="batched")
+        assert (dense.pairwise_sums == batched.pairwise_sums).all()
+
+
+    def test_unranked_songs_are_not_compared(self):
+        condorcet = Condorcet(self.sim.ballots, engine="listened")
+        pairs_per_ballot = 20 * 19 / 2
+        assert condorcet.pairwise_sums.sum() == 100 * pairs_per_ballot
+
+
+
+class TestTieBreaking(unittest.TestCase):
+    def setUp(self):
+        # Song 0 beats everyone. Songs 1, 2 and 3 beat each other in a cycle,
+        # so they all have one win, but song 2 has the best margin.
+        ballots = [[0, 1, 2, 3]]*2 + [[0, 2, 3, 1]]*2 + [[0, 3, 1, 2]]
+        self.ballots = RankedBallots(np.concatenate(ballots), np.arange(6)*4, 4)
+
+
+    def test_tie_across_the_cutoff_is_broken(self):
+        condorcet = Condorcet(self.ballots, n_winners=2)
+        assert condorcet.top_nominee_ids.tolist() == [0, 2]
+        assert condorcet.tied_at_cutoff.tolist() == [1, 2, 3]
+
+
+    def test_tie_across_the_cutoff_can_be_included(self):
+        condorcet = Condorcet(self.ballots, n_winners=2, boundary_ties="include")
+        assert condorcet.top_nominee_ids.tolist() == [0, 2, 1, 3]
+        assert condorcet.top_vote_counts.tolist() == [3, 1, 1, 1]
+        with self.assertRaises(ValueError):
+            Condorcet(self.ballots, n_winners=2, boundary_ties="brake")
+
+
+class TestCondorcetAccumulator(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(3)
+        song_df = load_or_generate_objective_scores(500)
+        self.sim = Simulation(song_df, 120, listen_limit=80, ballot_limit=30)
+        self.sim.reset_ballots()
+        self.sim.cast_ballots()
+        self.condorcet = Condorcet(self.sim.ballots, n_winners=10, break_ties=False)
+
+
+    def test_one_ballot_at_a_time(self):
+        accumulator = CondorcetAccumulator(500, n_winners=10)
+        for ballot in self.sim.ballots:
+            accumulator.add_ballot(ballot)
+        assert (accumulator.pairwise_sums == self.condorcet.pairwise_sums).all()
+        copeland_scores = self.condorcet.preferences.sum(axis=1)
+        assert (accumulator.copeland_scores == copeland_scores).all()
+        assert accumulator.num_ballots == 120
+
+
+    def test_chunks(self):
+        accumulator = CondorcetAccumulator(500, n_winners=10)
+        for start in range(0, 120, 50):
+            accumulator.add_ballots(self.sim.ballots[start:start+50])
+        assert (accumulator.pairwise_sums == self.condorcet.pairwise_sums).all()
+        assert (accumulator.top_vote_counts == self.condorcet.top_vote_counts).all()
+
+
+    def test_streamed_simulation(self):
+        song_df = load_or_generate_objective_scores(500)
+        sim = Simulation(song_df, 100, listen_limit=80, ballot_limit=30, keep_ballots=False)
+        counted = []
+        sim.simulate(on_batch=lambda sim: counted.append(sim.condorcet.num_ballots))
+        assert counted[-1] == 100
+        assert len(sim.condorcet_winners) == 10
+        assert sim.ballots is None
+
+
+    def test_streamed_ties_are_broken_like_condorcet(self):
+        song_df = load_or_generate_objective_scores(500)
+        for seed in [0, 2]:
+            streamed = Simulation(song_df, 100, listen_limit=80, ballot_limit=30,
+                                  keep_ballots=False, seed=seed, methods=["condorcet"])
+            streamed.simulate()
+            kept = Simulation(song_df, 100, listen_limit=80, ballot_limit=30, seed=seed,
+                              methods=["condorcet"])
+            kept.simulate()
+            # These seeds have ties among the top ten Copeland scores
+            unbroken = Condorcet(kept.ballots, n_winners=10, break_ties=False)
+            assert list(unbroken.top_nominee_ids) != list(kept.condorcet_winners)
+            assert list(streamed.condorcet_winners) == list(kept.condorcet_winners)
+
+
+    def test_ties_across_the_cutoff(self):
+        # The cycle from TestTieBreaking
+        ballots = [[0, 1, 2, 3]]*2 + [[0, 2, 3, 1]]*2 + [[0, 3, 1, 2]]
+        ballots = RankedBallots(np.concatenate(ballots), np.arange(6)*4, 4)
+        for boundary_ties in ["break", "include"]:
+            accumulator = CondorcetAccumulator(4, n_winners=2, boundary_ties=boundary_ties)
+            accumulator.add_ballots(ballots)
+            condorcet = Condorcet(ballots, n_winners=2, boundary_ties=boundary_ties)
+            assert accumulator.top_nominee_ids.tolist() == condorcet.top_nominee_ids.tolist()
+            assert accumulator.top_vote_counts.tolist() == condorcet.top_vote_counts.tolist()
+
+
+def smith_or_schwartz_set_by_closure(matrix_of_more_preferred):
+    """Reference answer from the full transitive closure"""
+    reaches = matrix_of_more_preferred.copy()
+    for middle in range(reaches.shape[0]):
+        reaches |= reaches[:, [middle]] & reaches[[middle], :]
+    excluded = (reaches.T & ~reaches).any(axis=1)
+    return ~excluded
+
+
+class TestSmithSchwartzSet(unittest.TestCase):
+    def test_cycle_at_the_top(self):
+        # 0, 1 and 2 beat each other in a cycle, and all of them beat 3
+        sums = np.array([
+            [0, 6, 3, 7],
+            [4, 0, 6, 7],
+            [7, 4, 0, 7],
+            [3, 3, 3, 0],
+        ])
+        preferences = CondorcetCounting.get_schwartz_relations_matrix(sums)
+        statuses = CondorcetCounting.get_smith_or_schwartz_set_statuses(preferences)
+        assert statuses["in_set"].tolist() == [True, True, True, False]
+
+
+    def test_matches_transitive_closure(self):
+        rng = np.random.default_rng(7)
+        for _ in range(100):
+            num_songs = rng.integers(2, 12)
+            sums = rng.integers(0, 4, size=(num_songs, num_songs))
+            preferences = CondorcetCounting.get_schwartz_relations_matrix(sums)
+            statuses = CondorcetCounting.get_smith_or_schwartz_set_statuses(preferences)
+            expected = smith_or_schwartz_set_by_closure(preferences)
+            assert (statuses["in_set"].values == expected).all()
+
         
 if __name__ == '__main__':
     # unittest.main()
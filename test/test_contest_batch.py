@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+from src import Simulation, RepeatedSimulations, ContestBatch, load_or_generate_objective_scores
+
+
+class TestContestBatch(unittest.TestCase):
+    def setUp(self):
+        self.song_df = load_or_generate_objective_scores(500).head(100)
+        self.contests = range(4)
+
+
+    def test_matches_each_simulation(self):
+        settings = dict(listen_limit=30, ballot_limit=10, num_winners=5,
+                        num_mafiosos=2, mafia_size=60, shard_size=150,
+                        methods=["condorcet", "current", "schulze"])
+        batch = ContestBatch(Simulation(self.song_df, 400, seed=5, **settings), self.contests)
+        for ii in self.contests:
+            sim = Simulation(self.song_df, 400, seed=5, contest=ii, **settings)
+            sim.simulate()
+            assert np.array_equal(batch.pairwise_sums[ii], sim.fused_tally.pairwise_sums)
+            assert np.array_equal(batch.listen_counts[ii], sim.listen_counts["Listen Count"].values)
+            assert list(batch.results[ii]["condorcet_winners"]) == list(sim.condorcet_winners)
+            assert batch.results[ii]["current_method_winners"] == sim.current_method_winners
+            assert batch.results[ii]["schulze_winners"] == sim.schulze_winners
+            assert batch.results[ii]["num_condorcet_fair_winners"] == sim.num_condorcet_fair_winners
+
+
+    def test_repeated_simulations_in_batches(self):
+        repeated = {}
+        for contest_batch in [None, 3]:
+            repeated[contest_batch] = RepeatedSimulations(self.song_df, 200, listen_limit=40,
+                num_winners=5, num_workers=1, seed=11, contest_batch=contest_batch)
+            repeated[contest_batch].simulate(num_repetitions=7)
+        assert np.array_equal(repeated[None].sum_of_sums, repeated[3].sum_of_sums)
+        assert repeated[None].num_condorcet_fair_winners == repeated[3].num_condorcet_fair_winners
+        assert repeated[None].current_method_winners == repeated[3].current_method_winners
+
+
+    def test_repeated_simulations_without_condorcet(self):
+        settings = dict(listen_limit=40, num_winners=5, seed=11)
+        expected = RepeatedSimulations(self.song_df, 100, **settings)
+        expected.simulate(num_repetitions=3)
+        for contest_batch in [None, 2]:
+            repeated = RepeatedSimulations(self.song_df, 100, methods=["current", "schulze"],
+                                           contest_batch=contest_batch, **settings)
+            repeated.simulate(num_repetitions=3)
+            assert np.array_equal(repeated.sum_of_sums, expected.sum_of_sums)
+            assert np.array_equal(repeated.sum_of_rankings, expected.sum_of_rankings)
+            assert repeated.current_method_winners == expected.current_method_winners
+
+        # Without a seed the contests run one after another in this process
+        repeated = RepeatedSimulations(self.song_df, 100, listen_limit=40, num_winners=5,
+                                       methods=["current", "schulze"])
+        repeated.simulate(num_repetitions=2)
+        assert repeated.sum_of_sums.sum() == 2 * 100 * 40 * 39 // 2
+        assert len(repeated.schulze_winners) == 2
+
+
+    def test_runoffs_cannot_be_batched(self):
+        with self.assertRaises(ValueError):
+            ContestBatch(Simulation(self.song_df, 10, seed=5, methods=["rcv"]), self.contests)
+
+
+if __name__ == '__main__':
+    unittest.main()
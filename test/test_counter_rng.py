@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+from src import Simulation, RepeatedSimulations, load_or_generate_objective_scores
+from src.counter_rng import philox, CounterRNG
+
+
+class TestCounterRNG(unittest.TestCase):
+    def test_philox_matches_numpy(self):
+        key = np.array([123456789, 2**63 + 5], dtype=np.uint64)
+        counter = np.array([7, 0, 3, 0], dtype=np.uint64)
+        bit_generator = np.random.Philox(key=int(key[0]) + (int(key[1]) << 64),
+                                         counter=6 + (3 << 128))
+        assert np.array_equal(philox(counter, key), bit_generator.random_raw(4))
+
+
+    def test_samples_are_distinct(self):
+        draws = CounterRNG(1).for_voters(0, 50)
+        songs = draws.sample(300, 40)
+        assert songs.shape == (50, 40)
+        assert songs.min() >= 0 and songs.max() < 300
+        assert all(len(set(row)) == 40 for row in songs)
+
+
+    def test_draws_do_not_depend_on_the_block(self):
+        rng = CounterRNG(1, contest=2)
+        block = rng.for_voters(10, 20).normal(size=(20, 5))
+        single = rng.for_voters(17, 1).normal(size=(1, 5))
+        assert np.array_equal(block[7], single[0])
+        assert not np.array_equal(CounterRNG(1, contest=3).for_voters(17, 1).normal(size=(1, 5)), single)
+
+
+class TestRebuildingBallots(unittest.TestCase):
+    def setUp(self):
+        self.song_df = load_or_generate_objective_scores(500).head(100)
+
+
+    def test_rebuilt_ballots_match_the_contest(self):
+        for settings in [dict(listen_limit=30, ballot_limit=10, num_mafiosos=2, mafia_size=40),
+                         dict(alphabetical=True)]:
+            sim = Simulation(self.song_df, 200, seed=9, contest=4, shard_size=64, **settings)
+            sim.simulate()
+            for voter in [0, 39, 63, 64, 199]:
+                ballot = sim.rebuild_ballot(voter)
+                assert ballot.index.tolist() == sim.song_df.index[sim.ballots[voter]].tolist()
+                assert np.array_equal(ballot.values, sim.ballots.scores[
+                    sim.ballots.offsets[voter]:sim.ballots.offsets[voter+1]])
+
+
+    def test_shard_size_does_not_matter(self):
+        pairwise_sums = []
+        for shard_size in [7, 200]:
+            sim = Simulation(self.song_df, 200, listen_limit=30, seed=9, shard_size=shard_size)
+            sim.simulate()
+            pairwise_sums.append(sim.fused_tally.pairwise_sums)
+        assert np.array_equal(*pairwise_sums)
+
+
+    def test_repeated_simulations_keep_only_summaries(self):
+        repeated = RepeatedSimulations(self.song_df, 100, listen_limit=30, seed=9)
+        repeated.simulate(num_repetitions=2)
+        assert repeated.__getstate__()["sim"] is None
+        sim = repeated.simulation(1)
+        sim.simulate()
+        assert list(sim.condorcet_winners) == list(repeated.condorcet_winners[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
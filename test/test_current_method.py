@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import OneVotePerFinalist, RankedBallots
+
+
+class TestOneVotePerFinalist(unittest.TestCase):
+    def setUp(self):
+        # Five songs, four voters, best first
+        song_ids = [0, 1, 2,   1, 0, 4,   1, 3,   2]
+        offsets = [0, 3, 6, 8, 9]
+        self.ballots = RankedBallots(song_ids, offsets, num_songs=5)
+
+
+    def test_vote_totals_and_winners(self):
+        current = OneVotePerFinalist(self.ballots, num_winners=2)
+        assert current.vote_totals.tolist() == [2, 3, 1, 1, 0]
+        assert current.winners == [1, 0]
+
+
+    def test_tallies_are_built_on_request(self):
+        current = OneVotePerFinalist(self.ballots, num_winners=2)
+        assert current._tallies is None
+        tallies = current.tallies
+        assert tallies.shape == (5, 4)
+        assert (tallies.sum(axis=1) == current.vote_totals).all()
+        assert tallies[3].tolist() == [0, 0, 1, 0, 0]
+
+
+    def test_accepts_score_dataframe(self):
+        ballot_df = self.ballots.to_dataframe()
+        current = OneVotePerFinalist(ballot_df, num_winners=2)
+        assert current.vote_totals.tolist() == [2, 3, 1, 1, 0]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import Condorcet, FusedTally, OneVotePerFinalist, RankedBallots
+
+
+class TestFusedTally(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        num_voters, num_songs = 300, 40
+        songs = np.argsort(rng.random((num_voters, num_songs)), axis=1)[:, :15]
+        scores = rng.normal(size=songs.shape)
+        ranked = rng.random(songs.shape) < 0.7
+        self.ballots = RankedBallots.from_score_rows(songs, scores, ranked, num_songs)
+        self.tally = FusedTally(num_songs, num_winners=5).tally(self.ballots, block_budget=2**10)
+
+
+    def test_matches_the_separate_tallies(self):
+        condorcet = Condorcet(self.ballots, n_winners=5, engine="listened")
+        assert (self.tally.pairwise_sums == condorcet.pairwise_sums).all()
+
+        current = OneVotePerFinalist(self.ballots, 5)
+        assert (self.tally.results("current") == current.vote_totals).all()
+
+
+    def test_points_and_scores(self):
+        ballot_df = self.ballots.to_dataframe(points=True)
+        assert (self.tally.borda_points == ballot_df.sum(axis=1).values).all()
+        assert (self.tally.num_rankings == ballot_df.notnull().sum(axis=1).values).all()
+        assert (self.tally.first_choices == np.bincount(
+            [ballot[0] for ballot in self.ballots if len(ballot)], minlength=40)).all()
+
+        score_sums = np.zeros(40)
+        for ballot, start in zip(self.ballots, self.ballots.offsets):
+            score_sums[ballot] += self.ballots.scores[start:start+len(ballot)]
+        assert np.allclose(self.tally.score_sums, score_sums)
+        assert len(self.tally.winners("mean")) == 5
+
+
+if __name__ == '__main__':
+    unittest.main()
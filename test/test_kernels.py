@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+
+from src import kernels, FusedTally, RankedBallots, SingleTransferableVote
+from src import Simulation, ContestBatch, load_or_generate_objective_scores
+from src.ranked_choice_voting import RankChoiceVoting
+
+
+def run_with_backend(backend, function):
+    previous = kernels.BACKEND
+    kernels.use_backend(backend)
+    try:
+        return function()
+    finally:
+        kernels.use_backend(previous)
+
+
+@unittest.skipUnless(kernels.njit is not None, "numba is not installed")
+class TestKernels(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        num_voters, num_songs = 400, 60
+        self.songs = np.argsort(rng.random((num_voters, num_songs)), axis=1)[:, :20]
+        self.scores = np.round(rng.normal(size=self.songs.shape), 1)
+        self.ranked = rng.random(self.songs.shape) < 0.6
+        self.num_songs = num_songs
+
+
+    def make_ballots(self):
+        return RankedBallots.from_score_rows(self.songs, self.scores, self.ranked, self.num_songs)
+
+
+    def test_ballots_are_identical(self):
+        numpy_ballots = run_with_backend("numpy", self.make_ballots)
+        numba_ballots = run_with_backend("numba", self.make_ballots)
+        assert np.array_equal(numpy_ballots.song_ids, numba_ballots.song_ids)
+        assert np.array_equal(numpy_ballots.offsets, numba_ballots.offsets)
+        assert np.array_equal(numpy_ballots.scores, numba_ballots.scores)
+
+
+    def test_tallies_are_identical(self):
+        ballots = run_with_backend("numpy", self.make_ballots)
+        tally = lambda: FusedTally(self.num_songs, 5).tally(ballots, block_budget=2**12)
+        numpy_tally = run_with_backend("numpy", tally)
+        numba_tally = run_with_backend("numba", tally)
+        for name in ["pairwise_sums", "finalist_votes", "first_choices",
+                     "borda_points", "num_rankings", "score_sums"]:
+            assert np.array_equal(getattr(numpy_tally, name), getattr(numba_tally, name))
+
+
+    def test_runoffs_are_identical(self):
+        ballots = run_with_backend("numpy", self.make_ballots)
+        for method in [RankChoiceVoting, lambda: SingleTransferableVote(5)]:
+            numpy_result = run_with_backend("numpy", lambda: method().tally(ballots))
+            numba_result = run_with_backend("numba", lambda: method().tally(ballots))
+            assert numpy_result == numba_result
+
+
+    def test_contest_batches_are_identical(self):
+        song_df = load_or_generate_objective_scores(500).head(100)
+        sim = Simulation(song_df, 300, listen_limit=40, ballot_limit=15, seed=3)
+        numpy_batch = run_with_backend("numpy", lambda: ContestBatch(sim, range(5)))
+        numba_batch = run_with_backend("numba", lambda: ContestBatch(sim, range(5)))
+        assert np.array_equal(numpy_batch.pairwise_sums, numba_batch.pairwise_sums)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src import PairwiseCounts, RepeatedSimulations, load_or_generate_objective_scores
+
+
+class TestPairwiseCounts(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.contests = [rng.integers(0, 150, size=(13, 13)) for _ in range(4)]
+        for contest in self.contests:
+            np.fill_diagonal(contest, 0)
+
+
+    def test_counts_are_exact(self):
+        counts = PairwiseCounts(13)
+        for contest in self.contests:
+            counts.add(contest)
+        expected = sum(self.contests)
+        assert np.array_equal(counts.dense(), expected)
+        # 4 contests of up to 2 * 149 per pair fit in 16 bits, instead of 64
+        assert counts.totals.dtype == np.uint16
+        assert counts.nbytes < expected.nbytes / 4
+
+        majority = PairwiseCounts.unpack_majority(counts.majority(), 13)
+        assert np.array_equal(majority, expected > expected.T)
+
+
+    def test_counts_added_separately(self):
+        counts = PairwiseCounts(13).add(self.contests[0])
+        added = counts.zeros_like("added")
+        assert added.directory is None
+        added.add(self.contests[1]).add(self.contests[2])
+        assert np.array_equal(added.dense(), self.contests[1] + self.contests[2])
+        counts.merge(added)
+        assert np.array_equal(counts.dense(), sum(self.contests[:3]))
+
+
+    def test_memory_mapped_counts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            counts = PairwiseCounts(13, directory)
+            counts.add(self.contests[0])
+            counts.merge(PairwiseCounts(13).add(self.contests[1]))
+            counts.flush()
+            opened = PairwiseCounts.open(directory)
+            assert isinstance(opened.totals, np.memmap)
+            assert np.array_equal(opened.dense(), self.contests[0] + self.contests[1])
+            added = opened.zeros_like("added")
+            assert isinstance(added.totals, np.memmap)
+            assert added.directory.parent == opened.directory.parent
+
+
+    def test_repeated_simulations_sums_are_unchanged(self):
+        song_df = load_or_generate_objective_scores(500).head(60)
+        repeated = RepeatedSimulations(song_df, 40, listen_limit=20, num_winners=5, seed=1)
+        repeated.simulate(num_repetitions=3)
+        expected = np.zeros((60, 60))
+        for contest in range(3):
+            sim = repeated.simulation(contest)
+            sim.simulate()
+            expected += sim.condorcet.pairwise_sums
+        assert np.array_equal(repeated.sum_of_sums, expected)
+
+
+    def test_saved_memory_mapped_counts(self):
+        song_df = load_or_generate_objective_scores(500).head(60)
+        settings = dict(listen_limit=20, num_winners=5, seed=1)
+        expected = RepeatedSimulations(song_df, 40, **settings)
+        expected.simulate(num_repetitions=5)
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "results")
+            counts_directory = os.path.join(directory, "counts")
+            repeated = RepeatedSimulations(song_df, 40, num_workers=2, filepath=filepath,
+                                           counts_directory=counts_directory, **settings)
+            repeated.simulate(num_repetitions=3)
+            repeated.simulate(num_repetitions=2)
+            assert isinstance(repeated.pairwise_counts.totals, np.memmap)
+            assert sorted(os.listdir(counts_directory)) == ["sum_of_rankings", "sum_of_sums"]
+            assert np.array_equal(repeated.sum_of_sums, expected.sum_of_sums)
+            assert np.array_equal(repeated.sum_of_rankings, expected.sum_of_rankings)
+            # Each chunk only has what its own contests added
+            loaded = RepeatedSimulations.load(filepath)
+            assert np.array_equal(loaded.sum_of_sums, expected.sum_of_sums)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import RankedBallots
+from src.ranked_choice_voting import RankChoiceVoting
+
+
+class TestRankChoiceVoting(unittest.TestCase):
+    def setUp(self):
+        # Entrants 0-3. 0 leads on first choices but 1 wins once 2 and 3 are
+        # dropped and their ballots move on to their next choices.
+        ballots = [[0]]*5 + [[1, 0]]*4 + [[2, 1]]*2 + [[3, 2, 1]]*1
+        song_ids = np.concatenate(ballots)
+        offsets = np.concatenate([[0], np.cumsum([len(b) for b in ballots])])
+        self.ballots = RankedBallots(song_ids, offsets, num_songs=4)
+
+
+    def test_instant_runoff(self):
+        rcv = RankChoiceVoting()
+        rankings = rcv.tally(self.ballots)
+        assert rcv.win_type == "majority"
+        assert rankings == [(1, 7), (0, 5)]
+        assert rcv.eliminations == 2
+        assert rcv.ordering == [1, 0, 2, 3]
+
+
+    def test_exhausted_ballots(self):
+        rcv = RankChoiceVoting(N=1)
+        rankings = rcv.tally(self.ballots)
+        # Nobody's ballot moves past their first choice
+        assert rcv.win_type == "plurality"
+        assert rankings == [(0, 5), (1, 4)]
+
+
+    def test_entrants_without_votes_are_ranked(self):
+        # 0 wins a majority in the first round, before 2 can be dropped
+        ballots = [[0]]*3 + [[1, 0]]*1
+        song_ids = np.concatenate(ballots)
+        offsets = np.concatenate([[0], np.cumsum([len(b) for b in ballots])])
+        rcv = RankChoiceVoting()
+        rankings = rcv.tally(RankedBallots(song_ids, offsets, num_songs=3))
+        assert rcv.win_type == "majority"
+        assert rankings == [(0, 3), (1, 1), (2, 0)]
+        assert rcv.ordering == [0, 1, 2]
+
+
+    def test_score_ballots(self):
+        ballot_df = pd.DataFrame({
+            0: [9, 2, 5],
+            1: [8, 1, 7],
+            2: [1, 9, 8],
+        })
+        rcv = RankChoiceVoting()
+        ranks = rcv.convert_score_ballots_to_implicit_ranks(ballot_df)
+        assert ranks["Ranks 0"].tolist() == [1, 3, 2]
+        rankings = rcv.tally_results(ranks)
+        assert rankings[0][0] == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+import numpy as np
+
+from src import Condorcet, RankedBallots, RankedPairs
+
+
+class TestRankedPairs(unittest.TestCase):
+    def test_tennessee_example(self):
+        # Memphis, Nashville, Chattanooga, Knoxville are 0 to 3
+        ballots = [[0, 1, 2, 3]]*42 + [[1, 2, 3, 0]]*26 + [[2, 3, 1, 0]]*15 + [[3, 2, 1, 0]]*17
+        ballots = RankedBallots(np.concatenate(ballots), np.arange(101)*4, 4)
+        pairwise_sums = Condorcet(ballots, n_winners=4).pairwise_sums
+        ranked_pairs = RankedPairs(pairwise_sums, n_winners=1)
+        assert ranked_pairs.ranking.tolist() == [1, 2, 3, 0]
+        assert ranked_pairs.winners == [1]
+
+
+    def test_weakest_win_in_a_cycle_is_skipped(self):
+        # 0 beats 1 by 5, 1 beats 2 by 3 and 2 beats 0 by 1
+        pairwise_sums = np.array([
+            [0, 5, 0],
+            [0, 0, 3],
+            [1, 0, 0],
+        ])
+        ranked_pairs = RankedPairs(pairwise_sums)
+        assert not ranked_pairs.locked[2, 0]
+        assert ranked_pairs.ranking.tolist() == [0, 1, 2]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src import RepeatedSimulations, ResultStore, load_or_generate_objective_scores
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.song_df = load_or_generate_objective_scores(500).head(100)
+        self.directory = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.directory.name, "results")
+
+
+    def make_repeated(self, **kwargs):
+        settings = dict(listen_limit=20, num_winners=5, seed=3,
+                        methods=["condorcet", "current", "schulze"])
+        settings.update(kwargs)
+        return RepeatedSimulations(self.song_df, 50, **settings)
+
+
+    def test_appends_match_one_run(self):
+        repeated = self.make_repeated(filepath=self.filepath)
+        repeated.simulate(num_repetitions=3)
+        repeated.simulate(num_repetitions=2)
+        expected = self.make_repeated()
+        expected.simulate(num_repetitions=5)
+
+        store = ResultStore(self.filepath)
+        assert store.chunks == ["contests=0-3", "contests=3-5"]
+        assert np.array_equal(store.accumulator("sum_of_sums"), expected.sum_of_sums)
+        # Chunks keep the compact counts, not N x N int64s
+        with np.load(os.path.join(self.filepath, "contests=0-3.npz")) as arrays:
+            assert sorted(arrays) == ["sum_of_rankings_margin", "sum_of_rankings_totals",
+                                      "sum_of_sums_margin", "sum_of_sums_totals"]
+            assert arrays["sum_of_sums_totals"].shape == (100 * 99 // 2,)
+            assert arrays["sum_of_sums_totals"].dtype == np.uint8
+
+        loaded = RepeatedSimulations.load(self.filepath)
+        assert loaded.num_contests == 5
+        assert np.array_equal(loaded.sum_of_rankings, expected.sum_of_rankings)
+        assert loaded.num_schulze_fair_winners == expected.num_schulze_fair_winners
+        assert loaded.current_method_winners == expected.current_method_winners
+        assert loaded.song_df["ID"].equals(self.song_df["ID"])
+
+
+    def test_partial_reads(self):
+        self.make_repeated(filepath=self.filepath).simulate(num_repetitions=4)
+        records = ResultStore(self.filepath).contests(columns=["num_condorcet_fair_winners"],
+                                                      contests=[1, 3])
+        assert list(records.columns) == ["contest", "num_condorcet_fair_winners"]
+        assert records["contest"].tolist() == [1, 3]
+
+
+    def test_carries_on_from_saved_contests(self):
+        self.make_repeated(filepath=self.filepath).simulate(num_repetitions=2)
+        repeated = self.make_repeated(filepath=self.filepath)
+        assert repeated.num_contests == 2
+        repeated.simulate(num_repetitions=2)
+        assert ResultStore(self.filepath).contests()["contest"].tolist() == [0, 1, 2, 3]
+        with self.assertRaises(ValueError):
+            repeated.simulate(num_repetitions=1, first_contest=0)
+        with self.assertRaises(ValueError):
+            self.make_repeated(filepath=self.filepath, num_winners=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from src import Schulze
+
+
+def construct_wikipedia_example():
+    # The 45 voter, 5 candidate example from the Schulze method article.
+    # Row-Col, how many voters prefer row to col. A to E are 0 to 4.
+    return np.array([
+        [ 0, 20, 26, 30, 22],
+        [25,  0, 16, 33, 18],
+        [19, 29,  0, 17, 24],
+        [15, 12, 28,  0, 14],
+        [23, 27, 21, 31,  0],
+    ])
+
+
+class TestSchulze(unittest.TestCase):
+    def test_wikipedia_example(self):
+        schulze = Schulze(construct_wikipedia_example(), n_winners=None)
+        # E > A > C > B > D
+        assert schulze.ranking.tolist() == [4, 0, 2, 1, 3]
+
+
+    def test_matches_floyd_warshall(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            pairwise_sums = rng.integers(0, 4, size=(8, 8))
+            np.fill_diagonal(pairwise_sums, 0)
+
+            strengths = np.where(pairwise_sums > pairwise_sums.T, pairwise_sums, 0)
+            for kk in range(8):
+                strengths = np.maximum(strengths, np.minimum(strengths[:, kk, None], strengths[kk]))
+            beats = strengths > strengths.T
+
+            ranking = Schulze(pairwise_sums, n_winners=None).ranking
+            for ii, song in enumerate(ranking):
+                assert not beats[ranking[ii+1:], song].any()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 
-from src import Simulation
+import numpy as np
+
+from src import Simulation, RepeatedSimulations, Condorcet, load_or_generate_objective_scores
 from src import logic as lg
 
 
@@ -33,6 +35,126 @@ class TestSimulation(unittest.TestCase):
     def tearDown(self):
         pass
 
-        
+
+
+class TestBatchedBallots(unittest.TestCase):
+    def setUp(self):
+        self.song_df = load_or_generate_objective_scores(500)
+        self.num_voters = 200
+
+
+    def cast(self, **kwargs):
+        sim = Simulation(self.song_df, self.num_voters, **kwargs)
+        sim.reset_ballots()
+        sim.cast_ballots()
+        return sim
+
+
+    def test_listen_and_ballot_limits(self):
+        sim = self.cast(listen_limit=100, ballot_limit=25)
+        assert sim.ballots.num_songs == 500
+        assert sim.ballots.num_voters == self.num_voters
+        assert (sim.ballots.lengths == 25).all()
+        assert sim.listen_counts["Listen Count"].sum() == 100 * self.num_voters
+
+
+    def test_ballot_limit_keeps_the_top_scores(self):
+        np.random.seed(0)
+        sim = self.cast(ballot_limit=10)
+        top_songs = self.song_df["Objective Ratings"].values[sim.ballots.song_ids]
+        assert (sim.ballots.lengths == 10).all()
+        assert top_songs.mean() > self.song_df["Objective Ratings"].mean()
+
+
+    def test_alphabetical_listens_from_the_top(self):
+        sim = self.cast(alphabetical=True)
+        listened = sim.ballots.to_dataframe().notnull()
+        # Everyone starts at the top of the list and stops somewhere
+        assert listened.iloc[0].all()
+        assert (listened.cummin() == listened).all().all()
+        counts = sim.listen_counts["Listen Count"].values
+        assert counts.sum() == listened.values.sum()
+
+
+    def test_matches_the_voter_loop_on_average(self):
+        np.random.seed(1)
+        batched = self.cast(listen_limit=250, ballot_limit=50)
+        np.random.seed(1)
+        looped = self.cast(listen_limit=250, ballot_limit=50, batched=False)
+        ratings = self.song_df["Objective Ratings"].values
+        batched_mean = ratings[batched.ballots.song_ids].mean()
+        looped_mean = ratings[looped.ballots.song_ids].mean()
+        assert abs(batched_mean - looped_mean) < 1.0
+
+
+class TestShardedVoting(unittest.TestCase):
+    def setUp(self):
+        self.song_df = load_or_generate_objective_scores(500)
+        self.methods = ["condorcet", "current", "rcv", "sum", "schulze"]
+
+
+    def simulate(self, num_threads, **kwargs):
+        np.random.seed(3)
+        sim = Simulation(self.song_df, 300, listen_limit=80, ballot_limit=20,
+                         num_mafiosos=2, mafia_size=40, methods=self.methods,
+                         num_threads=num_threads, shard_size=70, **kwargs)
+        sim.simulate()
+        return sim
+
+
+    def test_results_do_not_depend_on_num_threads(self):
+        one = self.simulate(1)
+        for num_threads in [2, 4]:
+            sim = self.simulate(num_threads)
+            assert np.array_equal(sim.fused_tally.pairwise_sums, one.fused_tally.pairwise_sums)
+            assert np.array_equal(sim.fused_tally.score_sums, one.fused_tally.score_sums)
+            assert np.array_equal(sim.ballots.song_ids, one.ballots.song_ids)
+            for method in self.methods:
+                winners = f"{method}_winners" if method != "current" else "current_method_winners"
+                assert list(getattr(sim, winners)) == list(getattr(one, winners))
+
+
+    def test_shards_add_up_to_the_ballots(self):
+        sim = self.simulate(2)
+        assert sim.ballots.num_voters == 300
+        assert sim.fused_tally.num_ballots == 300
+        assert (sim.ballots.lengths == 20).all()
+        assert sim.listen_counts["Listen Count"].sum() == 80 * 300
+        recounted = Condorcet(sim.ballots, break_ties=False).pairwise_sums
+        assert np.array_equal(sim.fused_tally.pairwise_sums, recounted)
+
+
+    def test_runoffs_need_the_ballots(self):
+        with self.assertRaises(ValueError):
+            self.simulate(2, keep_ballots=False)
+
+
+class TestParallelRepetitions(unittest.TestCase):
+    def repeat(self, num_workers):
+        song_df = load_or_generate_objective_scores(500)
+        repeated = RepeatedSimulations(song_df, 200, listen_limit=50, ballot_limit=20,
+                                       num_winners=5, num_workers=num_workers, seed=7)
+        repeated.simulate(num_repetitions=3)
+        repeated.simulate(num_repetitions=2)
+        return repeated
+
+
+    def test_results_do_not_depend_on_num_workers(self):
+        one = self.repeat(1)
+        two = self.repeat(2)
+        assert one.num_contests == two.num_contests == 5
+        assert np.array_equal(one.sum_of_sums, two.sum_of_sums)
+        assert np.array_equal(one.sum_of_rankings, two.sum_of_rankings)
+        assert one.num_condorcet_fair_winners == two.num_condorcet_fair_winners
+        assert one.current_method_winners == two.current_method_winners
+        for contest in range(5):
+            assert list(one.condorcet_winners[contest]) == list(two.condorcet_winners[contest])
+
+
+    def test_contests_are_independent(self):
+        repeated = self.repeat(1)
+        assert repeated.current_method_winners[0] != repeated.current_method_winners[1]
+
+
 if __name__ == '__main__':
     unittest.main()
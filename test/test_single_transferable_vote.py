@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from src import RankedBallots, SingleTransferableVote
+
+
+def construct_ballots(ballots, num_songs):
+    song_ids = np.concatenate(ballots)
+    offsets = np.concatenate([[0], np.cumsum([len(b) for b in ballots])])
+    return RankedBallots(song_ids, offsets, num_songs=num_songs)
+
+
+class TestSingleTransferableVote(unittest.TestCase):
+    def test_surplus_transfer(self):
+        # 11 voters, 2 seats, so the quota is 4. Song 0 has 2 votes to spare,
+        # which move on to song 1 and put it ahead of song 2.
+        ballots = construct_ballots([[0, 1]]*6 + [[1]]*2 + [[2]]*3, 3)
+        stv = SingleTransferableVote(num_winners=2)
+        winners = stv.tally(ballots)
+        assert stv.quota == 4
+        assert winners == [0, 1]
+        assert stv.winner_vote_totals.tolist() == [6.0, 4.0]
+
+
+    def test_elimination(self):
+        # Nobody reaches the quota of 4 at first. Song 3 is dropped and its
+        # ballots elect song 2.
+        ballots = construct_ballots([[0]]*3 + [[1]]*3 + [[2]]*3 + [[3, 2]]*1, 4)
+        stv = SingleTransferableVote(num_winners=2)
+        winners = stv.tally(ballots)
+        assert winners[0] == 2
+        assert stv.dropped_candidates[0].tolist() == [3]
+
+
+    def test_matches_the_true_top_songs(self):
+        rng = np.random.default_rng(0)
+        quality = np.linspace(1, 0, 50)
+        scores = quality + rng.normal(scale=0.2, size=(400, 50))
+        songs = np.argsort(-scores, axis=1)[:, :10]
+        ballots = RankedBallots(songs.ravel(), np.arange(401)*10, 50)
+        winners = SingleTransferableVote(num_winners=5).tally(ballots)
+        assert sorted(winners) == [0, 1, 2, 3, 4]
+
+
+if __name__ == '__main__':
+    unittest.main()
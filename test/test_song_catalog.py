@@ -0,0 +1,91 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src import SongCatalog, load_or_generate_objective_scores
+from src.song_catalog import change_values
+
+
+def change_values_one_at_a_time(ids, fictional_names):
+    """How change_values used to name songs, one row at a time"""
+    ids = list(ids)
+    ii = 0
+    for song_name in fictional_names["Song Name by Artist"].values:
+        if song_name not in ids:
+            if ii < len(ids):
+                ids[ii] = song_name
+                ii += 1
+    return ids
+
+
+class TestSongCatalog(unittest.TestCase):
+    def setUp(self):
+        self.song_df = load_or_generate_objective_scores(500)
+
+
+    def test_ranks_match_sorting(self):
+        catalog = SongCatalog.of(self.song_df)
+        assert SongCatalog.of(self.song_df) is catalog
+
+        by_rating = self.song_df.sort_values("Objective Ratings", ascending=False)
+        assert catalog.by_rating().index.equals(by_rating.index)
+        assert catalog.fair_winners(10) == by_rating.head(10).index.tolist()
+        assert catalog.ranks[by_rating.index].tolist() == list(range(1, 501))
+        percentile_ranks = self.song_df["Objective Ratings"].rank(pct=True)
+        ii_song = catalog.position_at_percentile(88)
+        assert percentile_ranks.iloc[ii_song] == 0.88
+
+
+    def test_changed_frames_get_new_catalogs(self):
+        song_df = self.song_df.head(20).copy()
+        catalog = SongCatalog.of(song_df)
+        assert SongCatalog.of(catalog.song_df) is catalog
+
+        worst = song_df["Objective Ratings"].idxmin()
+        song_df.loc[worst, "Objective Ratings"] = 1000
+        # The catalog kept its own copy, and the changed frame gets a new one
+        assert catalog.ranks[worst] == 20
+        changed = SongCatalog.of(song_df)
+        assert changed is not catalog
+        assert changed.fair_winners(1) == [worst]
+
+
+    def test_names_match_one_at_a_time(self):
+        rng = np.random.default_rng(0)
+        names = [f'"Song {ii}" by Band {ii}' for ii in range(40)]
+        for num_songs in [5, 30, 60]:
+            # Songs that already have some of the names, and names repeated
+            ids = [names[ii] if ii in rng.choice(40, 10) else ii for ii in range(num_songs)]
+            fictional_names = pd.DataFrame({"Song Name by Artist": rng.choice(names, 50)})
+            expected = change_values_one_at_a_time(ids, fictional_names)
+            assert list(change_values(ids, fictional_names)) == expected
+
+
+    def test_saved_catalogs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            names_dir = Path(directory) / "song_names"
+            names_dir.mkdir()
+            names = pd.DataFrame({"Song Name by Artist": [f'"Song {ii}" by Band {ii}' for ii in range(15)]})
+            names.head(5).to_csv(names_dir / "Top Scoring Songs.csv", index=False)
+            names.tail(10).to_csv(names_dir / "All Song Names.csv", index=False)
+
+            catalog = SongCatalog.load_or_generate(20, seed=3, directory=directory)
+            # The first ten songs get the other names, and songs left with
+            # their numbers are saved as text
+            ids = catalog.song_df["ID"]
+            assert ids.head(10).tolist() == names["Song Name by Artist"].tail(10).tolist()
+            assert all(isinstance(song_id, str) for song_id in ids)
+            assert ids.str.isdigit().sum() == 10 - catalog.ranks.tail(10).le(5).sum()
+
+            again = SongCatalog.load_or_generate(20, seed=3, directory=directory)
+            assert again.song_df.equals(catalog.song_df)
+            other = SongCatalog.load_or_generate(20, seed=4, directory=directory)
+            assert not np.array_equal(other.song_df["Objective Ratings"], catalog.song_df["Objective Ratings"])
+            assert len(list(Path(directory).glob("song_catalog_*.parquet"))) == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
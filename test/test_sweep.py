@@ -0,0 +1,183 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from multiprocessing import Process
+from pathlib import Path
+
+import numpy as np
+
+from src import Sweep, load_or_generate_objective_scores
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.song_df = load_or_generate_objective_scores(500).head(100)
+        self.directory = tempfile.TemporaryDirectory()
+        self.grid = {"ballot_limit": [10, 30, 40], "listen_limit": [20, 30]}
+
+
+    def make_sweep(self, directory=None, **kwargs):
+        if directory is None:
+            directory = self.directory.name
+        settings = dict(num_contests=4, seed=3, num_voters=50, num_winners=5, checkpoint_every=3)
+        settings.update(kwargs)
+        return Sweep.create(self.song_df, self.grid, directory, **settings)
+
+
+    def assert_same_results(self, results, expected):
+        assert results.keys() == expected.keys()
+        for cell, repeated in results.items():
+            assert repeated.num_contests == expected[cell].num_contests
+            assert np.array_equal(repeated.sum_of_sums, expected[cell].sum_of_sums)
+            assert repeated.num_condorcet_fair_winners == expected[cell].num_condorcet_fair_winners
+
+
+    def test_degenerate_cells_are_run_once(self):
+        sweep = self.make_sweep()
+        # A ballot limit of 30 or 40 is no limit for 20 or 30 songs
+        assert len(sweep.pending) == 4
+        assert len(sweep.tasks) == 8
+        sweep.run()
+        assert sweep.pending == []
+        assert len(list(Path(self.directory.name, "dataset").rglob("settings.json"))) == 4
+        results = sweep.results()
+        assert len(results) == 6
+        assert results[(30, 20)].num_contests == 4
+        assert results[(30, 20)].num_condorcet_fair_winners == results[(40, 20)].num_condorcet_fair_winners
+
+
+    def test_resumes_where_it_left_off(self):
+        sweep = self.make_sweep()
+        sweep.run()
+        finished = sweep.results()
+
+        # Lose one of a cell's chunks
+        lost = {"ballot_limit": 10, "listen_limit": 20}
+        os.remove(sweep.shard_path(lost, 3, 4))
+        kept = sweep.shard_path({"ballot_limit": 30, "listen_limit": 30}, 0, 3)
+        kept_time = os.path.getmtime(kept)
+
+        assert sweep.tasks == [(lost, 3, 4)]
+        sweep.run()
+        assert os.path.getmtime(kept) == kept_time
+        self.assert_same_results(sweep.results(), finished)
+
+
+    def test_several_workers_share_the_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            alone = self.make_sweep(directory)
+            alone.run()
+            expected = alone.results()
+
+        sweep = self.make_sweep(checkpoint_every=1)
+        saved = [os.path.getmtime(Path(self.directory.name, name)) for name in ["sweep.json", "songs.parquet"]]
+        opened = Sweep.open(self.directory.name)
+        workers = [Process(target=opened.work, args=(f"worker-{ii}",)) for ii in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert all(worker.exitcode == 0 for worker in workers)
+        assert os.listdir(os.path.join(self.directory.name, "leases")) == []
+        # Opening the sweep only reads it
+        assert [os.path.getmtime(Path(self.directory.name, name))
+                for name in ["sweep.json", "songs.parquet"]] == saved
+        assert sweep.merge() == []
+        self.assert_same_results(sweep.results(), expected)
+
+
+    def test_stale_leases_are_taken_over(self):
+        sweep = self.make_sweep(lease_timeout=0.5)
+        cell, start, stop = sweep.tasks[0]
+        with open(sweep.lease_path(cell, start, stop), "w") as lease_file:
+            lease_file.write("crashed-worker 0\n")
+
+        # The lease is fresh, so the task waits until it goes stale
+        assert not sweep.claim((cell, start, stop), "worker")
+        assert sweep.work("worker", poll_interval=0.1) == 8
+        assert sweep.shard_path(cell, start, stop).exists()
+        assert os.listdir(os.path.join(self.directory.name, "leases")) == []
+
+
+    def test_stale_lease_is_taken_over_once(self):
+        sweep = self.make_sweep(lease_timeout=60)
+        task = sweep.tasks[0]
+        lease = sweep.lease_path(*task)
+
+        def make_stale_lease():
+            with open(lease, "w") as lease_file:
+                lease_file.write("crashed-worker 0\n")
+            os.utime(lease, (time.time() - 120, time.time() - 120))
+
+        # Worker b saw the stale lease, but worker a took it over first
+        make_stale_lease()
+        seen = sweep.lease_state(lease)
+        assert sweep.claim(task, "a")
+        assert not sweep.take_over(lease, seen, "b")
+        assert sweep.lease_state(lease)[0].split()[0] == "a"
+
+        # Workers all trying at once
+        for _ in range(10):
+            make_stale_lease()
+            start = threading.Barrier(6)
+            claimed = []
+
+            def claim(worker):
+                start.wait()
+                if sweep.claim(task, worker):
+                    claimed.append(worker)
+
+            threads = [threading.Thread(target=claim, args=(f"worker-{ii}",)) for ii in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert len(claimed) == 1
+            assert sweep.lease_state(lease)[0].split()[0] == claimed[0]
+            os.remove(lease)
+        assert os.listdir(os.path.join(self.directory.name, "leases")) == []
+
+
+    def test_slow_worker_finds_its_task_saved(self):
+        sweep = self.make_sweep()
+        task = sweep.tasks[0]
+        sweep.run()
+        finished = sweep.results()
+        saved_time = os.path.getmtime(sweep.shard_path(*task))
+
+        # The worker whose task was taken over finishes it after all
+        sweep.run_task(*task, worker="slow")
+        assert os.path.getmtime(sweep.shard_path(*task)) == saved_time
+        self.assert_same_results(sweep.results(), finished)
+
+
+    def test_queries_read_the_matching_cells(self):
+        sweep = self.make_sweep()
+        sweep.run()
+        dataset = sweep.dataset
+        assert dataset.index.shape[0] == 6
+        assert dataset.cells(listen_limit=20, ballot_limit=[30, 40])["partition"].nunique() == 1
+
+        contests = dataset.query(columns=["num_condorcet_fair_winners"], ballot_limit=40)
+        assert list(contests.columns) == ["ballot_limit", "num_voters", "listen_limit",
+                                          "num_winners", "contest", "num_condorcet_fair_winners"]
+        assert contests.shape[0] == 8
+        assert set(contests["ballot_limit"]) == {40}
+
+        expected = sweep.results()[(40, 30)]
+        fair = contests[contests["listen_limit"] == 30]["num_condorcet_fair_winners"]
+        assert fair.tolist() == expected.num_condorcet_fair_winners
+        means = dataset.cells(ballot_limit=40, listen_limit=30)["mean_num_condorcet_fair_winners"]
+        assert means[0] == np.mean(expected.num_condorcet_fair_winners)
+        loaded = dataset.load(ballot_limit=40, listen_limit=30)
+        assert np.array_equal(loaded.sum_of_sums, expected.sum_of_sums)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()